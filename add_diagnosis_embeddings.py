@@ -0,0 +1,28 @@
+"""
+Migration: Add embedding columns to diagnosis_history table
+"""
+from sqlalchemy import text
+
+from src.database import engine
+
+try:
+    # One transaction: the columns and their index are added together or not at all
+    with engine.begin() as conn:
+        print("Adding embedding columns to diagnosis_history table...")
+        conn.execute(text("""
+            ALTER TABLE diagnosis_history
+            ADD COLUMN IF NOT EXISTS embedding BYTEA,
+            ADD COLUMN IF NOT EXISTS embedding_scale DOUBLE PRECISION,
+            ADD COLUMN IF NOT EXISTS embedding_model VARCHAR;
+        """))
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_diagnosis_history_embedding_model
+            ON diagnosis_history (embedding_model);
+        """))
+    print("✓ Successfully added embedding columns")
+
+except Exception as e:
+    print(f"✗ Error: {e}")
+    raise
+
+print("\n✓ Migration completed successfully!")
@@ -1,4 +1,5 @@
 from pathlib import Path
+import os
 import torch
 
 
@@ -23,7 +24,7 @@ class Config:
     
     REMEDIES_PATH = PROJECT_ROOT / "remedies.json"
     
-    MODEL_NAME = "resnet50"
+    MODEL_NAME = "resnet50"  # Any backbone id registered in src/core/backbones.py
     USE_PRETRAINED = True
     FREEZE_BACKBONE = False
     
@@ -52,6 +53,21 @@ class Config:
     USE_MIXUP = True
     MIXUP_ALPHA = 0.2  # Controls mixing strength
     
+    # Knowledge distillation of a small CPU student from the trained ResNet50
+    STUDENT_MODEL_NAME = "mobilenet_v3_large"  # or "mobilenet_v3_small", "efficientnet_b0"
+    STUDENT_MODEL_PATH = MODELS_DIR / "plant_classifier_student.pth"
+    DISTILL_ALPHA = 0.7  # Weight of the soft-target loss
+    DISTILL_TEMPERATURE = 4.0
+    
+    # Structured channel pruning of the ResNet backbone (src/prune.py): one
+    # dense, narrower checkpoint per sparsity level, briefly fine-tuned
+    PRUNE_SPARSITY_LEVELS = [float(s) for s in os.getenv("PRUNE_SPARSITY_LEVELS", "0.3,0.5,0.7").split(",")]
+    PRUNE_FINETUNE_EPOCHS = 3
+    PRUNE_FINETUNE_LR = 1e-4
+    PRUNE_DISTILL = True  # Fine-tune against the unpruned model's soft targets
+    PRUNED_MODEL_PATTERN = "plant_classifier_pruned_{level:02d}.pth"
+    PRUNING_REPORT_PATH = LOGS_DIR / "pruning_report.json"
+    
     IMAGE_SIZE = (224, 224)
     NORMALIZE_MEAN = [0.485, 0.456, 0.406]
     NORMALIZE_STD = [0.229, 0.224, 0.225]
@@ -95,6 +111,122 @@ class Config:
     CONFIDENCE_THRESHOLD = 0.5
     TOP_K_PREDICTIONS = 3
     
+    # Inference backend: "torch" (eager PyTorch) or "onnx" (ONNX Runtime, CPU)
+    INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+    ONNX_MODEL_PATH = MODELS_DIR / "plant_classifier_final.onnx"
+    
+    # Post-training static quantization: "fp32" or "int8" (torch backend, CPU only)
+    INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32")
+    INT8_MODEL_PATH = MODELS_DIR / "plant_classifier_final_int8.pt"
+    INT8_REPORT_PATH = LOGS_DIR / "int8_accuracy_report.json"
+    QUANT_CALIBRATION_IMAGES = 512
+    
+    # Frozen TorchScript graph (BatchNorm folded, channels_last), cached next to the .pth
+    USE_FROZEN_GRAPH = os.getenv("USE_FROZEN_GRAPH", "1") == "1"
+    
+    # Multi-worker hosts: publish weights to shared memory once and mmap them in
+    # every worker (takes precedence over the TorchScript graph, which cannot share)
+    SHARE_MODEL_WEIGHTS = os.getenv("SHARE_MODEL_WEIGHTS", "0") == "1"
+    SHARED_WEIGHTS_DIR = os.getenv("SHARED_WEIGHTS_DIR") or None
+    
+    # Confidence-gated cascade: the distilled student answers when its top-1
+    # confidence reaches the threshold, everything else goes to the main model
+    USE_CASCADE = os.getenv("USE_CASCADE", "0") == "1"
+    CASCADE_THRESHOLD = float(os.getenv("CASCADE_THRESHOLD", "0.9"))
+    
+    # Similar past cases: penultimate features from the same forward pass,
+    # stored int8 with each saved diagnosis and searched with an IVF-PQ index
+    RETURN_EMBEDDINGS = os.getenv("RETURN_EMBEDDINGS", "0") == "1"
+    EMBEDDING_INDEX_PATH = MODELS_DIR / "similar_cases_index.npz"
+    EMBEDDING_INDEX_LISTS = int(os.getenv("EMBEDDING_INDEX_LISTS", "1024"))
+    EMBEDDING_INDEX_SUBVECTORS = 64
+    EMBEDDING_INDEX_NPROBE = int(os.getenv("EMBEDDING_INDEX_NPROBE", "16"))
+    PENDING_EMBEDDINGS_MAX = 1024
+    
+    # Grad-CAM heatmaps of the top-1 class (/predict?explain=true), computed in
+    # the same forward pass from the last conv stage (torch backend, fp32)
+    RETURN_HEATMAPS = os.getenv("RETURN_HEATMAPS", "0") == "1"
+    
+    # Plant gate: "heuristic" (colour and texture checks before the forward
+    # pass) or "features" (Mahalanobis distance of the penultimate features
+    # to the training classes, fitted into the checkpoint by src/fit_ood.py)
+    PLANT_GATE = os.getenv("PLANT_GATE", "heuristic")
+    OOD_TPR = 0.95  # Share of held-out plant images the threshold accepts
+    OOD_SHRINKAGE = 0.1
+    OOD_FIT_MAX_IMAGES = 20000  # Per split; evenly spaced subset beyond this
+    
+    # Offline bulk scoring to Parquet (src/score.py)
+    BULK_SCORING_BATCH_SIZE = 64
+    BULK_SCORING_WORKERS = 4
+    BULK_SCORING_SHARD_SIZE = 8192
+    BULK_SCORING_ROW_GROUP_SIZE = 2048
+    
+    # Tiling mode for field photos with many leaves (/predict/tiled): decode at
+    # TILING_DECODE_SIZE, classify at most TILING_MAX_TILES tiles in one batch
+    TILING_DECODE_SIZE = 1536
+    TILING_TILE_SIZE = 448
+    TILING_OVERLAP = 0.25
+    TILING_MAX_TILES = int(os.getenv("TILING_MAX_TILES", "16"))
+    
+    # Video and photo-burst uploads (/predict/video): frames are examined at
+    # VIDEO_SAMPLE_FPS and at most VIDEO_MAX_KEYFRAMES sharp, distinct ones
+    # are classified, so memory does not grow with the clip's length
+    VIDEO_MAX_UPLOAD_SIZE = 200 * 1024 * 1024
+    VIDEO_MAX_DURATION_SECONDS = 300
+    VIDEO_MAX_BURST_IMAGES = 60
+    VIDEO_SAMPLE_FPS = 4.0
+    VIDEO_MAX_KEYFRAMES = int(os.getenv("VIDEO_MAX_KEYFRAMES", "16"))
+    VIDEO_BATCH_SIZE = 8
+    
+    # Model registry (/admin/models): the promoted version is recorded here so
+    # every worker and the next start serve it; workers poll for changes
+    MODEL_REGISTRY_PATH = MODELS_DIR / "active_model.json"
+    MODEL_REGISTRY_POLL_SECONDS = 5
+    SHADOW_MAX_PENDING = 2
+    
+    # Server-side micro-batching of concurrent /predict requests
+    MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", "8"))
+    MICRO_BATCH_MAX_WAIT_MS = float(os.getenv("MICRO_BATCH_MAX_WAIT_MS", "10"))
+    MICRO_BATCH_MAX_PENDING = 64
+    
+    # Dedicated inference threads with a bounded queue (503 + Retry-After when full)
+    INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+    INFERENCE_MAX_QUEUE = int(os.getenv("INFERENCE_MAX_QUEUE", "16"))
+    INFERENCE_RETRY_AFTER_SECONDS = 1
+    
+    # Priority classes on those threads: interactive /predict calls first, then
+    # bulk work (/predict/batch, /predict/video), then shadow evaluation. A
+    # share caps the workers a class may occupy at once; queued work that would
+    # miss its deadline is dropped with a 503 instead of answered late
+    INFERENCE_INTERACTIVE_DEADLINE_MS = float(os.getenv("INFERENCE_INTERACTIVE_DEADLINE_MS", "2000"))
+    INFERENCE_BULK_SHARE = float(os.getenv("INFERENCE_BULK_SHARE", "0.5"))
+    INFERENCE_BULK_MAX_QUEUE = int(os.getenv("INFERENCE_BULK_MAX_QUEUE", "32"))
+    INFERENCE_BULK_DEADLINE_MS = float(os.getenv("INFERENCE_BULK_DEADLINE_MS", "30000"))
+    # Bulk uploads are submitted in chunks this size, so an interactive request
+    # waits for at most one chunk, not the whole upload
+    INFERENCE_BULK_CHUNK_SIZE = int(os.getenv("INFERENCE_BULK_CHUNK_SIZE", "4"))
+    INFERENCE_SHADOW_SHARE = 0.25
+    INFERENCE_SHADOW_DEADLINE_MS = 10000
+    
+    # Content-addressed result cache (0 disables it)
+    PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "2048"))
+    PREDICTION_CACHE_TTL_SECONDS = 3600
+    
+    # Per-host tuning measured by `python src/autotune.py`: "latency" (best p99),
+    # "throughput" (best img/s) or "none". It overrides the backend, precision,
+    # thread and micro-batch settings above, and src/serve.py takes the uvicorn
+    # worker count from it. Ignored if it was measured on a different host.
+    PERF_PROFILE = os.getenv("PERF_PROFILE", "latency")
+    PERF_PROFILE_PATH = Path(os.getenv("PERF_PROFILE_PATH", str(MODELS_DIR / "perf_profile.json")))
+    AUTOTUNE_BATCH_SIZES = (1, 4, 8, 16)
+    AUTOTUNE_MAX_WORKERS = 4
+    AUTOTUNE_SECONDS_PER_TRIAL = 3.0
+    
+    # Startup warmup: forward passes at the batch sizes traffic will use
+    WARMUP_BATCH_SIZES = (1, MICRO_BATCH_MAX_SIZE)
+    WARMUP_ITERATIONS = 2
+    MODEL_NOT_READY_RETRY_AFTER_SECONDS = 5
+    
     @classmethod
     def validate_paths(cls):
         required_dirs = [
@@ -158,7 +290,6 @@ class ProductionConfig(Config):
     SAVE_EVERY_N_EPOCHS = 10
 
 
-import os
 ENV = os.getenv("ENV", "development")
 
 if ENV == "production":
@@ -0,0 +1,51 @@
+from pathlib import Path
+import argparse
+import sys
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import active_config as cfg
+from src.core.autotune import autotune
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure inference settings on this host and write the best-throughput "
+                    "and best-p99 profiles for the API to apply at startup."
+    )
+    parser.add_argument("--model", type=Path, default=cfg.MODEL_SAVE_PATH,
+                        help="Checkpoint to tune for (default: the configured model)")
+    parser.add_argument("-o", "--output", type=Path, default=cfg.PERF_PROFILE_PATH)
+    parser.add_argument("--batch-sizes", type=lambda s: tuple(int(v) for v in s.split(",")),
+                        default=cfg.AUTOTUNE_BATCH_SIZES, help="Comma-separated, e.g. 1,4,8,16")
+    parser.add_argument("--max-workers", type=int, default=cfg.AUTOTUNE_MAX_WORKERS,
+                        help="Largest number of API worker processes to try")
+    parser.add_argument("--duration", type=float, default=cfg.AUTOTUNE_SECONDS_PER_TRIAL,
+                        help="Seconds of measurement per setting")
+    args = parser.parse_args()
+
+    profile = autotune(
+        model_path=args.model,
+        class_mapping_path=cfg.CLASS_MAPPING_PATH,
+        output_path=args.output,
+        batch_sizes=args.batch_sizes,
+        max_workers=args.max_workers,
+        duration=args.duration,
+        onnx_path=cfg.ONNX_MODEL_PATH if args.model == cfg.MODEL_SAVE_PATH else None,
+        int8_path=cfg.INT8_MODEL_PATH if args.model == cfg.MODEL_SAVE_PATH else None,
+        frozen_graph=cfg.USE_FROZEN_GRAPH,
+    )
+
+    print("=" * 70)
+    for name, best in profile["profiles"].items():
+        print(f"Best {name}: " + ", ".join(f"{k}={v}" for k, v in best["settings"].items()))
+        print(f"    {best['images_per_sec']:.1f} img/s, p50 {best['p50_ms']:.1f} ms, p99 {best['p99_ms']:.1f} ms")
+    print(f"Profile written to: {args.output}")
+    print("Select one with PERF_PROFILE=latency|throughput|none; start the API with `python src/serve.py`.")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
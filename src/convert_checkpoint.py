@@ -0,0 +1,31 @@
+from pathlib import Path
+import argparse
+import sys
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import active_config as cfg
+from src.core.model import convert_checkpoint
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Convert a .pth checkpoint to the memory-mapped .safetensors format."
+    )
+    parser.add_argument("checkpoint", nargs="?", type=Path, default=cfg.MODEL_SAVE_PATH,
+                        help="Checkpoint to convert (default: the configured model)")
+    parser.add_argument("-o", "--output", type=Path, default=None,
+                        help="Output path (default: next to the input with a .safetensors suffix)")
+    args = parser.parse_args()
+
+    output = convert_checkpoint(args.checkpoint, args.output)
+
+    source_mb = args.checkpoint.stat().st_size / (1024 * 1024)
+    output_mb = output.stat().st_size / (1024 * 1024)
+    print(f"{args.checkpoint.name}: {source_mb:.1f} MB -> {output.name}: {output_mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,55 @@ Core module for Mission Vanaspati
 
 This module contains the fundamental components for plant disease classification:
 - model: Neural network architecture (ResNet50-based)
+- backbones: Registry of supported backbones and CPU latency profiling
 - dataset: Data loading and preprocessing
 - trainer: Training logic and optimization
 - predictor: Inference and prediction utilities
+- registry: Hot-swappable serving model with candidate shadow evaluation
+- onnx_backend: ONNX export and ONNX Runtime inference
+- quantization: Post-training INT8 static quantization
+- pruning: Structured channel pruning of ResNet blocks into smaller dense models
+- inference_graph: BatchNorm-folded, frozen TorchScript inference graph
+- shared_weights: Model weights shared across worker processes via mmap
+- tensor_checkpoint: Tensor-only, memory-mappable checkpoint format (safetensors layout)
+- tiling: Overlapping green-region tiles for multi-leaf field photos
+- video: Sharp, distinct keyframes from videos and photo bursts
+- ood: Feature-space (Mahalanobis) plant gate fitted into the checkpoint
+- embeddings: Embedding quantization and IVF-PQ similar-case index
+- autotune: Per-host sweep of threads, workers, batch size and backend
+- bulk_scoring: Offline scoring of image trees and archives into Parquet (see src/score.py)
 """
 
-from .model import DiseaseClassifier, create_model, save_model, load_model
+from .model import DiseaseClassifier, create_model, save_model, load_model, convert_checkpoint
 from .predictor import PlantDiseasePredictor
+from .backbones import register_backbone, list_backbones, profile_latency
+from .onnx_backend import export_onnx, OnnxClassifier, load_onnx_model
+from .quantization import quantize_model, save_quantized_model, load_quantized_model
+from .inference_graph import build_inference_graph, load_inference_graph
+from .shared_weights import publish_shared_weights, load_shared_model
+from .embeddings import IVFPQIndex, quantize_embedding, dequantize_embedding
 
 __all__ = [
     "DiseaseClassifier",
     "create_model",
     "save_model",
     "load_model",
+    "convert_checkpoint",
     "PlantDiseasePredictor",
+    "register_backbone",
+    "list_backbones",
+    "profile_latency",
+    "export_onnx",
+    "OnnxClassifier",
+    "load_onnx_model",
+    "quantize_model",
+    "save_quantized_model",
+    "load_quantized_model",
+    "build_inference_graph",
+    "load_inference_graph",
+    "publish_shared_weights",
+    "load_shared_model",
+    "IVFPQIndex",
+    "quantize_embedding",
+    "dequantize_embedding",
 ]
@@ -0,0 +1,246 @@
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+
+from src.core.cache import checkpoint_identity
+
+
+# Bump when the profile layout changes; older files are then ignored.
+PERF_PROFILE_VERSION = 1
+PROFILE_NAMES = ("throughput", "latency")
+
+
+def host_fingerprint() -> Dict[str, Any]:
+    """What a profile was measured on; it is only applied on a matching host."""
+    cpu_model = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu_model = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return {
+        "cpu_model": cpu_model,
+        "cpu_count": os.cpu_count(),
+        "torch_version": str(torch.__version__),
+    }
+
+
+def apply_thread_settings(num_threads: Optional[int] = None, num_interop_threads: Optional[int] = None):
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if num_interop_threads and torch.get_num_interop_threads() != num_interop_threads:
+        # Only settable before the first inter-op parallel work in the process.
+        try:
+            torch.set_num_interop_threads(num_interop_threads)
+        except RuntimeError as e:
+            print(f"Warning: could not set inter-op threads to {num_interop_threads} ({e})")
+
+
+def load_perf_profile(path: Union[str, Path], name: str = "latency") -> Optional[Dict[str, Any]]:
+    """
+    Settings of the named profile ("throughput" or "latency") from an
+    autotune file, or None if there is no file or it was measured on a
+    different host or torch build.
+    """
+    path = Path(path)
+    if name not in PROFILE_NAMES or not path.exists():
+        return None
+
+    with open(path) as f:
+        data = json.load(f)
+
+    if data.get("version") != PERF_PROFILE_VERSION:
+        print(f"Warning: ignoring performance profile {path} (format version {data.get('version')})")
+        return None
+    if data.get("host") != host_fingerprint():
+        print(f"Warning: ignoring performance profile {path}; it was measured on a different host. "
+              "Re-run `python src/autotune.py` here.")
+        return None
+
+    settings = data["profiles"][name]["settings"]
+    print(f"Applying {name} performance profile: " + ", ".join(f"{k}={v}" for k, v in settings.items()))
+    return settings
+
+
+def candidate_backends(int8_path: Optional[Union[str, Path]] = None) -> List[Tuple[str, str]]:
+    backends = [("torch", "fp32")]
+    if int8_path is not None and Path(int8_path).exists():
+        backends.append(("torch", "int8"))
+    try:
+        import onnxruntime  # noqa: F401
+        backends.append(("onnx", "fp32"))
+    except ImportError:
+        pass
+    return backends
+
+
+def candidate_layouts(cpu_count: int, max_workers: int) -> List[Tuple[int, int, int]]:
+    """(worker processes, intra-op threads per worker, inter-op threads)."""
+    layouts = []
+    workers = 1
+    while workers <= min(max_workers, cpu_count):
+        per_worker = max(1, cpu_count // workers)
+        thread_options = sorted({per_worker, max(1, per_worker // 2)})
+        for threads, interop in itertools.product(thread_options, (1, 2)):
+            layouts.append((workers, threads, interop))
+        workers *= 2
+    return layouts
+
+
+def _trial_worker(settings, predictor_kwargs, batch_sizes, duration, barrier, results):
+    # Fresh process per trial: thread pools can only be sized once per process.
+    apply_thread_settings(settings["num_threads"], settings["num_interop_threads"])
+    from src.core.predictor import PlantDiseasePredictor
+
+    predictor = PlantDiseasePredictor(
+        backend=settings["backend"],
+        precision=settings["precision"],
+        num_threads=settings["num_threads"],
+        cache_size=0,
+        **predictor_kwargs,
+    )
+    height, width = predictor.preprocess.image_size
+
+    measurements = {}
+    for batch_size in batch_sizes:
+        batch = torch.randn(batch_size, 3, height, width).contiguous(memory_format=predictor.preprocess.memory_format)
+        is_plant = np.ones(batch_size, dtype=bool)
+        for _ in range(2):
+            predictor.predict_preprocessed(batch, is_plant)
+
+        # Every worker measures the same window, so the host is fully loaded
+        barrier.wait()
+        latencies = []
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            t0 = time.perf_counter()
+            predictor.predict_preprocessed(batch, is_plant)
+            latencies.append(1000.0 * (time.perf_counter() - t0))
+        measurements[batch_size] = (time.perf_counter() - start, latencies)
+
+    results.put(measurements)
+
+
+def run_trial(
+    settings: Dict[str, Any],
+    predictor_kwargs: Dict[str, Any],
+    batch_sizes: Sequence[int],
+    duration: float,
+) -> List[Dict[str, Any]]:
+    """Run one process layout at every batch size; one result row per batch size."""
+    ctx = mp.get_context("spawn")
+    workers = settings["workers"]
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_trial_worker, args=(settings, predictor_kwargs, batch_sizes, duration, barrier, results))
+        for _ in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    measurements = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+        if proc.exitcode != 0:
+            raise RuntimeError(f"Autotune worker failed for {settings}")
+
+    rows = []
+    for batch_size in batch_sizes:
+        elapsed = max(m[batch_size][0] for m in measurements)
+        latencies = np.concatenate([m[batch_size][1] for m in measurements])
+        rows.append({
+            "settings": {**settings, "batch_size": batch_size},
+            "images_per_sec": round(batch_size * latencies.size / elapsed, 2),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "batches": int(latencies.size),
+        })
+    return rows
+
+
+def autotune(
+    model_path: Union[str, Path],
+    class_mapping_path: Union[str, Path],
+    output_path: Union[str, Path],
+    batch_sizes: Sequence[int] = (1, 4, 8, 16),
+    max_workers: int = 4,
+    duration: float = 3.0,
+    onnx_path: Optional[Union[str, Path]] = None,
+    int8_path: Optional[Union[str, Path]] = None,
+    frozen_graph: bool = True,
+) -> Dict[str, Any]:
+    """
+    Sweep backend/precision, worker processes, intra-op and inter-op threads
+    and batch size on this host, and write the best-throughput and best-p99
+    settings to output_path.
+    """
+    model_path = Path(model_path)
+    cpu_count = os.cpu_count() or 1
+    predictor_kwargs = {
+        "model_path": str(model_path),
+        "class_mapping_path": str(class_mapping_path),
+        "device": "cpu",
+        "onnx_path": str(onnx_path) if onnx_path else None,
+        "int8_path": str(int8_path) if int8_path else None,
+        "frozen_graph": frozen_graph,
+    }
+
+    backends = candidate_backends(int8_path)
+    layouts = candidate_layouts(cpu_count, max_workers)
+    print(f"Autotuning on {cpu_count} CPUs: {len(backends)} backends x {len(layouts)} process layouts "
+          f"x {len(batch_sizes)} batch sizes, {duration:.0f}s per measurement")
+
+    trials = []
+    for (backend, precision), (workers, threads, interop) in itertools.product(backends, layouts):
+        settings = {
+            "backend": backend,
+            "precision": precision,
+            "workers": workers,
+            "num_threads": threads,
+            "num_interop_threads": interop,
+        }
+        try:
+            rows = run_trial(settings, predictor_kwargs, batch_sizes, duration)
+        except Exception as e:
+            print(f"Skipping {settings}: {e}")
+            continue
+        for row in rows:
+            s = row["settings"]
+            print(f"{s['backend']:<6}{s['precision']:<6} workers={s['workers']:<2} threads={s['num_threads']:<3} "
+                  f"interop={s['num_interop_threads']} bs={s['batch_size']:<3} "
+                  f"{row['images_per_sec']:>8.1f} img/s  p50 {row['p50_ms']:>8.1f} ms  p99 {row['p99_ms']:>8.1f} ms")
+        trials.extend(rows)
+
+    if not trials:
+        raise RuntimeError("Every autotune trial failed")
+
+    best_throughput = max(trials, key=lambda r: (r["images_per_sec"], -r["p99_ms"]))
+    best_latency = min(trials, key=lambda r: (r["p99_ms"], -r["images_per_sec"]))
+    profile = {
+        "version": PERF_PROFILE_VERSION,
+        "host": host_fingerprint(),
+        "model": checkpoint_identity(model_path),
+        "measured_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "profiles": {
+            "throughput": best_throughput,
+            "latency": best_latency,
+        },
+        "trials": trials,
+    }
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(profile, f, indent=2)
+    return profile
@@ -0,0 +1,159 @@
+import copy
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+import torch.nn as nn
+from torchvision import models
+
+
+# id -> torchvision constructor, ImageNet weights, family, and the dotted path
+# of the ImageNet classifier module our head replaces. The head path is part
+# of the checkpoint key names, so it must not change for a registered id.
+BACKBONES: Dict[str, Dict[str, Any]] = {}
+
+PROFILE_BATCH_SIZES = (1, 8)
+
+
+def register_backbone(
+    name: str,
+    constructor: Callable[..., nn.Module],
+    weights: Any,
+    head: str,
+    family: str,
+):
+    BACKBONES[name] = {
+        "constructor": constructor,
+        "weights": weights,
+        "head": head,
+        "family": family,
+    }
+
+
+def list_backbones(family: Optional[str] = None) -> List[str]:
+    return [name for name, spec in BACKBONES.items() if family is None or spec["family"] == family]
+
+
+def get_backbone_spec(name: str) -> Dict[str, Any]:
+    if name not in BACKBONES:
+        raise ValueError(f"Unsupported backbone: {name}. Expected one of {list_backbones()}.")
+    return BACKBONES[name]
+
+
+def build_backbone(name: str, pretrained: bool = True) -> Tuple[nn.Module, str, int]:
+    """
+    Instantiate a registered backbone.
+    Returns (module, head path, number of features entering the head).
+    """
+    spec = get_backbone_spec(name)
+    module = spec["constructor"](weights=spec["weights"] if pretrained else None)
+
+    imagenet_head = module.get_submodule(spec["head"])
+    if isinstance(imagenet_head, nn.Linear):
+        num_features = imagenet_head.in_features
+    else:
+        num_features = next(m for m in imagenet_head.modules() if isinstance(m, nn.Linear)).in_features
+
+    return module, spec["head"], num_features
+
+
+def replace_head(module: nn.Module, head_path: str, head: nn.Module):
+    parent_path, _, attr = head_path.rpartition(".")
+    parent = module.get_submodule(parent_path) if parent_path else module
+    setattr(parent, attr, head)
+
+
+def profile_latency(
+    model: nn.Module,
+    batch_sizes: Tuple[int, ...] = PROFILE_BATCH_SIZES,
+    image_size: Tuple[int, int] = (224, 224),
+    warmup: int = 1,
+    iterations: int = 5,
+) -> Dict[str, Any]:
+    """
+    Measure CPU forward latency of an eval-mode copy of the model. The
+    result is plain JSON so it can live in a checkpoint's model_config.
+    """
+    from src.utils.benchmark import measure_latency
+
+    model = copy.deepcopy(model).to("cpu").eval()
+    profile = {
+        "device": "cpu",
+        "threads": torch.get_num_threads(),
+        "cpu_count": os.cpu_count(),
+        "torch_version": str(torch.__version__),
+        "measured_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "batch_sizes": {},
+    }
+
+    for batch_size in batch_sizes:
+        batch = torch.randn(batch_size, 3, *image_size)
+
+        def run():
+            with torch.no_grad():
+                model(batch)
+
+        stats = measure_latency(run, warmup=warmup, iterations=iterations, batch_size=batch_size)
+        profile["batch_sizes"][str(batch_size)] = {
+            "mean_ms": round(stats["mean_ms"], 3),
+            "p95_ms": round(stats["p95_ms"], 3),
+            "images_per_sec": round(stats["images_per_sec"], 2),
+        }
+
+    return profile
+
+
+def format_profile(profile: Optional[Dict[str, Any]]) -> str:
+    if not profile:
+        return "no latency profile recorded"
+    parts = [
+        f"bs={bs} {stats['mean_ms']:.1f} ms ({stats['images_per_sec']:.1f} img/s)"
+        for bs, stats in profile["batch_sizes"].items()
+    ]
+    return f"{', '.join(parts)} on {profile['threads']} CPU threads"
+
+
+register_backbone("resnet18", models.resnet18, models.ResNet18_Weights.DEFAULT, "fc", "resnet")
+register_backbone("resnet34", models.resnet34, models.ResNet34_Weights.DEFAULT, "fc", "resnet")
+register_backbone("resnet50", models.resnet50, models.ResNet50_Weights.DEFAULT, "fc", "resnet")
+register_backbone("resnet101", models.resnet101, models.ResNet101_Weights.DEFAULT, "fc", "resnet")
+register_backbone("resnet152", models.resnet152, models.ResNet152_Weights.DEFAULT, "fc", "resnet")
+register_backbone("mobilenet_v2", models.mobilenet_v2, models.MobileNet_V2_Weights.DEFAULT, "classifier", "mobilenet")
+register_backbone("mobilenet_v3_large", models.mobilenet_v3_large, models.MobileNet_V3_Large_Weights.DEFAULT, "classifier", "mobilenet")
+register_backbone("mobilenet_v3_small", models.mobilenet_v3_small, models.MobileNet_V3_Small_Weights.DEFAULT, "classifier", "mobilenet")
+register_backbone("efficientnet_b0", models.efficientnet_b0, models.EfficientNet_B0_Weights.DEFAULT, "classifier", "efficientnet")
+register_backbone("efficientnet_b1", models.efficientnet_b1, models.EfficientNet_B1_Weights.DEFAULT, "classifier", "efficientnet")
+register_backbone("efficientnet_b2", models.efficientnet_b2, models.EfficientNet_B2_Weights.DEFAULT, "classifier", "efficientnet")
+# ConvNeXt's classifier starts with LayerNorm2d + Flatten; only the final Linear is replaced.
+register_backbone("convnext_tiny", models.convnext_tiny, models.ConvNeXt_Tiny_Weights.DEFAULT, "classifier.2", "convnext")
+
+
+if __name__ == "__main__":
+    import sys
+    from pathlib import Path
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    from src.core.model import DiseaseClassifier
+
+    print("Testing Backbone Registry...")
+    print()
+
+    print("Test 1: Measured CPU cost of every registered backbone (38 classes)...")
+    rows = []
+    for name in list_backbones():
+        model = DiseaseClassifier(num_classes=38, pretrained=False, freeze_backbone=False, backbone=name)
+        profile = profile_latency(model)
+        rows.append((name, get_backbone_spec(name)["family"], model.get_total_parameters(), profile))
+
+    print(f"{'Backbone':<22}{'family':<14}{'params (M)':>11}{'bs=1 ms':>10}{'bs=8 img/s':>12}")
+    for name, family, params, profile in sorted(rows, key=lambda r: r[3]["batch_sizes"]["1"]["mean_ms"]):
+        single = profile["batch_sizes"]["1"]["mean_ms"]
+        throughput = profile["batch_sizes"]["8"]["images_per_sec"]
+        print(f"{name:<22}{family:<14}{params / 1e6:>11.1f}{single:>10.1f}{throughput:>12.1f}")
+    print()
+
+    print("All tests passed!")
@@ -0,0 +1,176 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from src.core.executor import InferenceExecutor, QueueFullError
+
+
+class MicroBatcher:
+    """
+    Merge concurrent single-image requests into one predict_batch call.
+
+    A batch is dispatched as soon as it holds max_batch_size images or the
+    oldest queued image has waited max_wait_ms, whichever comes first. When an
+    executor is given, batches run on its worker threads and a new batch is
+    only formed once a worker is free, so requests arriving during a forward
+    pass are folded into the next batch instead of queueing behind it.
+    """
+
+    def __init__(
+        self,
+        predict_batch_fn: Callable[[List[Any]], List[Dict]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        executor: Optional[InferenceExecutor] = None,
+        max_pending: int = 64,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.predict_batch_fn = predict_batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.max_pending = max_pending
+
+        self._pending: Deque[Tuple[Any, asyncio.Future, float]] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self._dispatches = set()
+
+        self._batch_size_counts: Dict[int, int] = {}
+        self._num_batches = 0
+        self._num_images = 0
+        self._total_wait = 0.0
+
+    async def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.executor.max_workers if self.executor else 1)
+            self._task = asyncio.create_task(self._collect_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self._dispatches:
+            await asyncio.gather(*self._dispatches, return_exceptions=True)
+
+        while self._pending:
+            _, future, _ = self._pending.popleft()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, image: Any) -> Dict:
+        if self._task is None:
+            raise RuntimeError("MicroBatcher.start() must be awaited before submitting")
+
+        # Fail fast instead of queueing work that would only add latency.
+        if len(self._pending) >= self.max_pending:
+            retry_after = self.executor.retry_after if self.executor else 1.0
+            raise QueueFullError(retry_after, "Batching queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((image, future, time.perf_counter()))
+        self._wakeup.set()
+        return await future
+
+    async def _collect_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            await self._slots.acquire()
+
+            # Hold the batch open until it is full or the oldest request's
+            # wait budget is spent.
+            deadline = loop.time() + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = []
+            while self._pending and len(batch) < self.max_batch_size:
+                item = self._pending.popleft()
+                # Skip callers that disconnected while queued.
+                if not item[1].done():
+                    batch.append(item)
+
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _run_batch(self, images: List[Any]) -> List[Dict]:
+        if self.executor is None:
+            return self.predict_batch_fn(images)
+        return await self.executor.run(self.predict_batch_fn, images)
+
+    async def _dispatch(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        try:
+            images = [image for image, _, _ in batch]
+            self._record_batch(batch, time.perf_counter())
+
+            try:
+                results = await self._run_batch(images)
+            except QueueFullError as e:
+                results = [e] * len(batch)
+            except Exception as e:
+                if len(batch) == 1:
+                    results = [e]
+                else:
+                    # One unreadable upload must not fail everyone it was
+                    # batched with; rerun individually to isolate it.
+                    results = []
+                    for image in images:
+                        try:
+                            results.append((await self._run_batch([image]))[0])
+                        except Exception as single_error:
+                            results.append(single_error)
+
+            for (_, future, _), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def _record_batch(self, batch: List[Tuple[Any, asyncio.Future, float]], started: float):
+        size = len(batch)
+        self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+        self._num_batches += 1
+        self._num_images += size
+        self._total_wait += sum(started - queued_at for _, _, queued_at in batch)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": self._num_batches,
+            "images": self._num_images,
+            "mean_batch_size": round(self._num_images / self._num_batches, 2) if self._num_batches else 0.0,
+            "mean_batching_wait_ms": round(1000.0 * self._total_wait / self._num_images, 3) if self._num_images else 0.0,
+            "batch_size_histogram": dict(sorted(self._batch_size_counts.items())),
+            "pending": len(self._pending),
+        }
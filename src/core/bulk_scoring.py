@@ -0,0 +1,434 @@
+import json
+import os
+import tarfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset, Subset
+
+from src.core.cache import checkpoint_identity
+from src.core.dataset import PlantDiseaseDataset
+from src.core.plant_gate import check_plant_image
+from src.core.preprocessing import BatchPreprocessor, open_image
+
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+MANIFEST_NAME = "_scoring_manifest.json"
+# Bump when the output schema changes so old runs are not resumed into it.
+SCORING_FORMAT_VERSION = 1
+
+
+class ScoringTransform:
+    """
+    Per-image work done in DataLoader workers: the plant gate and
+    preprocessing to a normalized (3, H, W) tensor. plant_gate=False skips
+    the heuristic gate (the predictor's feature gate runs instead).
+    Returns (tensor or None, is_plant, gate reason).
+    """
+
+    def __init__(self, plant_gate: bool = True):
+        self.plant_gate = plant_gate
+        # Created lazily inside each worker; its thread-local buffers do not pickle.
+        self._preprocess: Optional[BatchPreprocessor] = None
+
+    def __call__(self, image: Image.Image) -> Tuple[Optional[torch.Tensor], bool, str]:
+        if self.plant_gate:
+            is_plant, reason = check_plant_image(image)
+            if not is_plant:
+                return None, False, reason
+        if self._preprocess is None:
+            self._preprocess = BatchPreprocessor()
+        # The preprocessor reuses its buffer, so the row must be copied out.
+        return self._preprocess([image])[0].clone(), True, ""
+
+
+class ImageSourceDataset(Dataset):
+    """
+    Images from a directory tree (recursively), a tar archive or a zip
+    archive, in sorted name order. Items are
+    (tensor or None, is_plant, reason, name, label), label always None.
+
+    Archives are opened lazily per worker process. Members of uncompressed
+    tars are read by byte offset; compressed tars work but every worker has
+    to scan the archive once to find its members.
+    """
+
+    def __init__(self, source: Union[str, Path], transform: Optional[ScoringTransform] = None):
+        self.source = Path(source)
+        self.transform = transform or ScoringTransform()
+        self._handle = None
+        self._handle_pid = None
+        self._tar_offsets = None
+
+        if self.source.is_dir():
+            self.kind = "dir"
+            self.names = sorted(
+                str(path.relative_to(self.source)) for path in self.source.rglob("*")
+                if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+            )
+        elif zipfile.is_zipfile(self.source):
+            self.kind = "zip"
+            with zipfile.ZipFile(self.source) as archive:
+                self.names = sorted(
+                    name for name in archive.namelist()
+                    if not name.endswith("/") and Path(name).suffix.lower() in IMAGE_EXTENSIONS
+                )
+        elif tarfile.is_tarfile(self.source):
+            self.kind = "tar"
+            with tarfile.open(self.source) as archive:
+                members = {
+                    m.name: m for m in archive.getmembers()
+                    if m.isfile() and Path(m.name).suffix.lower() in IMAGE_EXTENSIONS
+                }
+            self.names = sorted(members)
+            if not self._is_compressed_tar():
+                self._tar_offsets = {name: (m.offset_data, m.size) for name, m in members.items()}
+        else:
+            raise ValueError(f"Not a directory, tar or zip archive: {self.source}")
+
+    def _is_compressed_tar(self) -> bool:
+        try:
+            with tarfile.open(self.source, mode="r:"):
+                return False
+        except tarfile.ReadError:
+            return True
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _open(self):
+        # Re-open after fork: file offsets must not be shared between workers.
+        if self._handle is None or self._handle_pid != os.getpid():
+            if self.kind == "zip":
+                self._handle = zipfile.ZipFile(self.source)
+            elif self._tar_offsets is not None:
+                self._handle = open(self.source, "rb")
+            else:
+                self._handle = tarfile.open(self.source)
+            self._handle_pid = os.getpid()
+        return self._handle
+
+    def read_bytes(self, index: int) -> bytes:
+        name = self.names[index]
+        if self.kind == "dir":
+            return (self.source / name).read_bytes()
+        handle = self._open()
+        if self.kind == "zip":
+            return handle.read(name)
+        if self._tar_offsets is not None:
+            offset, size = self._tar_offsets[name]
+            handle.seek(offset)
+            return handle.read(size)
+        return handle.extractfile(name).read()
+
+    def __getitem__(self, index: int):
+        name = self.names[index]
+        try:
+            image = open_image(self.read_bytes(index))
+        except Exception as e:
+            return None, False, f"Unreadable image ({type(e).__name__})", name, None
+        return (*self.transform(image), name, None)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_handle"] = None
+        state["_handle_pid"] = None
+        return state
+
+
+class LabeledImageDataset(Dataset):
+    """
+    A class-folder tree (the training layout) read through
+    PlantDiseaseDataset; the folder name is reported as each image's label.
+    """
+
+    def __init__(self, source: Union[str, Path], transform: Optional[ScoringTransform] = None):
+        self.source = Path(source)
+        self.dataset = PlantDiseaseDataset([self.source], transform=transform or ScoringTransform())
+        self.names = [str(path.relative_to(self.source)) for path in self.dataset.image_paths]
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def __getitem__(self, index: int):
+        (tensor, is_plant, reason), label = self.dataset[index]
+        return tensor, is_plant, reason, self.names[index], self.dataset.get_class_name(label)
+
+
+def collate_scoring_batch(items: List[tuple]) -> Dict[str, object]:
+    tensors = [item[0] for item in items if item[1]]
+    return {
+        "batch": torch.stack(tensors) if tensors else None,
+        "is_plant": np.array([item[1] for item in items], dtype=bool),
+        "gate_reason": [item[2] for item in items],
+        "source": [item[3] for item in items],
+        "label": [item[4] for item in items],
+    }
+
+
+def _worker_init(_):
+    # Workers only decode and resize; one thread each avoids oversubscribing
+    # the cores the model needs.
+    torch.set_num_threads(1)
+
+
+class _ShardWriter:
+    """Buffers rows for one shard and writes them as row groups of row_group_size."""
+
+    def __init__(self, path: Path, schema: pa.Schema, row_group_size: int):
+        self.path = path
+        self.tmp_path = path.with_name(f"{path.name}.tmp")
+        self.row_group_size = row_group_size
+        self.writer = pq.ParquetWriter(self.tmp_path, schema, compression="zstd")
+        self.buffer: List[pa.Table] = []
+        self.buffered = 0
+        self.rows = 0
+
+    def write(self, table: pa.Table):
+        self.buffer.append(table)
+        self.buffered += table.num_rows
+        self.rows += table.num_rows
+        if self.buffered >= self.row_group_size:
+            self._flush(final=False)
+
+    def _flush(self, final: bool):
+        if not self.buffered:
+            return
+        table = pa.concat_tables(self.buffer)
+        # Write whole row groups only; the remainder waits for more rows.
+        full = table.num_rows if final else table.num_rows - table.num_rows % self.row_group_size
+        self.writer.write_table(table.slice(0, full), row_group_size=self.row_group_size)
+        rest = table.slice(full)
+        self.buffer, self.buffered = ([rest], rest.num_rows) if rest.num_rows else ([], 0)
+
+    def close(self):
+        self._flush(final=True)
+        self.writer.close()
+        # Only finished shards get their final name; resume keys off it.
+        self.tmp_path.replace(self.path)
+
+
+def shard_path(output_dir: Path, shard: int) -> Path:
+    return output_dir / f"part-{shard:05d}.parquet"
+
+
+def _results_table(
+    arrays: Dict[str, np.ndarray],
+    collated: Dict[str, object],
+    class_names: np.ndarray,
+    labeled: bool,
+) -> pa.Table:
+    k = arrays["top_k_indices"].shape[1]
+    columns = {
+        "source": pa.array(collated["source"], pa.string()),
+        "is_plant": pa.array(arrays["is_plant"]),
+        "gate_reason": pa.array(arrays["gate_reason"], pa.string()),
+        "class_idx": pa.array(arrays["class_idx"].astype(np.int32)),
+        # class_names ends with None, so rejected rows (index -1) get a null name
+        "class_name": pa.array(class_names[arrays["class_idx"]], pa.string()),
+        "confidence": pa.array(arrays["confidence"]),
+        "top_k_indices": pa.FixedSizeListArray.from_arrays(pa.array(arrays["top_k_indices"].astype(np.int32).ravel()), k),
+        "top_k_probs": pa.FixedSizeListArray.from_arrays(pa.array(arrays["top_k_probs"].ravel()), k),
+    }
+    if labeled:
+        columns["label"] = pa.array(collated["label"], pa.string())
+    if "model_stage" in arrays:
+        columns["model_stage"] = pa.array(arrays["model_stage"])
+    if "ood_score" in arrays:
+        columns["ood_score"] = pa.array(arrays["ood_score"])
+    if "probabilities" in arrays:
+        probabilities = arrays["probabilities"]
+        columns["probabilities"] = pa.FixedSizeListArray.from_arrays(pa.array(probabilities.ravel()), probabilities.shape[1])
+    return pa.table(columns)
+
+
+def score_to_parquet(
+    predictor,
+    source: Union[str, Path],
+    output_dir: Union[str, Path],
+    batch_size: int = 64,
+    num_workers: int = 4,
+    shard_size: int = 8192,
+    row_group_size: int = 2048,
+    labeled: bool = False,
+    return_probabilities: bool = False,
+) -> Dict[str, float]:
+    """
+    Score every image under source into output_dir/part-NNNNN.parquet, one
+    file per shard_size images in name order. A shard file only appears once
+    it is complete, so re-running the same command skips finished shards.
+    Returns throughput figures for this run.
+    """
+    source = Path(source)
+    output_dir = Path(output_dir)
+    transform = ScoringTransform(plant_gate=not predictor.feature_gate)
+    dataset = LabeledImageDataset(source, transform) if labeled else ImageSourceDataset(source, transform)
+    num_images = len(dataset)
+    num_shards = (num_images + shard_size - 1) // shard_size
+
+    manifest = {
+        "format_version": SCORING_FORMAT_VERSION,
+        "source": str(source.resolve()),
+        "num_images": num_images,
+        "shard_size": shard_size,
+        "model": checkpoint_identity(predictor.model_path),
+        "top_k": predictor.top_k,
+        "labeled": labeled,
+        "probabilities": return_probabilities,
+    }
+    if predictor.feature_gate:
+        manifest["plant_gate"] = "features"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_dir / MANIFEST_NAME
+    if manifest_path.exists():
+        previous = json.loads(manifest_path.read_text())
+        if previous != manifest:
+            raise ValueError(
+                f"{output_dir} holds results of a different run (source, model or settings changed). "
+                "Use a new output directory."
+            )
+    else:
+        manifest_path.write_text(json.dumps(manifest, indent=2))
+
+    done = [shard for shard in range(num_shards) if shard_path(output_dir, shard).exists()]
+    todo = [shard for shard in range(num_shards) if shard not in set(done)]
+    if done:
+        print(f"Resuming: {len(done)}/{num_shards} shards already complete")
+    indices = np.concatenate([
+        np.arange(shard * shard_size, min((shard + 1) * shard_size, num_images)) for shard in todo
+    ]) if todo else np.empty(0, dtype=np.int64)
+
+    stats = {"images": int(indices.size), "seconds": 0.0, "images_per_sec": 0.0, "shards_written": 0}
+    if not indices.size:
+        print("Nothing to score: every shard is complete")
+        return stats
+
+    loader = DataLoader(
+        Subset(dataset, indices.tolist()),
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+        collate_fn=collate_scoring_batch,
+        worker_init_fn=_worker_init if num_workers else None,
+        prefetch_factor=4 if num_workers else None,
+    )
+
+    class_names = np.array(
+        [predictor.idx_to_class.get(i, "Unknown") for i in range(predictor.num_classes)] + [None], dtype=object
+    )
+    writer: Optional[_ShardWriter] = None
+    position = 0
+    start = time.perf_counter()
+    shard_start = start
+
+    for collated in loader:
+        arrays = predictor.predict_preprocessed(
+            collated["batch"],
+            collated["is_plant"],
+            gate_reason=collated["gate_reason"],
+            return_probabilities=return_probabilities,
+        )
+        table = _results_table(arrays, collated, class_names, labeled)
+        rows = len(collated["source"])
+        shards = indices[position:position + rows] // shard_size
+        position += rows
+
+        # A batch can straddle a shard boundary; split it into runs per shard
+        bounds = np.flatnonzero(np.diff(shards)) + 1
+        for run_start, run_end in zip(np.r_[0, bounds], np.r_[bounds, rows]):
+            shard = int(shards[run_start])
+            if writer is None:
+                writer = _ShardWriter(shard_path(output_dir, shard), table.schema, row_group_size)
+            writer.write(table.slice(run_start, run_end - run_start))
+
+            expected = min((shard + 1) * shard_size, num_images) - shard * shard_size
+            if writer.rows == expected:
+                writer.close()
+                writer = None
+                stats["shards_written"] += 1
+                now = time.perf_counter()
+                scored = position - rows + run_end
+                print(
+                    f"Shard {shard + 1}/{num_shards}: {expected:,} images in {now - shard_start:.1f}s "
+                    f"({expected / (now - shard_start):.1f} img/s), "
+                    f"{scored:,}/{indices.size:,} this run, {scored / (now - start):.1f} img/s overall"
+                )
+                shard_start = now
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["images_per_sec"] = stats["images"] / stats["seconds"]
+    return stats
+
+
+if __name__ == "__main__":
+    import io
+    import sys
+    import tempfile
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    print("Testing Bulk Scoring Sources...")
+    print()
+
+    def leaf_like(seed: int) -> bytes:
+        # Green ellipse on soil with veins and sensor noise; passes the plant gate.
+        rng = np.random.default_rng(seed)
+        yy, xx = np.mgrid[0:240, 0:320]
+        leaf = ((yy - 120) / 100.0) ** 2 + ((xx - 160) / 110.0) ** 2 < 1
+        pixels = np.empty((240, 320, 3), dtype=np.float32)
+        pixels[:] = (120, 90, 60)
+        pixels[leaf] = (50, 150, 40)
+        pixels[:, ::16] += 40
+        pixels += rng.normal(0, 12, pixels.shape)
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        images = {f"field_{i // 4}/img_{i:03d}.jpg": leaf_like(i) for i in range(12)}
+        images["notes.txt"] = b"not an image"
+        images["field_0/broken.jpg"] = b"\xff\xd8 truncated"
+
+        tree = tmp_dir / "tree"
+        for name, data in images.items():
+            (tree / name).parent.mkdir(parents=True, exist_ok=True)
+            (tree / name).write_bytes(data)
+        with zipfile.ZipFile(tmp_dir / "survey.zip", "w") as archive:
+            for name, data in images.items():
+                archive.writestr(name, data)
+        for suffix, mode in ((".tar", "w"), (".tar.gz", "w:gz")):
+            with tarfile.open(tmp_dir / f"survey{suffix}", mode) as archive:
+                for name, data in images.items():
+                    info = tarfile.TarInfo(name)
+                    info.size = len(data)
+                    archive.addfile(info, io.BytesIO(data))
+
+        print("Test 1: Every source type lists and decodes the same images...")
+        reference = None
+        for path in (tree, tmp_dir / "survey.zip", tmp_dir / "survey.tar", tmp_dir / "survey.tar.gz"):
+            dataset = ImageSourceDataset(path)
+            loader = DataLoader(dataset, batch_size=5, num_workers=2, collate_fn=collate_scoring_batch)
+            batches = list(loader)
+            names = [name for b in batches for name in b["source"]]
+            rows = torch.cat([b["batch"] for b in batches if b["batch"] is not None])
+            reasons = [r for b in batches for r in b["gate_reason"]]
+            print(f"{path.name:<16} {len(names)} images, {rows.shape[0]} preprocessed, "
+                  f"{sum(r.startswith('Unreadable') for r in reasons)} unreadable")
+            if reference is None:
+                reference = (names, rows)
+            assert names == reference[0]
+            assert torch.equal(rows, reference[1])
+        print()
+
+    print("All tests passed!")
@@ -0,0 +1,134 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+
+def checkpoint_identity(model_path: Union[str, Path]) -> str:
+    path = Path(model_path)
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return f"{path.resolve()}:missing"
+    return f"{path.resolve()}:{stat.st_mtime_ns}:{stat.st_size}"
+
+
+class PredictionCache:
+    """
+    Content-addressed LRU cache of prediction results.
+
+    Keys combine a hash of the uploaded bytes with the checkpoint identity
+    (path, mtime, size). Entries expire after ttl_seconds, the least recently
+    used entry is evicted past max_entries, and the whole cache is dropped as
+    soon as the checkpoint file changes on disk.
+
+    identity is that of the weights the results come from, i.e. the
+    checkpoint as it was when the model was loaded. Keys made for it stop
+    matching once the file changes, so a model still running from the old
+    weights can never store its results under the new checkpoint.
+    """
+
+    def __init__(
+        self,
+        model_path: Union[str, Path],
+        max_entries: int = 2048,
+        ttl_seconds: float = 3600.0,
+        check_interval: float = 1.0,
+        identity: Optional[str] = None,
+    ):
+        self.model_path = Path(model_path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.check_interval = check_interval
+
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._identity = identity or checkpoint_identity(self.model_path)
+        self.model_identity = self._identity
+        self._last_check = time.monotonic()
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def make_key(self, data: bytes, variant: str = "") -> Tuple[str, str, str]:
+        # Keyed by the serving model, not the file: a put is dropped if the
+        # checkpoint changed before or while the request ran on that model
+        with self._lock:
+            self._check_model()
+            return (self.model_identity, self.digest(data), variant)
+
+    def _check_model(self):
+        # Called with the lock held. stat() is cheap but not free, so it runs
+        # at most once per check_interval.
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+
+        identity = checkpoint_identity(self.model_path)
+        if identity != self._identity:
+            self._identity = identity
+            self._entries.clear()
+            self._invalidations += 1
+            print(f"Model file changed; prediction cache invalidated ({self.model_path.name})")
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[Any]:
+        with self._lock:
+            self._check_model()
+            entry = self._entries.get(key)
+            if entry is None or key[0] != self._identity:
+                self._misses += 1
+                return None
+
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return copy.deepcopy(value)
+
+    def put(self, key: Tuple[str, str, str], value: Any):
+        with self._lock:
+            self._check_model()
+            if key[0] != self._identity:
+                return
+            self._entries[key] = (time.monotonic(), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._identity = checkpoint_identity(self.model_path)
+            self._invalidations += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
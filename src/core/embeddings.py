@@ -0,0 +1,433 @@
+import threading
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+# Pending (untrained) float16 vectors are scored this many rows at a time,
+# so a query never converts the whole buffer to float32 (4 MB at 2048 dims).
+PENDING_SCORE_CHUNK = 512
+
+
+# Stored embeddings are symmetric int8 with one float scale per vector:
+# 4x smaller than float32 and accurate to well under 1% for cosine search.
+def quantize_embedding(vector: np.ndarray) -> Tuple[bytes, float]:
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    peak = float(np.abs(vector).max()) if vector.size else 0.0
+    scale = peak / 127.0 if peak > 0 else 1.0
+    codes = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+    return codes.tobytes(), scale
+
+
+def dequantize_embedding(data: bytes, scale: float) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.int8).astype(np.float32) * np.float32(scale)
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 4096) -> np.ndarray:
+    # argmin ||v - c||^2 == argmax (v.c - ||c||^2 / 2); chunked to bound memory.
+    half_sq = 0.5 * np.einsum("kd,kd->k", centroids, centroids)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        scores = vectors[start:start + chunk] @ centroids.T - half_sq
+        labels[start:start + chunk] = scores.argmax(axis=1)
+    return labels
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    data = np.asarray(data, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=len(data) < k)].copy()
+
+    for _ in range(iterations):
+        labels = _assign(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        order = np.argsort(labels, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        centroids[filled] = sums / counts[filled, None]
+        # Re-seed empty clusters from random points so no centroid is wasted.
+        empty = np.flatnonzero(~filled)
+        if empty.size:
+            centroids[empty] = data[rng.choice(len(data), size=empty.size)]
+
+    return centroids
+
+
+class IVFPQIndex:
+    """
+    Approximate cosine-similarity index over embeddings, in NumPy only.
+
+    Vectors are L2-normalized and assigned to the nearest of n_lists coarse
+    centroids (IVF); the residual to that centroid is product-quantized into
+    n_subvectors one-byte codes (PQ). A query scans only the nprobe closest
+    lists, scoring candidates with one table lookup per subvector.
+
+    Inserts are incremental: once trained, a new vector is encoded and
+    appended to its list. Until train_size vectors have arrived, vectors are
+    kept as float16 and searched exactly; the one-off training pass then
+    encodes them, on a background thread with background_training.
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        n_lists: int = 1024,
+        n_subvectors: int = 64,
+        nprobe: int = 16,
+        train_size: Optional[int] = None,
+        model_id: str = "",
+        background_training: bool = False,
+    ):
+        if dim % n_subvectors:
+            raise ValueError(f"dim ({dim}) must be divisible by n_subvectors ({n_subvectors})")
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_subvectors = n_subvectors
+        self.sub_dim = dim // n_subvectors
+        self.nprobe = nprobe
+        self.train_size = train_size or max(20 * n_lists, 256 * 40)
+        self.model_id = model_id
+        self.background_training = background_training
+
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+
+        self._lock = threading.RLock()
+        self._training = False
+        self._pending_ids = np.empty(0, dtype=np.int64)
+        self._pending_vectors = np.empty((0, dim), dtype=np.float16)
+        self._pending_size = 0
+        self._list_ids = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self._list_codes = [np.empty((0, n_subvectors), dtype=np.uint8) for _ in range(n_lists)]
+        self._list_sizes = np.zeros(n_lists, dtype=np.int64)
+
+        self.last_id = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return int(self._list_sizes.sum()) + self._pending_size
+
+    def add(self, ids: Sequence[int], vectors: np.ndarray):
+        ids = np.asarray(ids, dtype=np.int64).ravel()
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim))
+        if not len(ids):
+            return
+
+        if self.is_trained:
+            # Centroids and codebooks never change once trained, so encoding
+            # needs no lock; only the list append does.
+            encoded = self._encode(vectors)
+            with self._lock:
+                self.last_id = max(self.last_id, int(ids.max()))
+                self._append_encoded(ids, *encoded)
+            return
+
+        with self._lock:
+            self.last_id = max(self.last_id, int(ids.max()))
+            if self.is_trained:
+                self._append_encoded(ids, *self._encode(vectors))
+                return
+            self._append_pending(ids, vectors)
+            start_training = not self._training and self._pending_size >= self.train_size
+            if start_training:
+                self._training = True
+
+        if start_training:
+            if self.background_training:
+                threading.Thread(target=self._train_from_pending, name="ivfpq-train", daemon=True).start()
+            else:
+                self._train_from_pending()
+
+    def _train_from_pending(self):
+        # k-means runs without the lock; searches keep using the exact
+        # pending path until the trained lists are swapped in.
+        with self._lock:
+            snapshot = self._pending_size
+            ids = self._pending_ids[:snapshot]
+            vectors = self._pending_vectors[:snapshot]
+        vectors = vectors.astype(np.float32)
+
+        print(f"Training similarity index on {len(ids):,} embeddings ({self.n_lists} lists)...")
+        centroids = kmeans(vectors, self.n_lists)
+        residuals = vectors - centroids[_assign(vectors, centroids)]
+        codebooks = np.stack([
+            kmeans(residuals[:, j * self.sub_dim:(j + 1) * self.sub_dim], 256, iterations=8, seed=j)
+            for j in range(self.n_subvectors)
+        ])
+        encoded = self._encode(vectors, centroids, codebooks)
+
+        with self._lock:
+            late_ids = self._pending_ids[snapshot:self._pending_size]
+            late_vectors = self._pending_vectors[snapshot:self._pending_size]
+            # Codebooks first: is_trained (and lock-free encoding) keys off centroids
+            self.codebooks, self.centroids = codebooks, centroids
+            self._pending_ids = np.empty(0, dtype=np.int64)
+            self._pending_vectors = np.empty((0, self.dim), dtype=np.float16)
+            self._pending_size = 0
+            self._append_encoded(ids, *encoded)
+            if len(late_ids):
+                self._append_encoded(late_ids, *self._encode(late_vectors.astype(np.float32)))
+            self._training = False
+
+    def _encode(
+        self,
+        vectors: np.ndarray,
+        centroids: Optional[np.ndarray] = None,
+        codebooks: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        centroids = self.centroids if centroids is None else centroids
+        codebooks = self.codebooks if codebooks is None else codebooks
+        lists = _assign(vectors, centroids)
+        residuals = vectors - centroids[lists]
+        codes = np.empty((len(vectors), self.n_subvectors), dtype=np.uint8)
+        for j in range(self.n_subvectors):
+            codes[:, j] = _assign(residuals[:, j * self.sub_dim:(j + 1) * self.sub_dim], codebooks[j])
+        return lists, codes
+
+    def _append_pending(self, ids: np.ndarray, vectors: np.ndarray):
+        # Same capacity doubling as the lists. Rows below _pending_size are
+        # never rewritten, so a search can score a snapshot without the lock.
+        size = self._pending_size
+        needed = size + len(ids)
+        if needed > len(self._pending_ids):
+            capacity = max(needed, 2 * len(self._pending_ids), 256)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_vectors = np.empty((capacity, self.dim), dtype=np.float16)
+            grown_ids[:size] = self._pending_ids[:size]
+            grown_vectors[:size] = self._pending_vectors[:size]
+            self._pending_ids, self._pending_vectors = grown_ids, grown_vectors
+        self._pending_ids[size:needed] = ids
+        self._pending_vectors[size:needed] = vectors
+        self._pending_size = needed
+
+    def _append_encoded(self, ids: np.ndarray, lists: np.ndarray, codes: np.ndarray):
+        order = np.argsort(lists, kind="stable")
+        lists, ids, codes = lists[order], ids[order], codes[order]
+        bounds = np.flatnonzero(np.diff(lists)) + 1
+        for chunk_ids, chunk_codes, list_no in zip(
+            np.split(ids, bounds), np.split(codes, bounds), lists[np.r_[0, bounds]]
+        ):
+            self._append_to_list(int(list_no), chunk_ids, chunk_codes)
+
+    def _append_to_list(self, list_no: int, ids: np.ndarray, codes: np.ndarray):
+        # Capacity doubling keeps inserts amortised O(1) per vector.
+        size = self._list_sizes[list_no]
+        needed = size + len(ids)
+        if needed > len(self._list_ids[list_no]):
+            capacity = max(needed, 2 * len(self._list_ids[list_no]), 16)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_codes = np.empty((capacity, self.n_subvectors), dtype=np.uint8)
+            grown_ids[:size] = self._list_ids[list_no][:size]
+            grown_codes[:size] = self._list_codes[list_no][:size]
+            self._list_ids[list_no], self._list_codes[list_no] = grown_ids, grown_codes
+        self._list_ids[list_no][size:needed] = ids
+        self._list_codes[list_no][size:needed] = codes
+        self._list_sizes[list_no] = needed
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Return up to k (id, approximate cosine similarity) pairs, best first."""
+        query = normalize_rows(np.asarray(query, dtype=np.float32).reshape(self.dim))
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+
+        # Only views are taken under the lock. Appends never rewrite rows
+        # below a recorded size (growth copies into new arrays), and the
+        # centroids and codebooks never change once set, so scoring runs
+        # unlocked alongside inserts and other queries.
+        with self._lock:
+            pending_ids = self._pending_ids[:self._pending_size]
+            pending_vectors = self._pending_vectors[:self._pending_size]
+            centroids, codebooks = self.centroids, self.codebooks
+            probed = []
+            if centroids is not None:
+                coarse = centroids @ query
+                probe = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+                probed = [
+                    (self._list_ids[list_no][:size], self._list_codes[list_no][:size], coarse[list_no])
+                    for list_no, size in zip(probe, self._list_sizes[probe]) if size
+                ]
+
+        candidate_ids, candidate_scores = [], []
+        if len(pending_ids):
+            candidate_ids.append(pending_ids)
+            candidate_scores.append(np.concatenate([
+                pending_vectors[start:start + PENDING_SCORE_CHUNK].astype(np.float32) @ query
+                for start in range(0, len(pending_ids), PENDING_SCORE_CHUNK)
+            ]))
+
+        if probed:
+            # Inner product with each sub-codeword: q.(c + r) = q.c + sum_j q_j.r_j
+            table = np.einsum("jd,jkd->jk", query.reshape(self.n_subvectors, self.sub_dim), codebooks)
+            subspaces = np.arange(self.n_subvectors)
+            for ids, codes, offset in probed:
+                candidate_ids.append(ids)
+                candidate_scores.append(offset + table[subspaces, codes].sum(axis=1))
+
+        if not candidate_ids:
+            return []
+        ids = np.concatenate(candidate_ids)
+        scores = np.concatenate(candidate_scores)
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def save(self, path: Union[str, Path]):
+        path = Path(path)
+        with self._lock:
+            sizes = self._list_sizes.copy()
+            arrays = {
+                "config": np.array([self.dim, self.n_lists, self.n_subvectors, self.nprobe, self.train_size, self.last_id]),
+                "model_id": np.array(self.model_id),
+                "list_sizes": sizes,
+                "list_ids": np.concatenate([ids[:n] for ids, n in zip(self._list_ids, sizes)]),
+                "list_codes": np.concatenate([codes[:n] for codes, n in zip(self._list_codes, sizes)]),
+                "pending_ids": self._pending_ids[:self._pending_size].copy(),
+                "pending_vectors": self._pending_vectors[:self._pending_size].copy(),
+            }
+            if self.is_trained:
+                arrays["centroids"] = self.centroids
+                arrays["codebooks"] = self.codebooks
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.tmp.npz")
+        np.savez(tmp_path, **arrays)
+        tmp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: Union[str, Path], background_training: bool = False) -> "IVFPQIndex":
+        with np.load(path) as data:
+            dim, n_lists, n_subvectors, nprobe, train_size, last_id = (int(v) for v in data["config"])
+            index = cls(
+                dim, n_lists, n_subvectors, nprobe, train_size,
+                model_id=str(data["model_id"]), background_training=background_training,
+            )
+            index.last_id = last_id
+            if "centroids" in data:
+                index.centroids = data["centroids"]
+                index.codebooks = data["codebooks"]
+
+            bounds = np.cumsum(data["list_sizes"])[:-1]
+            for list_no, (ids, codes) in enumerate(zip(
+                np.split(data["list_ids"], bounds), np.split(data["list_codes"], bounds)
+            )):
+                index._list_ids[list_no] = ids.copy()
+                index._list_codes[list_no] = codes.copy()
+            index._list_sizes = data["list_sizes"].astype(np.int64)
+
+            if len(data["pending_ids"]):
+                index._append_pending(data["pending_ids"], data["pending_vectors"])
+        return index
+
+
+if __name__ == "__main__":
+    import tempfile
+    import time
+
+    print("Testing Embedding Index...")
+    print()
+
+    DIM = 2048
+    rng = np.random.default_rng(0)
+    # Synthetic stand-in for penultimate-layer features: 38 "classes", each
+    # varying along a few directions (image conditions) plus small noise, so
+    # nearest neighbours are meaningful rather than equidistant.
+    class_centers = rng.standard_normal((38, DIM)).astype(np.float32)
+    variation = rng.standard_normal((38, 16, DIM)).astype(np.float32) / 4
+
+    def synthetic(n: int) -> np.ndarray:
+        labels = rng.integers(0, len(class_centers), n)
+        latent = rng.standard_normal((n, 16)).astype(np.float32)
+        features = class_centers[labels] + np.einsum("nl,nld->nd", latent, variation[labels])
+        return np.maximum(features + 0.1 * rng.standard_normal((n, DIM)).astype(np.float32), 0)
+
+    print("Test 1: int8 quantization round trip...")
+    vectors = synthetic(100)
+    restored = np.stack([dequantize_embedding(*quantize_embedding(v)) for v in vectors])
+    cosine = (normalize_rows(vectors) * normalize_rows(restored)).sum(axis=1)
+    print(f"Min cosine after quantization: {cosine.min():.5f} ({len(quantize_embedding(vectors[0])[0])} bytes/vector)")
+    assert cosine.min() > 0.999
+    print()
+
+    print("Test 2: Untrained index searches its float16 buffer exactly...")
+    index = IVFPQIndex(DIM, n_lists=64, n_subvectors=64, train_size=10000)
+    base = synthetic(5000)
+    for start in range(0, len(base), 1000):
+        index.add(np.arange(start, start + 1000) + 1, base[start:start + 1000])
+    assert not index.is_trained and len(index) == len(base)
+    queries = synthetic(20)
+    exact = normalize_rows(queries) @ normalize_rows(base).T
+    for q, row in zip(queries, exact):
+        assert [i for i, _ in index.search(q, k=10)] == (np.argsort(-row)[:10] + 1).tolist()
+    t0 = time.perf_counter()
+    for q in queries:
+        index.search(q, k=10)
+    print(f"Exact top-10 over {len(base):,} pending vectors: {1000 * (time.perf_counter() - t0) / len(queries):.2f} ms/query")
+    print()
+
+    print("Test 3: Recall against exact search...")
+    index = IVFPQIndex(DIM, n_lists=64, n_subvectors=64, nprobe=8)
+    base = synthetic(20000)
+    for start in range(0, len(base), 2500):
+        index.add(np.arange(start, start + 2500) + 1, base[start:start + 2500])
+    assert index.is_trained and len(index) == len(base)
+    queries = synthetic(50)
+    exact = normalize_rows(queries) @ normalize_rows(base).T
+    recalls = []
+    for q, row in zip(queries, exact):
+        truth = set((np.argsort(-row)[:10] + 1).tolist())
+        found = {i for i, _ in index.search(q, k=10)}
+        recalls.append(len(truth & found) / 10)
+    print(f"Recall@10: {np.mean(recalls):.3f}")
+    assert np.mean(recalls) >= 0.6, "Index recall too low"
+    print()
+
+    print("Test 4: Incremental insert is visible without a rebuild...")
+    new_vector = synthetic(1)[0]
+    index.add([999999], new_vector[None])
+    assert index.search(new_vector, k=1)[0][0] == 999999
+    print("Inserted vector found as its own nearest neighbour")
+    print()
+
+    print("Test 5: Save and load...")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "index.npz"
+        index.save(path)
+        reloaded = IVFPQIndex.load(path)
+        assert len(reloaded) == len(index) and reloaded.last_id == 999999
+        assert reloaded.search(queries[0], k=5) == index.search(queries[0], k=5)
+        print(f"Snapshot: {path.stat().st_size / 1e6:.1f} MB for {len(index):,} vectors")
+    print()
+
+    print("Test 6: Query latency at scale...")
+    index = IVFPQIndex(DIM, n_lists=1024, n_subvectors=64, nprobe=16)
+    total = 300_000
+    t0 = time.perf_counter()
+    for start in range(0, total, 10000):
+        index.add(np.arange(start, start + 10000) + 1, synthetic(10000))
+    print(f"Inserted {total:,} vectors in {time.perf_counter() - t0:.1f}s (including training)")
+
+    timings = []
+    for q in synthetic(200):
+        t0 = time.perf_counter()
+        index.search(q, k=10)
+        timings.append(1000.0 * (time.perf_counter() - t0))
+    scanned = total * index.nprobe / index.n_lists
+    print(f"Search p50 {np.percentile(timings, 50):.2f} ms, p95 {np.percentile(timings, 95):.2f} ms "
+          f"(~{scanned:,.0f} candidates scanned)")
+    print(f"Code memory: {total * index.n_subvectors / 1e6:.1f} MB; "
+          f"per million vectors {index.n_subvectors:.0f} MB")
+    print()
+
+    print("All tests passed!")
@@ -0,0 +1,399 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+# Priority classes, most urgent first
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITY_SHADOW = "shadow"
+# Loading and warming a model: it holds a worker for seconds, so it is run
+# (and counted) as a job too, in a class of its own so its duration never
+# skews the run-time estimates behind another class's deadline dropping.
+PRIORITY_MODEL_LOAD = "model_load"
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue is at capacity and work is shed."""
+
+    def __init__(self, retry_after: float, message: str = "Inference queue is full"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(QueueFullError):
+    """Raised when queued work could no longer finish within its deadline and was dropped."""
+
+    def __init__(self, retry_after: float, message: str = "Inference deadline exceeded while queued"):
+        super().__init__(retry_after, message)
+
+
+class PriorityClass:
+    """
+    Scheduling policy for one kind of inference work.
+
+    share is the fraction of the workers its jobs may occupy at once (always
+    at least one), max_queue how many of its jobs may wait, and deadline_ms
+    the latency budget from submission: a job whose wait plus the class's
+    typical run time would exceed it is dropped instead of started.
+    """
+
+    def __init__(self, name: str, share: float = 1.0, max_queue: int = 16, deadline_ms: Optional[float] = None):
+        if not 0.0 < share <= 1.0:
+            raise ValueError(f"share of {name} must be in (0, 1], got {share}")
+        self.name = name
+        self.share = share
+        self.max_queue = max_queue
+        self.deadline_ms = deadline_ms
+
+
+class _Job:
+    __slots__ = ("future", "fn", "args", "kwargs", "queued_at", "deadline")
+
+    def __init__(self, fn, args, kwargs, deadline: Optional[float]):
+        self.future = Future()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.queued_at = time.perf_counter()
+        self.deadline = deadline
+
+
+class _ClassState:
+    def __init__(self, policy: PriorityClass, max_workers: int, window: int):
+        self.policy = policy
+        self.max_running = max(1, int(policy.share * max_workers))
+        self.queue = deque()
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.dropped = 0
+        self.cancelled = 0
+        self.recent_waits = deque(maxlen=window)
+        self.recent_runs = deque(maxlen=window)
+
+    def expected_run(self) -> float:
+        return float(np.median(self.recent_runs)) if self.recent_runs else 0.0
+
+
+def default_priority_classes(max_queue: int = 16) -> List[PriorityClass]:
+    return [
+        PriorityClass(PRIORITY_INTERACTIVE, share=1.0, max_queue=max_queue),
+        PriorityClass(PRIORITY_BULK, share=0.5, max_queue=max_queue),
+        PriorityClass(PRIORITY_SHADOW, share=0.25, max_queue=2),
+        PriorityClass(PRIORITY_MODEL_LOAD, share=0.25, max_queue=1),
+    ]
+
+
+class InferenceExecutor:
+    """
+    Run CPU-bound inference on dedicated threads, off the asyncio event loop.
+
+    At most max_workers jobs run at once. Waiting jobs are queued per
+    priority class and a free worker always takes the oldest job of the most
+    urgent class that is below its share of the workers, so interactive
+    requests never wait behind queued bulk or shadow work, only behind jobs
+    already running. Each class admits at most its max_queue waiting jobs;
+    anything beyond that is rejected immediately with QueueFullError so
+    latency cannot pile up behind a saturated worker, and jobs that would
+    miss their class deadline are dropped with DeadlineExceededError.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        max_queue: int = 16,
+        retry_after: float = 1.0,
+        wait_window: int = 1000,
+        classes: Optional[Sequence[PriorityClass]] = None,
+    ):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+
+        classes = classes if classes is not None else default_priority_classes(max_queue)
+        self._classes: Dict[str, _ClassState] = {
+            policy.name: _ClassState(policy, max_workers, wait_window) for policy in classes
+        }
+
+        self._running = 0
+        self._submitted = 0
+        self._rejected = 0
+        self._completed = 0
+        self._recent_waits = deque(maxlen=wait_window)
+        self._recent_runs = deque(maxlen=wait_window)
+
+    @property
+    def queue_depth(self) -> int:
+        with self._lock:
+            return sum(len(state.queue) for state in self._classes.values())
+
+    def is_saturated(self, priority: str = PRIORITY_INTERACTIVE) -> bool:
+        with self._lock:
+            state = self._classes[priority]
+            return len(state.queue) >= state.policy.max_queue and self._running >= self.max_workers
+
+    def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        priority: str = PRIORITY_INTERACTIVE,
+        deadline_ms: Optional[float] = None,
+        **kwargs,
+    ) -> Future:
+        """
+        Queue fn(*args, **kwargs) in a priority class; thread-safe. Returns a
+        concurrent Future; deadline_ms overrides the class deadline.
+        """
+        state = self._classes.get(priority)
+        if state is None:
+            raise ValueError(f"Unknown priority class: {priority}")
+        deadline_ms = deadline_ms if deadline_ms is not None else state.policy.deadline_ms
+
+        job = _Job(fn, args, kwargs, None)
+        if deadline_ms is not None:
+            job.deadline = job.queued_at + deadline_ms / 1000.0
+
+        with self._lock:
+            idle = self._running < self.max_workers and state.running < state.max_running
+            if not idle and len(state.queue) >= state.policy.max_queue:
+                state.rejected += 1
+                self._rejected += 1
+                raise QueueFullError(self.retry_after)
+            state.queue.append(job)
+            state.submitted += 1
+            self._submitted += 1
+            dropped = self._dispatch()
+        self._fail(dropped)
+
+        # A caller that goes away while queued frees its place right away
+        job.future.add_done_callback(lambda future: future.cancelled() and self._forget(state, job))
+        return job.future
+
+    async def run(self, fn: Callable[..., Any], *args, priority: str = PRIORITY_INTERACTIVE, **kwargs) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args, priority=priority, **kwargs))
+
+    def _dispatch(self) -> List[_Job]:
+        # Called with the lock held; starts jobs while workers are free
+        dropped = []
+        while self._running < self.max_workers:
+            picked = self._next_job(dropped)
+            if picked is None:
+                break
+            state, job = picked
+            state.running += 1
+            self._running += 1
+            self.pool.submit(self._run_job, state, job)
+        return dropped
+
+    def _next_job(self, dropped: List[_Job]):
+        now = time.perf_counter()
+        for state in self._classes.values():
+            if state.running >= state.max_running:
+                continue
+            while state.queue:
+                job = state.queue.popleft()
+                if job.deadline is not None and now + state.expected_run() > job.deadline:
+                    state.dropped += 1
+                    dropped.append(job)
+                    continue
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                state.recent_waits.append(now - job.queued_at)
+                self._recent_waits.append(now - job.queued_at)
+                return state, job
+        return None
+
+    def _run_job(self, state: _ClassState, job: _Job):
+        started = time.perf_counter()
+        try:
+            result = job.fn(*job.args, **job.kwargs)
+        except BaseException as e:
+            job.future.set_exception(e)
+        else:
+            job.future.set_result(result)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                state.running -= 1
+                self._running -= 1
+                state.completed += 1
+                self._completed += 1
+                state.recent_runs.append(elapsed)
+                self._recent_runs.append(elapsed)
+                dropped = self._dispatch()
+            self._fail(dropped)
+
+    def _fail(self, dropped: List[_Job]):
+        # Outside the lock: futures run their callbacks synchronously
+        for job in dropped:
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_exception(DeadlineExceededError(self.retry_after))
+
+    def _forget(self, state: _ClassState, job: _Job):
+        with self._lock:
+            try:
+                state.queue.remove(job)
+            except ValueError:
+                return
+            state.cancelled += 1
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = np.asarray(self._recent_waits) * 1000.0
+            runs = np.asarray(self._recent_runs) * 1000.0
+            metrics = {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queue_depth": sum(len(state.queue) for state in self._classes.values()),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "dropped": sum(state.dropped for state in self._classes.values()),
+            }
+            classes = {
+                name: {
+                    "share": state.policy.share,
+                    "max_running": state.max_running,
+                    "max_queue": state.policy.max_queue,
+                    "deadline_ms": state.policy.deadline_ms,
+                    "running": state.running,
+                    "queue_depth": len(state.queue),
+                    "submitted": state.submitted,
+                    "completed": state.completed,
+                    "rejected": state.rejected,
+                    "dropped": state.dropped,
+                    "cancelled": state.cancelled,
+                    "wait_ms": np.asarray(state.recent_waits) * 1000.0,
+                    "run_ms": np.asarray(state.recent_runs) * 1000.0,
+                }
+                for name, state in self._classes.items()
+            }
+
+        metrics["wait_ms"] = _summarise(waits)
+        metrics["run_ms"] = _summarise(runs)
+        for entry in classes.values():
+            entry["wait_ms"] = _summarise(entry["wait_ms"])
+            entry["run_ms"] = _summarise(entry["run_ms"])
+        metrics["classes"] = classes
+        return metrics
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            queued = [job for state in self._classes.values() for job in state.queue]
+            for state in self._classes.values():
+                state.queue.clear()
+        for job in queued:
+            job.future.cancel()
+        self.pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def _summarise(values: np.ndarray) -> Dict[str, float]:
+    if values.size == 0:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+if __name__ == "__main__":
+    print("Testing Priority Inference Executor...")
+    print()
+
+    def work(seconds: float, tag: str = ""):
+        time.sleep(seconds)
+        return tag
+
+    print("Test 1: Interactive jumps queued bulk work...")
+    executor = InferenceExecutor(max_workers=1, max_queue=16)
+    order = []
+    bulk = [executor.submit(work, 0.05, f"bulk{i}", priority=PRIORITY_BULK) for i in range(4)]
+    time.sleep(0.01)
+    interactive = executor.submit(work, 0.01, "interactive")
+    for future in [interactive] + bulk:
+        future.add_done_callback(lambda f: order.append(f.result()))
+    for future in bulk:
+        future.result()
+    print(f"Completion order: {order}")
+    assert order[:2] == ["bulk0", "interactive"], order
+    executor.shutdown()
+    print()
+
+    print("Test 2: Shares cap lower classes, leaving workers for interactive...")
+    executor = InferenceExecutor(max_workers=4, max_queue=16)
+    bulk = [executor.submit(work, 0.1, priority=PRIORITY_BULK) for _ in range(6)]
+    time.sleep(0.02)
+    metrics = executor.get_metrics()["classes"][PRIORITY_BULK]
+    print(f"Bulk running {metrics['running']} of 4 workers, {metrics['queue_depth']} queued")
+    assert metrics["running"] == 2 and metrics["queue_depth"] == 4
+    started = time.perf_counter()
+    executor.submit(work, 0.01).result()
+    waited = (time.perf_counter() - started) * 1000.0
+    print(f"Interactive answered in {waited:.0f} ms while bulk was busy")
+    assert waited < 50
+    for future in bulk:
+        future.result()
+    executor.shutdown()
+    print()
+
+    print("Test 3: Deadline-aware dropping and per-class admission...")
+    classes = [
+        PriorityClass(PRIORITY_INTERACTIVE, max_queue=4, deadline_ms=80),
+        PriorityClass(PRIORITY_BULK, share=0.5, max_queue=1),
+    ]
+    executor = InferenceExecutor(max_workers=1, classes=classes)
+    blocker = executor.submit(work, 0.15)
+    late = executor.submit(work, 0.01)
+    executor.submit(work, 0.01, priority=PRIORITY_BULK)
+    try:
+        executor.submit(work, 0.01, priority=PRIORITY_BULK)
+        raise AssertionError("bulk queue should be full")
+    except QueueFullError:
+        pass
+    blocker.result()
+    try:
+        late.result()
+        raise AssertionError("late job should have been dropped")
+    except DeadlineExceededError:
+        pass
+    time.sleep(0.05)
+    metrics = executor.get_metrics()
+    print({name: (c["completed"], c["rejected"], c["dropped"]) for name, c in metrics["classes"].items()})
+    assert metrics["classes"][PRIORITY_INTERACTIVE]["dropped"] == 1
+    assert metrics["classes"][PRIORITY_BULK]["rejected"] == 1
+    executor.shutdown()
+    print()
+
+    print("Test 4: Async callers and cancellation...")
+
+    async def main():
+        executor = InferenceExecutor(max_workers=1)
+        blocker = asyncio.ensure_future(executor.run(work, 0.1, "first"))
+        await asyncio.sleep(0.01)
+        waiting = asyncio.ensure_future(executor.run(work, 0.01, "second", priority=PRIORITY_BULK))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        assert await blocker == "first"
+        await asyncio.sleep(0.01)
+        metrics = executor.get_metrics()["classes"][PRIORITY_BULK]
+        assert metrics["cancelled"] == 1 and metrics["queue_depth"] == 0
+        executor.shutdown()
+
+    asyncio.run(main())
+    print()
+
+    print("All tests passed!")
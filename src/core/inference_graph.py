@@ -0,0 +1,191 @@
+import copy
+import json
+import os
+from pathlib import Path
+from typing import Optional, Union
+
+import torch
+import torch.nn as nn
+from torch.fx.experimental.optimization import fuse, remove_dropout
+
+from src.core.cache import checkpoint_identity
+
+
+# Bump when the build recipe changes so cached graphs are rebuilt.
+GRAPH_FORMAT_VERSION = 1
+
+
+def frozen_graph_path(
+    checkpoint_path: Union[str, Path],
+    return_features: bool = False,
+    return_heatmap: bool = False,
+) -> Path:
+    checkpoint_path = Path(checkpoint_path)
+    variant = (".features" if return_features else "") + (".heatmap" if return_heatmap else "")
+    return checkpoint_path.with_name(f"{checkpoint_path.stem}{variant}.frozen.pt")
+
+
+def fold_for_inference(model: nn.Module, channels_last: bool = True) -> nn.Module:
+    """
+    Eval-only copy of the model with every BatchNorm folded into the preceding
+    convolution and the dropout in the head removed, in channels_last layout.
+    The result is still an ordinary nn.Module (an fx GraphModule). A model on
+    the meta device is folded structurally, ready for load_state_dict(assign=True).
+    """
+    model = copy.deepcopy(model).eval()
+    if not any(p.is_meta for p in model.parameters()):
+        model = model.to("cpu")
+    folded = fuse(model)
+    folded = remove_dropout(folded)
+    if channels_last:
+        folded = folded.to(memory_format=torch.channels_last)
+    return folded.eval()
+
+
+def freeze_graph(model: nn.Module, image_size=(224, 224), channels_last: bool = True) -> torch.jit.ScriptModule:
+    example = torch.randn(1, 3, *image_size)
+    if channels_last:
+        example = example.contiguous(memory_format=torch.channels_last)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        frozen = torch.jit.freeze(traced)
+    return frozen
+
+
+def build_inference_graph(
+    model: nn.Module,
+    image_size=(224, 224),
+    channels_last: bool = True,
+) -> torch.jit.ScriptModule:
+    return freeze_graph(fold_for_inference(model, channels_last), image_size, channels_last)
+
+
+def _graph_metadata(checkpoint_path: Path, channels_last: bool, return_features: bool, return_heatmap: bool) -> str:
+    return json.dumps({
+        "format_version": GRAPH_FORMAT_VERSION,
+        "checkpoint": checkpoint_identity(checkpoint_path),
+        "torch_version": torch.__version__,
+        "channels_last": channels_last,
+        "return_features": return_features,
+        "return_heatmap": return_heatmap,
+    }, sort_keys=True)
+
+
+def load_inference_graph(
+    checkpoint_path: Union[str, Path],
+    graph_path: Optional[Union[str, Path]] = None,
+    channels_last: bool = True,
+    return_features: bool = False,
+    return_heatmap: bool = False,
+) -> torch.jit.ScriptModule:
+    """
+    Load the frozen graph cached next to the checkpoint, rebuilding it when it
+    is missing or was built from a different checkpoint or torch version.
+    With return_features the graph returns (logits, pooled features), and
+    with return_heatmap a top-1 Grad-CAM map is appended to the outputs.
+    """
+    from src.core.model import load_model
+
+    checkpoint_path = Path(checkpoint_path)
+    graph_path = Path(graph_path) if graph_path else frozen_graph_path(checkpoint_path, return_features, return_heatmap)
+    expected = _graph_metadata(checkpoint_path, channels_last, return_features, return_heatmap)
+
+    if graph_path.exists():
+        extra_files = {"metadata.json": ""}
+        try:
+            graph = torch.jit.load(str(graph_path), map_location="cpu", _extra_files=extra_files)
+            # _extra_files comes back as bytes
+            if extra_files["metadata.json"].decode() == expected:
+                print(f"Loaded frozen inference graph: {graph_path}")
+                return graph.eval()
+            print(f"Frozen graph {graph_path.name} is stale; rebuilding...")
+        except Exception as e:
+            print(f"Warning: could not load frozen graph {graph_path} ({e}); rebuilding...")
+
+    model = load_model(checkpoint_path, device="cpu", for_inference=True)
+    model.set_return_features(return_features)
+    model.set_return_heatmap(return_heatmap)
+    graph = build_inference_graph(model, channels_last=channels_last)
+    del model
+
+    # Per-process name: workers starting together may all be rebuilding
+    tmp_path = graph_path.with_name(f"{graph_path.name}.{os.getpid()}.tmp")
+    torch.jit.save(graph, str(tmp_path), _extra_files={"metadata.json": expected})
+    tmp_path.replace(graph_path)
+    print(f"Frozen inference graph saved to: {graph_path}")
+
+    return graph.eval()
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    from src.core.model import DiseaseClassifier, save_model
+    from src.utils.benchmark import measure_latency, print_latency_table
+
+    print("Testing Inference Graph...")
+    print()
+
+    torch.manual_seed(0)
+    model = DiseaseClassifier(num_classes=38, pretrained=False, freeze_backbone=False).eval()
+    # Non-trivial BatchNorm statistics so folding is actually exercised.
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.1, 0.1)
+            module.running_var.uniform_(0.5, 1.5)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint_path = Path(tmp_dir) / "model.pth"
+        save_model(model, checkpoint_path)
+
+        print("Test 1: Building and caching the frozen graph...")
+        graph = load_inference_graph(checkpoint_path)
+        print()
+
+        print("Test 2: Reloading from the on-disk cache...")
+        cached = frozen_graph_path(checkpoint_path).stat().st_mtime_ns
+        graph = load_inference_graph(checkpoint_path)
+        # A rebuild would have rewritten the file
+        assert frozen_graph_path(checkpoint_path).stat().st_mtime_ns == cached, "cached graph was rebuilt"
+        print()
+
+        print("Test 3: Numerical equivalence with the eager model...")
+        batch = torch.randn(8, 3, 224, 224)
+        with torch.no_grad():
+            eager_logits = model(batch)
+            folded_logits = fold_for_inference(model)(batch.contiguous(memory_format=torch.channels_last))
+            frozen_logits = graph(batch.contiguous(memory_format=torch.channels_last))
+        folded_diff = (eager_logits - folded_logits).abs().max().item()
+        frozen_diff = (eager_logits - frozen_logits).abs().max().item()
+        print(f"Max abs logit difference (folded): {folded_diff:.2e}")
+        print(f"Max abs logit difference (frozen): {frozen_diff:.2e}")
+        assert torch.allclose(eager_logits, frozen_logits, atol=1e-3, rtol=1e-3), "Frozen graph diverges"
+        assert torch.equal(eager_logits.argmax(1), frozen_logits.argmax(1)), "Frozen graph changes top-1"
+        print()
+
+        print("Test 4: Latency comparison...")
+        results = {}
+        for batch_size in (1, 8):
+            batch = torch.randn(batch_size, 3, 224, 224)
+            batch_cl = batch.contiguous(memory_format=torch.channels_last)
+
+            def run_eager():
+                with torch.no_grad():
+                    model(batch)
+
+            def run_frozen():
+                with torch.no_grad():
+                    graph(batch_cl)
+
+            results[f"eager bs={batch_size}"] = measure_latency(run_eager, batch_size=batch_size)
+            results[f"frozen bs={batch_size}"] = measure_latency(run_frozen, batch_size=batch_size)
+        print_latency_table(results)
+        print()
+
+    print("All tests passed!")
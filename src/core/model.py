@@ -1,8 +1,95 @@
+import hashlib
+import json
 import torch
 import torch.nn as nn
 from torchvision import models
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from pathlib import Path
+from functools import lru_cache
+
+from src.core.backbones import (
+    build_backbone,
+    format_profile,
+    get_backbone_spec,
+    list_backbones,
+    profile_latency,
+    replace_head,
+)
+from src.core.pruning import apply_channel_widths
+from src.core.ood import OOD_TENSOR_PREFIX, load_ood_detector, pack_tensor_stats
+from src.core.tensor_checkpoint import (
+    TENSOR_CHECKPOINT_SUFFIX,
+    is_tensor_checkpoint,
+    read_tensor_file,
+    write_tensor_file,
+)
+
+
+# Families whose head consumes the global average pool of the last conv
+# stage's activations through a `backbone.avgpool` module (needed for heatmaps)
+HEATMAP_FAMILIES = ("resnet", "mobilenet", "efficientnet")
+
+
+class ActivationPool(nn.Module):
+    """
+    Wraps the backbone's global average pool. With return_activations set
+    it passes the unpooled activations along with the pooled features,
+    packed into one (N, C + C*h*w, 1, 1) tensor so the backbone's flatten
+    and the traced / frozen graphs see an ordinary tensor.
+    """
+    
+    def __init__(self, pool: nn.Module):
+        super(ActivationPool, self).__init__()
+        self.pool = pool
+        self.return_activations = False
+    
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        pooled = self.pool(x)
+        if not self.return_activations:
+            return pooled
+        return torch.cat([pooled.flatten(1), x.flatten(1)], dim=1)[:, :, None, None]
+
+
+class ClassifierHead(nn.Sequential):
+    """
+    The MLP head. With return_features set it also returns its input, the
+    pooled backbone features, so one forward pass yields both. With
+    return_heatmap set (input packed by ActivationPool) it also returns a
+    Grad-CAM map of the top-1 class, (N, h*w). Being a Sequential keeps
+    checkpoint keys unchanged.
+    """
+    
+    def __init__(self, *layers: nn.Module):
+        super(ClassifierHead, self).__init__(*layers)
+        self.return_features = False
+        self.return_heatmap = False
+    
+    def forward(self, x: torch.Tensor):
+        if not self.return_heatmap:
+            logits = super(ClassifierHead, self).forward(x)
+            if self.return_features:
+                return logits, x
+            return logits
+        
+        num_features = self[0].in_features
+        features = x[:, :num_features]
+        activations = x[:, num_features:].unflatten(1, (num_features, -1))
+        
+        hidden = self[1](self[0](features))
+        logits = self[3](self[2](hidden))
+        
+        # Grad-CAM without a backward pass: the pool is a mean, so the
+        # spatially averaged gradient of the top-1 logit w.r.t. the
+        # activations is its gradient w.r.t. the pooled features (up to the
+        # constant 1/(h*w)), which for Linear-ReLU-Linear is W1^T (W2[c] * relu').
+        top1 = logits.argmax(dim=1)
+        hidden_grad = self[3].weight[top1] * (hidden > 0).to(hidden.dtype)
+        channel_weights = hidden_grad @ self[0].weight
+        heatmap = torch.relu(torch.einsum("nc,ncp->np", channel_weights, activations))
+        
+        if self.return_features:
+            return logits, features, heatmap
+        return logits, heatmap
 
 
 class DiseaseClassifier(nn.Module):
@@ -13,36 +100,74 @@ class DiseaseClassifier(nn.Module):
         pretrained: bool = True,
         freeze_backbone: bool = True,
         hidden_units: int = 512,
-        dropout_rate: float = 0.5
+        dropout_rate: float = 0.5,
+        backbone: str = "resnet50"
     ):
         super(DiseaseClassifier, self).__init__()
         
         self.num_classes = num_classes
         self.hidden_units = hidden_units
         self.dropout_rate = dropout_rate
+        self.backbone_name = backbone
+        # Measured CPU cost, filled in by save_model / load_model
+        self.latency_profile: Optional[Dict] = None
+        # Inner widths of residual blocks after channel pruning (src/core/pruning.py)
+        self.channel_widths: Optional[Dict[str, List[int]]] = None
         
-        if pretrained:
-            weights = models.ResNet50_Weights.DEFAULT
-            self.backbone = models.resnet50(weights=weights)
-        else:
-            self.backbone = models.resnet50(weights=None)
+        self.backbone, head_path, num_features = build_backbone(backbone, pretrained=pretrained)
+        self.feature_dim = num_features
         
         if freeze_backbone:
             for param in self.backbone.parameters():
                 param.requires_grad = False
         
-        num_features = self.backbone.fc.in_features
-        
-        self.backbone.fc = nn.Sequential(
+        # Every registered backbone returns its head's output unchanged, so
+        # whatever the head returns is what forward returns.
+        self.head_path = head_path
+        replace_head(self.backbone, head_path, ClassifierHead(
             nn.Linear(num_features, hidden_units),
             nn.ReLU(inplace=True),
             nn.Dropout(p=dropout_rate),
             nn.Linear(hidden_units, num_classes)
-        )
+        ))
     
-    def forward(self, x: torch.Tensor) -> torch.Tensor:
+    def forward(self, x: torch.Tensor):
         return self.backbone(x)
     
+    def set_return_features(self, enabled: bool = True) -> "DiseaseClassifier":
+        """Make forward return (logits, pooled features) instead of logits."""
+        self.backbone.get_submodule(self.head_path).return_features = enabled
+        return self
+    
+    def set_return_heatmap(self, enabled: bool = True) -> "DiseaseClassifier":
+        """
+        Append a top-1 Grad-CAM map, (N, h*w) over the last conv stage, to
+        forward's outputs: (logits, [features,] heatmap).
+        """
+        pool = getattr(self.backbone, "avgpool", None)
+        if get_backbone_spec(self.backbone_name)["family"] not in HEATMAP_FAMILIES or pool is None:
+            if enabled:
+                raise ValueError(f"Heatmaps are not supported for the {self.backbone_name} backbone.")
+            return self
+        if not isinstance(pool, ActivationPool):
+            pool = self.backbone.avgpool = ActivationPool(pool)
+        pool.return_activations = enabled
+        self.backbone.get_submodule(self.head_path).return_heatmap = enabled
+        return self
+    
+    def get_model_config(self) -> Dict:
+        config = {
+            "backbone": self.backbone_name,
+            "num_classes": self.num_classes,
+            "hidden_units": self.hidden_units,
+            "dropout_rate": self.dropout_rate
+        }
+        if self.latency_profile is not None:
+            config["latency_profile"] = self.latency_profile
+        if self.channel_widths is not None:
+            config["channel_widths"] = self.channel_widths
+        return config
+    
     def get_trainable_parameters(self) -> int:
         return sum(p.numel() for p in self.parameters() if p.requires_grad)
     
@@ -57,7 +182,7 @@ class DiseaseClassifier(nn.Module):
         print("=" * 70)
         print("MODEL ARCHITECTURE SUMMARY")
         print("=" * 70)
-        print(f"Model: Disease Classifier (ResNet50 Backbone)")
+        print(f"Model: Disease Classifier ({self.backbone_name} backbone)")
         print(f"Number of Classes: {self.num_classes}")
         print(f"Hidden Units: {self.hidden_units}")
         print(f"Dropout Rate: {self.dropout_rate}")
@@ -75,14 +200,16 @@ def create_model(
     freeze_backbone: bool = True,
     hidden_units: int = 512,
     dropout_rate: float = 0.5,
-    device: str = "cuda"
+    device: str = "cuda",
+    backbone: str = "resnet50"
 ) -> DiseaseClassifier:
     model = DiseaseClassifier(
         num_classes=num_classes,
         pretrained=pretrained,
         freeze_backbone=freeze_backbone,
         hidden_units=hidden_units,
-        dropout_rate=dropout_rate
+        dropout_rate=dropout_rate,
+        backbone=backbone
     )
     
     model = model.to(device)
@@ -97,15 +224,19 @@ def save_model(
     save_path: Path,
     epoch: Optional[int] = None,
     optimizer_state: Optional[Dict] = None,
-    metrics: Optional[Dict] = None
+    metrics: Optional[Dict] = None,
+    record_latency: bool = False
 ):
+    # With record_latency the checkpoint documents its own serving cost.
+    # It takes seconds of timed CPU passes, so only the final save of a
+    # training run asks for it, not intermediate or test saves.
+    if record_latency:
+        model.latency_profile = profile_latency(model)
+        print(f"CPU latency profile: {format_profile(model.latency_profile)}")
+    
     checkpoint = {
         "model_state_dict": model.state_dict(),
-        "model_config": {
-            "num_classes": model.num_classes,
-            "hidden_units": model.hidden_units,
-            "dropout_rate": model.dropout_rate
-        }
+        "model_config": model.get_model_config()
     }
     
     if epoch is not None:
@@ -124,6 +255,172 @@ def save_model(
     print(f"Model saved successfully to: {save_path}")
 
 
+def build_model_from_config(config: Dict) -> DiseaseClassifier:
+    # Checkpoints written before the backbone was recorded are all ResNet50.
+    model = DiseaseClassifier(
+        num_classes=config["num_classes"],
+        pretrained=False,
+        freeze_backbone=False,
+        hidden_units=config.get("hidden_units", 512),
+        dropout_rate=config.get("dropout_rate", 0.5),
+        backbone=config.get("backbone", "resnet50"),
+    )
+    if config.get("channel_widths"):
+        apply_channel_widths(model, config["channel_widths"])
+    model.latency_profile = config.get("latency_profile")
+    return model
+
+
+def _infer_config_from_state_dict(sd: dict) -> Dict:
+    hidden_units = 512
+    num_classes = None
+
+    candidate_final_keys = [
+        "backbone.fc.3.weight",
+        "network.fc.3.weight",
+        "fc.3.weight",
+        "backbone.fc.weight",
+        "network.fc.weight",
+        "fc.weight",
+    ]
+    for k in candidate_final_keys:
+        if k in sd and sd[k].ndim == 2:
+            num_classes = sd[k].shape[0]
+            break
+
+    candidate_hidden_keys = [
+        "backbone.fc.0.weight",
+        "network.fc.0.weight",
+        "fc.0.weight",
+    ]
+    for k in candidate_hidden_keys:
+        if k in sd and sd[k].ndim == 2:
+            hidden_units = sd[k].shape[0]
+            break
+
+    if num_classes is None:
+        print("Warning: Could not infer number of classes from state_dict; defaulting to 38.")
+        num_classes = 38
+
+    return {"num_classes": int(num_classes), "hidden_units": int(hidden_units), "dropout_rate": 0.5}
+
+
+def _load_tensor_checkpoint(
+    load_path: Path,
+    device: str,
+    for_inference: bool
+) -> DiseaseClassifier:
+    # The module is built on the meta device and adopts the mapped tensors
+    # (assign=True), so the weights are never allocated twice.
+    state_dict, metadata = read_tensor_file(load_path)
+    # OOD statistics stored alongside the weights (src/core/ood.py)
+    state_dict = {name: t for name, t in state_dict.items() if not name.startswith(OOD_TENSOR_PREFIX)}
+    
+    if "model_config" in metadata:
+        config = json.loads(metadata["model_config"])
+    else:
+        config = _infer_config_from_state_dict(state_dict)
+        print("Warning: Model configuration not found; inferred from weights.")
+    
+    with torch.device("meta"):
+        model = build_model_from_config(config)
+    model.load_state_dict(state_dict, strict=True, assign=True)
+    
+    model = model.to(device)
+    
+    if for_inference:
+        model.eval()
+    
+    print(f"Model loaded successfully from: {load_path}")
+    
+    if model.latency_profile:
+        print(f"Backbone: {model.backbone_name} | {format_profile(model.latency_profile)}")
+    
+    if "epoch" in metadata:
+        print(f"Trained for {metadata['epoch']} epochs")
+    
+    if "metrics" in metadata:
+        print(f"Metrics: {json.loads(metadata['metrics'])}")
+    
+    return model
+
+
+def convert_checkpoint(
+    load_path: Path,
+    save_path: Optional[Path] = None
+) -> Path:
+    """
+    Rewrite any checkpoint load_model accepts as a tensor-only, memory-mappable
+    file. Optimizer state is dropped; the model config, epoch and metrics are
+    kept as header metadata, and OOD statistics are carried over.
+    """
+    load_path = Path(load_path)
+    if save_path is None:
+        save_path = load_path.with_suffix(TENSOR_CHECKPOINT_SUFFIX)
+    save_path = Path(save_path)
+    
+    model = load_model(load_path, device="cpu", for_inference=True)
+    
+    metadata = {
+        "model_config": json.dumps(model.get_model_config()),
+        "source": load_path.name,
+    }
+    if not is_tensor_checkpoint(load_path):
+        checkpoint = torch.load(load_path, map_location="cpu", mmap=True)
+        if isinstance(checkpoint, dict):
+            if "epoch" in checkpoint:
+                metadata["epoch"] = str(checkpoint["epoch"])
+            if "metrics" in checkpoint:
+                metadata["metrics"] = json.dumps(checkpoint["metrics"])
+    
+    tensors = model.state_dict()
+    detector = load_ood_detector(load_path)
+    if detector is not None:
+        ood_tensors, ood_metadata = pack_tensor_stats(detector)
+        tensors.update(ood_tensors)
+        metadata.update(ood_metadata)
+    
+    write_tensor_file(tensors, save_path, metadata=metadata)
+    
+    print(f"Tensor checkpoint saved to: {save_path}")
+    
+    return save_path
+
+
+def weights_fingerprint(checkpoint_path: Path) -> str:
+    """
+    Hash of the weight tensors alone (names, dtypes, shapes, values). Unlike
+    checkpoint_identity it survives copying or redeploying the file,
+    converting it to .safetensors and rewriting it with OOD statistics.
+    """
+    from src.core.cache import checkpoint_identity
+
+    checkpoint_path = Path(checkpoint_path)
+    # ctime too: cp -p / os.utime can restore mtime and size, never ctime
+    identity = f"{checkpoint_identity(checkpoint_path)}:{checkpoint_path.stat().st_ctime_ns}"
+    return _weights_fingerprint(checkpoint_path, identity)
+
+
+@lru_cache(maxsize=8)
+def _weights_fingerprint(checkpoint_path: Path, identity: str) -> str:
+    # identity is only part of the cache key: a rewritten file is hashed again
+    if is_tensor_checkpoint(checkpoint_path):
+        state_dict, _ = read_tensor_file(checkpoint_path)
+    else:
+        checkpoint = torch.load(checkpoint_path, map_location="cpu")
+        state_dict = checkpoint.get("model_state_dict", checkpoint)
+
+    digest = hashlib.blake2b(digest_size=8)
+    for name in sorted(state_dict):
+        tensor = state_dict[name]
+        if name.startswith(OOD_TENSOR_PREFIX) or not isinstance(tensor, torch.Tensor):
+            continue
+        tensor = tensor.detach().to("cpu").contiguous()
+        digest.update(f"{name}:{tensor.dtype}:{tuple(tensor.shape)};".encode())
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy())
+    return digest.hexdigest()
+
+
 def load_model(
     load_path: Path,
     device: str = "cuda",
@@ -132,54 +429,18 @@ def load_model(
     if not load_path.exists():
         raise FileNotFoundError(f"Model file not found: {load_path}")
     
+    if is_tensor_checkpoint(load_path):
+        return _load_tensor_checkpoint(load_path, device, for_inference)
+    
     checkpoint = torch.load(load_path, map_location=device)
 
-    def _infer_config_from_state_dict(sd: dict) -> Dict:
-        hidden_units = 512
-        num_classes = None
-
-        candidate_final_keys = [
-            "backbone.fc.3.weight",
-            "network.fc.3.weight",
-            "fc.3.weight",
-            "backbone.fc.weight",
-            "network.fc.weight",
-            "fc.weight",
-        ]
-        for k in candidate_final_keys:
-            if k in sd and sd[k].ndim == 2:
-                num_classes = sd[k].shape[0]
-                break
-
-        candidate_hidden_keys = [
-            "backbone.fc.0.weight",
-            "network.fc.0.weight",
-            "fc.0.weight",
-        ]
-        for k in candidate_hidden_keys:
-            if k in sd and sd[k].ndim == 2:
-                hidden_units = sd[k].shape[0]
-                break
-
-        if num_classes is None:
-            print("Warning: Could not infer number of classes from state_dict; defaulting to 38.")
-            num_classes = 38
-
-        return {"num_classes": int(num_classes), "hidden_units": int(hidden_units), "dropout_rate": 0.5}
-
     if isinstance(checkpoint, dict) and "model_state_dict" in checkpoint:
         config = checkpoint.get("model_config", {})
         if not config:
             config = _infer_config_from_state_dict(checkpoint["model_state_dict"]) 
             print("Warning: Model configuration not found; inferred from weights.")
 
-        model = DiseaseClassifier(
-            num_classes=config["num_classes"],
-            pretrained=False,
-            freeze_backbone=False,
-            hidden_units=config.get("hidden_units", 512),
-            dropout_rate=config.get("dropout_rate", 0.5),
-        )
+        model = build_model_from_config(config)
 
         model.load_state_dict(checkpoint["model_state_dict"], strict=True)
 
@@ -199,13 +460,7 @@ def load_model(
 
         config = _infer_config_from_state_dict(normalized_sd)
 
-        model = DiseaseClassifier(
-            num_classes=config["num_classes"],
-            pretrained=False,
-            freeze_backbone=False,
-            hidden_units=config.get("hidden_units", 512),
-            dropout_rate=config.get("dropout_rate", 0.5),
-        )
+        model = build_model_from_config(config)
 
         missing, unexpected = model.load_state_dict(normalized_sd, strict=False)
         if missing:
@@ -223,6 +478,9 @@ def load_model(
     
     print(f"Model loaded successfully from: {load_path}")
     
+    if model.latency_profile:
+        print(f"Backbone: {model.backbone_name} | {format_profile(model.latency_profile)}")
+    
     if "epoch" in checkpoint:
         print(f"Trained for {checkpoint['epoch']} epochs")
     
@@ -250,10 +508,50 @@ if __name__ == "__main__":
     
     print("Test 3: Testing save and load...")
     test_path = Path("test_model.pth")
-    save_model(model, test_path)
+    save_model(model, test_path, record_latency=True)
     loaded_model = load_model(test_path, device="cpu")
     test_path.unlink()
+    assert loaded_model.latency_profile == model.latency_profile, "Latency profile not stored in the checkpoint"
     print("Save and load successful!")
     print()
     
+    print("Test 4: Save and load for every registered backbone...")
+    for backbone in list_backbones():
+        model = DiseaseClassifier(num_classes=38, pretrained=False, freeze_backbone=False, backbone=backbone).eval()
+        save_model(model, test_path)
+        loaded_model = load_model(test_path, device="cpu")
+        test_path.unlink()
+        assert loaded_model.backbone_name == backbone
+        with torch.no_grad():
+            assert torch.equal(model(dummy_input), loaded_model(dummy_input))
+        print(f"{backbone}: {model.get_total_parameters():,} parameters")
+    print()
+
+    print("Test 5: Forward-pass heatmaps match autograd Grad-CAM...")
+    for backbone in ("resnet50", "mobilenet_v3_large", "efficientnet_b0"):
+        model = DiseaseClassifier(num_classes=38, pretrained=False, freeze_backbone=False, backbone=backbone).eval()
+        head = model.backbone.get_submodule(model.head_path)
+
+        captured = {}
+        hook = model.backbone.avgpool.register_forward_hook(lambda m, inputs, output: captured.update(a=inputs[0]))
+        with torch.no_grad():
+            logits = model(dummy_input)
+        hook.remove()
+        activations = captured["a"].detach().requires_grad_(True)
+        reference_logits = head(activations.mean(dim=(2, 3)))
+        reference_logits.gather(1, reference_logits.argmax(1, keepdim=True)).sum().backward()
+        channel_weights = activations.grad.mean(dim=(2, 3))
+        reference = torch.relu((channel_weights[:, :, None, None] * activations).sum(1)).flatten(1).detach()
+
+        model.set_return_heatmap(True)
+        with torch.no_grad():
+            heatmap_logits, heatmap = model(dummy_input)
+        model.set_return_heatmap(False)
+
+        diff = (heatmap / heatmap.amax(1, keepdim=True) - reference / reference.amax(1, keepdim=True)).abs().max().item()
+        print(f"{backbone}: heatmap {tuple(heatmap.shape)}, max abs difference {diff:.2e}")
+        assert torch.equal(logits, heatmap_logits), "Heatmaps changed the logits"
+        assert diff < 1e-4, "Heatmap diverges from Grad-CAM"
+    print()
+
     print("All tests passed!")
@@ -0,0 +1,216 @@
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from src.utils.file_lock import exclusive_lock
+
+
+ONNX_OPSET = 17
+
+
+def export_onnx(
+    model: nn.Module,
+    onnx_path: Union[str, Path],
+    image_size=(224, 224),
+    opset_version: int = ONNX_OPSET,
+    metadata: Optional[Dict[str, str]] = None,
+) -> Path:
+    onnx_path = Path(onnx_path)
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+
+    model = model.to("cpu").eval()
+    dummy_input = torch.randn(1, 3, *image_size)
+
+    tmp_path = onnx_path.with_suffix(onnx_path.suffix + ".tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            dummy_input,
+            str(tmp_path),
+            input_names=["input"],
+            output_names=["logits"],
+            dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=opset_version,
+            do_constant_folding=True,
+        )
+    if metadata:
+        import onnx
+
+        # Weights stay in the external .data file; only the graph is rewritten
+        graph = onnx.load(str(tmp_path), load_external_data=False)
+        onnx.helper.set_model_props(graph, metadata)
+        onnx.save(graph, str(tmp_path))
+    # Rename only once the export is complete so a crashed export never
+    # leaves a truncated graph that later startups would pick up.
+    tmp_path.replace(onnx_path)
+
+    print(f"ONNX model exported to: {onnx_path}")
+    return onnx_path
+
+
+def onnx_metadata(checkpoint_path: Path) -> Dict[str, str]:
+    from src.core.model import weights_fingerprint
+
+    return {"source_checkpoint": checkpoint_path.name, "weights": weights_fingerprint(checkpoint_path)}
+
+
+def onnx_is_stale(onnx_path: Path, checkpoint_path: Path) -> bool:
+    """
+    True unless the graph was exported from the checkpoint's current
+    weights. mtimes are not enough: a rollback with cp -p, rsync -a or a
+    restored backup keeps the older checkpoint's timestamp.
+    """
+    if not onnx_path.exists():
+        return True
+    import onnx
+
+    graph = onnx.load(str(onnx_path), load_external_data=False)
+    recorded = {prop.key: prop.value for prop in graph.metadata_props}
+    return recorded.get("weights") != onnx_metadata(checkpoint_path)["weights"]
+
+
+class OnnxClassifier:
+    """ONNX Runtime session exposed with the same call signature as DiseaseClassifier."""
+
+    def __init__(self, onnx_path: Union[str, Path], num_threads: Optional[int] = None):
+        import onnxruntime as ort
+
+        self.onnx_path = Path(onnx_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        self.session = ort.InferenceSession(
+            str(self.onnx_path),
+            sess_options=options,
+            providers=["CPUExecutionProvider"],
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        inputs = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+        logits = self.session.run(None, {self.input_name: inputs})[0]
+        return torch.from_numpy(logits)
+
+    def eval(self) -> "OnnxClassifier":
+        return self
+
+
+def load_onnx_model(
+    checkpoint_path: Union[str, Path],
+    onnx_path: Optional[Union[str, Path]] = None,
+    num_threads: Optional[int] = None,
+) -> OnnxClassifier:
+    from src.core.model import load_model
+
+    checkpoint_path = Path(checkpoint_path)
+    onnx_path = Path(onnx_path) if onnx_path else checkpoint_path.with_suffix(".onnx")
+
+    if onnx_is_stale(onnx_path, checkpoint_path):
+        # Workers starting together export once: the first to take the lock
+        # writes the graph (and its .tmp files), the others then find it fresh
+        with exclusive_lock(onnx_path.with_name(f"{onnx_path.name}.lock")):
+            if onnx_is_stale(onnx_path, checkpoint_path):
+                print(f"Exporting {checkpoint_path.name} to ONNX...")
+                model = load_model(checkpoint_path, device="cpu", for_inference=True)
+                export_onnx(model, onnx_path, metadata=onnx_metadata(checkpoint_path))
+                del model
+
+    return OnnxClassifier(onnx_path, num_threads=num_threads)
+
+
+def check_parity(
+    torch_model: nn.Module,
+    onnx_model: OnnxClassifier,
+    batch: torch.Tensor,
+) -> Dict[str, float]:
+    with torch.no_grad():
+        torch_logits = torch_model(batch)
+    onnx_logits = onnx_model(batch)
+
+    torch_probs = torch.softmax(torch_logits, dim=1)
+    onnx_probs = torch.softmax(onnx_logits, dim=1)
+
+    return {
+        "max_abs_logit_diff": (torch_logits - onnx_logits).abs().max().item(),
+        "max_abs_prob_diff": (torch_probs - onnx_probs).abs().max().item(),
+        "top1_agreement": (torch_logits.argmax(1) == onnx_logits.argmax(1)).float().mean().item(),
+    }
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+    import tempfile
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    from config import config
+    from src.core.model import DiseaseClassifier, load_model, save_model
+    from src.utils.benchmark import measure_latency, print_latency_table
+
+    print("Testing ONNX Backend...")
+    print()
+
+    print("Test 1: Loading torch model...")
+    if config.MODEL_SAVE_PATH.exists():
+        model = load_model(config.MODEL_SAVE_PATH, device="cpu")
+    else:
+        print("No trained checkpoint found, using randomly initialised weights.")
+        model = DiseaseClassifier(num_classes=38, pretrained=False, freeze_backbone=False).eval()
+    print()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print("Test 2: Exporting to ONNX...")
+        onnx_path = export_onnx(model, Path(tmp_dir) / "model.onnx")
+        onnx_model = OnnxClassifier(onnx_path)
+        print()
+
+        print("Test 3: Parity check against torch backend...")
+        batch = torch.randn(8, 3, 224, 224)
+        parity = check_parity(model, onnx_model, batch)
+        for key, value in parity.items():
+            print(f"  {key}: {value:.6f}")
+        assert parity["max_abs_prob_diff"] < 1e-3, "ONNX probabilities diverge from torch"
+        assert parity["top1_agreement"] == 1.0, "ONNX top-1 predictions differ from torch"
+        print()
+
+        print("Test 4: Latency comparison...")
+        results = {}
+        for batch_size in (1, 8):
+            batch = torch.randn(batch_size, 3, 224, 224)
+
+            def run_torch():
+                with torch.no_grad():
+                    model(batch)
+
+            results[f"torch bs={batch_size}"] = measure_latency(run_torch, batch_size=batch_size)
+            results[f"onnx bs={batch_size}"] = measure_latency(lambda: onnx_model(batch), batch_size=batch_size)
+        print_latency_table(results)
+        print()
+
+        print("Test 5: A rollback that keeps the old mtime is re-exported...")
+        checkpoint_path = Path(tmp_dir) / "ckpt" / "model.pth"
+        save_model(model, checkpoint_path)
+        exported = load_onnx_model(checkpoint_path)
+        assert not onnx_is_stale(exported.onnx_path, checkpoint_path)
+        stamp = checkpoint_path.stat().st_mtime_ns
+        with torch.no_grad():
+            next(model.parameters()).add_(1.0)
+        save_model(model, checkpoint_path)
+        os.utime(checkpoint_path, ns=(stamp, stamp))
+        assert exported.onnx_path.stat().st_mtime_ns > checkpoint_path.stat().st_mtime_ns
+        assert onnx_is_stale(exported.onnx_path, checkpoint_path), "Graph from other weights counted as fresh"
+        reloaded = load_onnx_model(checkpoint_path)
+        parity = check_parity(model, reloaded, torch.randn(2, 3, 224, 224))
+        assert parity["max_abs_prob_diff"] < 1e-3, "Re-export still serves the old weights"
+        print()
+
+    print("All tests passed!")
@@ -0,0 +1,340 @@
+import json
+import math
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset, random_split
+
+from src.core.dataset import PlantDiseaseDataset, get_val_transforms
+from src.core.tensor_checkpoint import is_tensor_checkpoint, read_tensor_file, write_tensor_file
+
+
+# Fraction of held-out plant images the calibrated threshold accepts
+OOD_TPR = 0.95
+# Weight of the scaled identity mixed into the shared covariance: pooled ReLU
+# features are far from full rank, so the raw inverse would be dominated by
+# directions the training set never varied in.
+OOD_SHRINKAGE = 0.1
+
+# Where the statistics live inside a checkpoint: a dict entry in .pth files,
+# tensors under this prefix plus a JSON header entry in tensor checkpoints
+OOD_CHECKPOINT_KEY = "ood_stats"
+OOD_TENSOR_PREFIX = "ood."
+
+REASON_OUT_OF_DISTRIBUTION = "Image does not resemble the plant leaf photos the model was trained on. Please upload a photo of a plant leaf."
+
+
+class OODDetector:
+    """
+    Out-of-distribution score on the classifier's pooled penultimate
+    features: the squared Mahalanobis distance to the nearest class mean
+    under a shared (tied) covariance, divided by the feature dimension so
+    training images score around 1. Features are whitened once, after which
+    the distance to every class mean is one matrix product.
+    """
+
+    def __init__(
+        self,
+        center: torch.Tensor,
+        whitening: torch.Tensor,
+        means: torch.Tensor,
+        threshold: float = math.inf,
+        info: Optional[Dict] = None,
+    ):
+        self.center = center.float()
+        self.whitening = whitening.float()
+        self.means = means.float()
+        self.threshold = float(threshold)
+        self.info = dict(info or {})
+        self.feature_dim = self.whitening.shape[0]
+        self._mean_sq = (self.means * self.means).sum(dim=1)
+
+    def to(self, device: Union[str, torch.device]) -> "OODDetector":
+        return OODDetector(
+            self.center.to(device), self.whitening.to(device), self.means.to(device), self.threshold, self.info
+        )
+
+    def score(self, features: torch.Tensor) -> torch.Tensor:
+        """(N, D) features -> (N,) scores; higher is further from every class."""
+        z = (features.float() - self.center) @ self.whitening
+        distances = (z * z).sum(dim=1, keepdim=True) - 2.0 * z @ self.means.T + self._mean_sq
+        return distances.min(dim=1).values.clamp_min(0.0) / self.feature_dim
+
+    def calibrate(self, scores: np.ndarray, tpr: float = OOD_TPR) -> float:
+        """Set the threshold so a fraction tpr of the given in-distribution scores pass."""
+        if not 0 < tpr <= 1:
+            raise ValueError(f"tpr must be in (0, 1], got {tpr}")
+        self.threshold = float(np.quantile(np.asarray(scores, dtype=np.float64), tpr))
+        self.info["tpr"] = tpr
+        return self.threshold
+
+    def to_stats(self) -> Dict:
+        return {
+            "center": self.center.cpu(),
+            "whitening": self.whitening.cpu(),
+            "means": self.means.cpu(),
+            "threshold": self.threshold,
+            "info": self.info,
+        }
+
+    @classmethod
+    def from_stats(cls, stats: Dict) -> "OODDetector":
+        return cls(stats["center"], stats["whitening"], stats["means"], stats["threshold"], stats.get("info"))
+
+
+class ClassStatistics:
+    """
+    Streaming per-class means and shared within-class covariance of feature
+    vectors, accumulated in float64 so a whole training split can be fed
+    through in batches.
+    """
+
+    def __init__(self, num_classes: int, feature_dim: int):
+        self.num_classes = num_classes
+        self.feature_dim = feature_dim
+        self.counts = np.zeros(num_classes, dtype=np.int64)
+        self.sums = np.zeros((num_classes, feature_dim), dtype=np.float64)
+        self.scatter = np.zeros((feature_dim, feature_dim), dtype=np.float64)
+        # Everything is accumulated relative to the first batch's mean to
+        # limit cancellation when the class means are subtracted at the end.
+        self.shift: Optional[np.ndarray] = None
+
+    def update(self, features: np.ndarray, labels: np.ndarray):
+        features = np.asarray(features, dtype=np.float64)
+        labels = np.asarray(labels, dtype=np.int64)
+        if self.shift is None:
+            self.shift = features.mean(axis=0)
+        x = features - self.shift
+        np.add.at(self.sums, labels, x)
+        self.counts += np.bincount(labels, minlength=self.num_classes)
+        self.scatter += x.T @ x
+
+    def fit(self, shrinkage: float = OOD_SHRINKAGE) -> OODDetector:
+        seen = np.flatnonzero(self.counts)
+        if seen.size < 2 or self.counts.sum() <= seen.size:
+            raise ValueError("Need images of at least two classes (and more images than classes) to fit OOD statistics.")
+
+        counts = self.counts[seen].astype(np.float64)
+        means = self.sums[seen] / counts[:, None]
+        within = self.scatter - (means * counts[:, None]).T @ means
+        covariance = within / (counts.sum() - seen.size)
+
+        scale = np.trace(covariance) / self.feature_dim
+        covariance = (1.0 - shrinkage) * covariance + shrinkage * scale * np.eye(self.feature_dim)
+        eigenvalues, eigenvectors = np.linalg.eigh(covariance)
+        whitening = eigenvectors / np.sqrt(np.maximum(eigenvalues, 1e-12 * scale))
+
+        center = means.T @ counts / counts.sum()
+        whitened_means = (means - center) @ whitening
+
+        info = {
+            "num_images": int(counts.sum()),
+            "num_classes": int(seen.size),
+            "feature_dim": self.feature_dim,
+            "shrinkage": shrinkage,
+        }
+        return OODDetector(
+            torch.from_numpy(center + self.shift),
+            torch.from_numpy(whitening),
+            torch.from_numpy(whitened_means),
+            info=info,
+        )
+
+
+def roc_auc(in_scores: np.ndarray, out_scores: np.ndarray) -> float:
+    """Probability that an out-of-distribution image scores above an in-distribution one (ties count half)."""
+    in_sorted = np.sort(np.asarray(in_scores, dtype=np.float64))
+    out_scores = np.asarray(out_scores, dtype=np.float64)
+    below = np.searchsorted(in_sorted, out_scores, side="left")
+    ties = np.searchsorted(in_sorted, out_scores, side="right") - below
+    return float((below + 0.5 * ties).sum() / (in_sorted.size * out_scores.size))
+
+
+def pack_tensor_stats(detector: OODDetector) -> Tuple[Dict[str, torch.Tensor], Dict[str, str]]:
+    """The detector as extra tensors and header metadata for a tensor checkpoint."""
+    stats = detector.to_stats()
+    tensors = {OOD_TENSOR_PREFIX + name: stats[name] for name in ("center", "whitening", "means")}
+    metadata = {OOD_CHECKPOINT_KEY: json.dumps({"threshold": stats["threshold"], "info": stats["info"]})}
+    return tensors, metadata
+
+
+def save_ood_stats(checkpoint_path: Union[str, Path], detector: OODDetector):
+    """Store the detector inside the checkpoint it was fitted on, replacing any previous statistics."""
+    checkpoint_path = Path(checkpoint_path)
+
+    if is_tensor_checkpoint(checkpoint_path):
+        tensors, metadata = read_tensor_file(checkpoint_path)
+        tensors = {name: t for name, t in tensors.items() if not name.startswith(OOD_TENSOR_PREFIX)}
+        ood_tensors, ood_metadata = pack_tensor_stats(detector)
+        tensors.update(ood_tensors)
+        metadata.update(ood_metadata)
+        write_tensor_file(tensors, checkpoint_path, metadata=metadata)
+        return
+
+    checkpoint = torch.load(checkpoint_path, map_location="cpu")
+    if not (isinstance(checkpoint, dict) and "model_state_dict" in checkpoint):
+        raise ValueError(
+            f"{checkpoint_path} is a bare state_dict; re-save it with save_model or convert_checkpoint first."
+        )
+    checkpoint[OOD_CHECKPOINT_KEY] = detector.to_stats()
+    tmp_path = checkpoint_path.with_name(f"{checkpoint_path.name}.ood.tmp")
+    torch.save(checkpoint, tmp_path)
+    tmp_path.replace(checkpoint_path)
+
+
+def load_ood_detector(checkpoint_path: Union[str, Path]) -> Optional[OODDetector]:
+    """The detector stored in a checkpoint by save_ood_stats, or None if it has none."""
+    checkpoint_path = Path(checkpoint_path)
+    if is_tensor_checkpoint(checkpoint_path):
+        tensors, metadata = read_tensor_file(checkpoint_path)
+        if OOD_CHECKPOINT_KEY not in metadata:
+            return None
+        stats = json.loads(metadata[OOD_CHECKPOINT_KEY])
+        for name in ("center", "whitening", "means"):
+            stats[name] = tensors[OOD_TENSOR_PREFIX + name].clone()
+        return OODDetector.from_stats(stats)
+
+    checkpoint = torch.load(checkpoint_path, map_location="cpu", mmap=True)
+    if not isinstance(checkpoint, dict) or OOD_CHECKPOINT_KEY not in checkpoint:
+        return None
+    return OODDetector.from_stats(checkpoint[OOD_CHECKPOINT_KEY])
+
+
+def get_ood_loaders(
+    data_directories: List[Path],
+    batch_size: int = 32,
+    train_split: float = 0.8,
+    num_workers: int = 4,
+    max_images: Optional[int] = None,
+    seed: int = 42,
+) -> Tuple[DataLoader, DataLoader, PlantDiseaseDataset]:
+    """
+    The training and validation splits of create_dataloaders, both with the
+    validation transforms: statistics are fitted on the former and the
+    threshold calibrated on the latter. max_images caps each split with an
+    evenly spaced subset.
+    """
+    dataset = PlantDiseaseDataset(
+        data_directories=data_directories,
+        transform=get_val_transforms()
+    )
+
+    total_size = len(dataset)
+    train_size = int(train_split * total_size)
+    train_dataset, val_dataset = random_split(
+        dataset,
+        [train_size, total_size - train_size],
+        generator=torch.Generator().manual_seed(seed)
+    )
+
+    loaders = []
+    for split in (train_dataset, val_dataset):
+        indices = list(split.indices)
+        if max_images is not None and len(indices) > max_images:
+            indices = [indices[i] for i in np.linspace(0, len(indices) - 1, max_images).round().astype(int)]
+        loaders.append(DataLoader(Subset(dataset, indices), batch_size=batch_size, shuffle=False, num_workers=num_workers))
+
+    print(f"Fit images: {len(loaders[0].dataset):,}")
+    print(f"Calibration images: {len(loaders[1].dataset):,}")
+
+    return loaders[0], loaders[1], dataset
+
+
+def extract_features(
+    model: torch.nn.Module,
+    loader: DataLoader,
+    device: Union[str, torch.device] = "cpu",
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """(features, labels) per batch, from a model with return_features set."""
+    with torch.no_grad():
+        for images, labels in loader:
+            _, features = model(images.to(device))
+            yield features.float().cpu().numpy(), np.asarray(labels)
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    import time
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    from src.core.model import DiseaseClassifier, convert_checkpoint, load_model, save_model
+
+    print("Testing OOD Detector...")
+    print()
+
+    rng = np.random.default_rng(0)
+    num_classes, dim = 10, 256
+    # Low-rank, anisotropic class clusters, like pooled CNN features
+    basis = rng.normal(size=(32, dim))
+    class_means = rng.normal(size=(num_classes, 32)) * 3
+
+    def sample(labels: np.ndarray) -> np.ndarray:
+        latent = class_means[labels] + rng.normal(size=(labels.size, 32))
+        return np.maximum(latent @ basis + 0.1 * rng.normal(size=(labels.size, dim)), 0)
+
+    print("Test 1: Streaming statistics match a direct fit...")
+    labels = rng.integers(0, num_classes, 4000)
+    features = sample(labels)
+    stats = ClassStatistics(num_classes, dim)
+    for start in range(0, len(labels), 512):
+        stats.update(features[start:start + 512], labels[start:start + 512])
+    detector = stats.fit(shrinkage=0.0)
+    means = np.stack([features[labels == c].mean(axis=0) for c in range(num_classes)])
+    residual = features - means[labels]
+    covariance = residual.T @ residual / (len(labels) - num_classes)
+    precision = np.linalg.pinv(covariance)
+    probe = sample(np.array([3]))[0]
+    direct = min((probe - m) @ precision @ (probe - m) for m in means) / dim
+    streamed = float(detector.score(torch.from_numpy(probe[None]).float())[0])
+    print(f"Direct {direct:.4f}, streamed {streamed:.4f}")
+    assert abs(direct - streamed) / direct < 1e-2
+    print()
+
+    print("Test 2: Calibrated threshold separates off-manifold features...")
+    detector = stats.fit()
+    held_out = sample(rng.integers(0, num_classes, 2000))
+    in_scores = detector.score(torch.from_numpy(held_out).float()).numpy()
+    threshold = detector.calibrate(in_scores, tpr=0.95)
+    outliers = np.maximum(rng.normal(size=(2000, dim)) * features.std(), 0)
+    out_scores = detector.score(torch.from_numpy(outliers).float()).numpy()
+    fpr = float((out_scores <= threshold).mean())
+    auroc = roc_auc(in_scores, out_scores)
+    print(f"Threshold {threshold:.3f}: TPR {(in_scores <= threshold).mean():.3f}, FPR {fpr:.3f}, AUROC {auroc:.4f}")
+    assert abs((in_scores <= threshold).mean() - 0.95) < 0.01
+    assert fpr < 0.01 and auroc > 0.99
+    print()
+
+    print("Test 3: Statistics round-trip through both checkpoint formats...")
+    with tempfile.TemporaryDirectory() as tmp:
+        model = DiseaseClassifier(num_classes=5, pretrained=False, backbone="resnet18", hidden_units=64).eval()
+        path = Path(tmp) / "model.pth"
+        save_model(model, path)
+        assert load_ood_detector(path) is None
+        small = ClassStatistics(5, model.feature_dim)
+        small.update(rng.normal(size=(200, model.feature_dim)), rng.integers(0, 5, 200))
+        fitted = small.fit()
+        fitted.threshold = 1.5
+        save_ood_stats(path, fitted)
+        tensor_path = convert_checkpoint(path)
+        batch = torch.randn(4, model.feature_dim)
+        for checkpoint in (path, tensor_path):
+            restored = load_ood_detector(checkpoint)
+            assert restored.threshold == 1.5 and restored.info == fitted.info
+            assert torch.allclose(restored.score(batch), fitted.score(batch))
+            reloaded = load_model(checkpoint, device="cpu")
+            assert torch.equal(reloaded.state_dict()["backbone.fc.3.weight"], model.state_dict()["backbone.fc.3.weight"])
+        print(f"{path.name} and {tensor_path.name} both carry the statistics and still load")
+
+        t0 = time.perf_counter()
+        for _ in range(100):
+            fitted.score(torch.randn(8, model.feature_dim))
+        print(f"Scoring a batch of 8: {10 * (time.perf_counter() - t0):.3f} ms")
+    print()
+
+    print("All tests passed!")
@@ -0,0 +1,288 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+# Every statistic is computed on a fixed-size thumbnail, so the gate's cost
+# does not grow with the upload's resolution. 256 is the native resolution of
+# the PlantVillage images the thresholds below were tuned on.
+#
+# This also makes decisions independent of resolution, which deliberately
+# differs from the full-resolution gate this replaced. Edge density is a
+# per-pixel statistic: in a multi-megapixel photo, neighbouring pixels barely
+# differ, so that gate found few edges and rejected textured leaves as solid
+# colour. Here a photo is judged by the same detail, at the same scale, as
+# the 256 px images the thresholds came from.
+GATE_SIZE = 256
+
+MIN_STD = 20
+MIN_GREEN_RATIO = 0.10
+MIN_EDGE_DENSITY = 0.05
+MAX_EDGE_DENSITY = 0.5
+MIN_GREEN_STD = 15
+MAX_ASPECT_RATIO = 5
+EDGE_THRESHOLD = 30
+
+REASON_VALID = "Valid plant image"
+REASON_UNIFORM = "Image appears to be too uniform (text, drawing, or solid color), not a natural photograph"
+REASON_NOT_GREEN = "Image does not contain sufficient plant-like colors. Please upload a photo of a plant leaf."
+REASON_SOLID = "Image appears to be a solid colored object, not a natural leaf. Please upload a photo of a plant leaf with visible texture."
+REASON_NOISY = "Image contains too much noise or text patterns, not a natural photograph"
+REASON_FLAT_GREEN = "Image has uniform green color (like painted surface), not a natural leaf with texture variation"
+REASON_ASPECT = "Image has unusual aspect ratio, not typical of plant photographs"
+
+
+def make_thumbnail(image: Image.Image, size: int = GATE_SIZE) -> np.ndarray:
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    # reducing_gap lets PIL box-reduce large images before the bilinear pass.
+    thumbnail = image.resize((size, size), Image.BILINEAR, reducing_gap=3.0)
+    return np.asarray(thumbnail, dtype=np.uint8)
+
+
+def green_mask(pixels: np.ndarray) -> np.ndarray:
+    """Green-dominant pixels of an (..., H, W, 3) uint8 array."""
+    r, g, b = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+    return g > np.maximum(np.maximum(r, b), 50)
+
+
+_LEVELS = np.arange(256, dtype=np.float64)
+
+
+def gate_statistics(thumbnails: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    All gate statistics for an (N, S, S, 3) uint8 stack. Each thumbnail is
+    processed on its own: its temporaries stay in the CPU cache, whereas
+    vectorising over the whole stack made the batch slower than a loop.
+    """
+    stats = [_thumbnail_statistics(thumbnail) for thumbnail in thumbnails]
+    return {key: np.array([s[key] for s in stats]) for key in ("std", "green_ratio", "edge_density", "green_std")}
+
+
+def _thumbnail_statistics(thumbnail: np.ndarray) -> Dict[str, float]:
+    # Per-channel histograms give exact first and second moments, hence both
+    # the overall and the green-channel standard deviation, without a float
+    # copy of the pixels.
+    pixels = thumbnail.reshape(-1, 3)
+    count = len(pixels)
+    hist = np.stack([np.bincount(pixels[:, c], minlength=256) for c in range(3)])
+    channel_sum = hist @ _LEVELS
+    channel_sq_sum = hist @ (_LEVELS * _LEVELS)
+
+    overall_mean = channel_sum.sum() / (3 * count)
+    overall_var = channel_sq_sum.sum() / (3 * count) - overall_mean ** 2
+    green_mean = channel_sum[1] / count
+    green_var = channel_sq_sum[1] / count - green_mean ** 2
+
+    return {
+        "std": float(np.sqrt(max(overall_var, 0.0))),
+        "green_ratio": float(green_mask(thumbnail).mean()),
+        "edge_density": _edge_density(thumbnail),
+        "green_std": float(np.sqrt(max(green_var, 0.0))),
+    }
+
+
+def _edge_density(thumbnail: np.ndarray) -> float:
+    # Integer luma and the FIND_EDGES kernel (8 * centre - 8 neighbours ==
+    # 9 * centre - 3x3 box, clipped at zero) exactly as PIL computes them,
+    # including PIL's habit of copying border pixels through unfiltered.
+    # 9 * 255 fits in int16, which halves the memory traffic of the box sum.
+    rgb = thumbnail.astype(np.int32)
+    gray = ((rgb[..., 0] * 19595 + rgb[..., 1] * 38470 + rgb[..., 2] * 7471 + 0x8000) >> 16).astype(np.int16)
+
+    rows = gray[:-2] + gray[1:-1] + gray[2:]
+    box = rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:]
+
+    edges = gray > EDGE_THRESHOLD
+    edges[1:-1, 1:-1] = (9 * gray[1:-1, 1:-1] - box) > EDGE_THRESHOLD
+    return float(edges.mean())
+
+
+def _decide(stats: Dict[str, float], aspect_ratio: float) -> Tuple[bool, str]:
+    if stats["std"] < MIN_STD:
+        return False, REASON_UNIFORM
+    if stats["green_ratio"] < MIN_GREEN_RATIO:
+        return False, REASON_NOT_GREEN
+    if stats["edge_density"] < MIN_EDGE_DENSITY:
+        return False, REASON_SOLID
+    if stats["edge_density"] > MAX_EDGE_DENSITY:
+        return False, REASON_NOISY
+    if stats["green_std"] < MIN_GREEN_STD:
+        return False, REASON_FLAT_GREEN
+    if aspect_ratio > MAX_ASPECT_RATIO:
+        return False, REASON_ASPECT
+    return True, REASON_VALID
+
+
+def check_plant_images(images: List[Image.Image], size: int = GATE_SIZE) -> List[Tuple[bool, str]]:
+    if not images:
+        return []
+
+    thumbnails = np.stack([make_thumbnail(image, size) for image in images])
+    stats = gate_statistics(thumbnails)
+
+    decisions = []
+    for i, image in enumerate(images):
+        width, height = image.size
+        aspect_ratio = max(width, height) / max(min(width, height), 1)
+        decisions.append(_decide({k: float(v[i]) for k, v in stats.items()}, aspect_ratio))
+    return decisions
+
+
+def check_plant_image(image: Image.Image, size: int = GATE_SIZE) -> Tuple[bool, str]:
+    return check_plant_images([image], size)[0]
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from pathlib import Path
+
+    from PIL import ImageDraw, ImageFilter
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    from config import config
+
+    def reference_gate(image: Image.Image) -> Tuple[bool, str]:
+        # Full-resolution gate this module replaced, kept for the agreement check.
+        img_array = np.array(image)
+        if np.std(img_array) < 20:
+            return False, REASON_UNIFORM
+        r, g, b = img_array[:, :, 0], img_array[:, :, 1], img_array[:, :, 2]
+        green_dominant = (g > r) & (g > b) & (g > 50)
+        if np.sum(green_dominant) / (img_array.shape[0] * img_array.shape[1]) < 0.10:
+            return False, REASON_NOT_GREEN
+        edge_array = np.array(image.convert('L').filter(ImageFilter.FIND_EDGES))
+        edge_density = np.sum(edge_array > 30) / (edge_array.shape[0] * edge_array.shape[1])
+        if edge_density < 0.05:
+            return False, REASON_SOLID
+        if edge_density > 0.5:
+            return False, REASON_NOISY
+        if np.std(img_array[:, :, 1]) < 15:
+            return False, REASON_FLAT_GREEN
+        width, height = image.size
+        if max(width, height) / min(width, height) > 5:
+            return False, REASON_ASPECT
+        return True, REASON_VALID
+
+    def synthetic_corpus() -> List[Image.Image]:
+        # Generated at the dataset's native 256 px so they exercise every rule
+        # without depending on the resize.
+        rng = np.random.default_rng(0)
+        images = [
+            Image.new("RGB", (256, 256), (240, 240, 240)),
+            Image.new("RGB", (256, 256), (40, 160, 60)),
+            Image.fromarray(rng.integers(0, 256, (256, 256, 3), dtype=np.uint8)),
+            Image.new("RGB", (1536, 256), (60, 140, 50)),
+        ]
+        text_page = Image.new("RGB", (256, 256), "white")
+        draw = ImageDraw.Draw(text_page)
+        for row in range(20):
+            draw.text((4, 4 + row * 12), "Lorem ipsum dolor sit amet", fill="black")
+        images.append(text_page)
+
+        yy, xx = np.mgrid[0:256, 0:256]
+        leaf = ((yy - 128) / 110.0) ** 2 + ((xx - 128) / 80.0) ** 2 < 1
+        for blur in (0, 1, 2, 3):
+            pixels = np.empty((256, 256, 3), dtype=np.float32)
+            pixels[:] = (120, 90, 60)
+            pixels[leaf] = (50, 150, 40)
+            pixels[:, ::16] += 40
+            pixels += rng.normal(0, 12, pixels.shape)
+            image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+            images.append(image.filter(ImageFilter.GaussianBlur(blur)) if blur else image)
+        return images
+
+    print("Testing Plant Gate...")
+    print()
+
+    print("Test 1: Building corpus...")
+    corpus: List[Image.Image] = synthetic_corpus()
+    per_class = 5
+    for data_dir in config.get_data_directories():
+        for class_dir in sorted(p for p in data_dir.iterdir() if p.is_dir()):
+            for image_path in sorted(class_dir.iterdir())[:per_class]:
+                try:
+                    corpus.append(Image.open(image_path).convert("RGB"))
+                except Exception:
+                    continue
+    print(f"Corpus size: {len(corpus)} images")
+    print()
+
+    print("Test 2: Comparing decisions with the full-resolution gate...")
+    t0 = time.perf_counter()
+    reference = [reference_gate(image) for image in corpus]
+    reference_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    single = [check_plant_image(image) for image in corpus]
+    single_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batched = check_plant_images(corpus)
+    batched_time = time.perf_counter() - t0
+
+    assert single == batched, "Batched gate disagrees with the single-image gate"
+
+    agree = sum(ref[0] == new[0] for ref, new in zip(reference, batched))
+    agreement = agree / len(corpus)
+    print(f"Accept/reject agreement: {agree}/{len(corpus)} ({100 * agreement:.1f}%)")
+    for i, (ref, new) in enumerate(zip(reference, batched)):
+        if ref[0] != new[0]:
+            print(f"  #{i} size={corpus[i].size}: reference={ref[1]!r} thumbnail={new[1]!r}")
+    assert agreement >= 0.95, "Thumbnail gate decisions drifted from the reference gate"
+    print()
+
+    print("Test 3: High-resolution uploads...")
+    # The 256 px synthetic images upscaled to phone-camera sizes. Past the
+    # thumbnail size the decision must not depend on resolution. (The
+    # resample round trip smooths pixel noise, so the upscaled copies need
+    # not match the 256 px originals near a threshold.) The full-resolution
+    # gate rejects smooth large images as solid colour (see GATE_SIZE); that
+    # is the only disagreement with it allowed.
+    base = synthetic_corpus()
+    base_decisions = check_plant_images(base)
+    by_size = {}
+    for size in ((1024, 768), (4000, 3000)):
+        large = [image.resize(size, Image.BICUBIC) for image in base]
+        decisions = by_size[size] = check_plant_images(large)
+        reference_large = [reference_gate(image) for image in large]
+        same = sum(new[0] == small[0] for new, small in zip(decisions, base_decisions))
+        agree = sum(new[0] == ref[0] for new, ref in zip(decisions, reference_large))
+        print(f"{size[0]}x{size[1]}: same decision as at 256 px {same}/{len(large)}, "
+              f"agrees with full-resolution gate {agree}/{len(large)}")
+        for new, ref in zip(decisions, reference_large):
+            assert new[0] == ref[0] or (new[0] and ref[1] == REASON_SOLID), (new, ref)
+    assert by_size[(1024, 768)] == by_size[(4000, 3000)], "Gate decisions depend on the upload's resolution"
+    print()
+
+    print("Test 4: Timing...")
+
+    def per_image_ms(fn, images, repeats: int = 5) -> float:
+        best = float("inf")
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            fn(images)
+            best = min(best, time.perf_counter() - t0)
+        return 1000 * best / len(images)
+
+    print(f"{'':<16}{'reference':>12}{'thumbnail':>12}{'batched':>12}  (ms/image)")
+    print(f"{'256 px corpus':<16}{1000 * reference_time / len(corpus):>12.2f}"
+          f"{1000 * single_time / len(corpus):>12.2f}{1000 * batched_time / len(corpus):>12.2f}")
+    # The uploads the thumbnail exists for: 12 MP phone photos (large is the
+    # 4000x3000 set from Test 3)
+    reference_ms = per_image_ms(lambda images: [reference_gate(image) for image in images], large, repeats=1)
+    single_ms = per_image_ms(lambda images: [check_plant_image(image) for image in images], large)
+    batched_ms = per_image_ms(check_plant_images, large)
+    print(f"{'4000x3000':<16}{reference_ms:>12.2f}{single_ms:>12.2f}{batched_ms:>12.2f}")
+    print(f"Speedup at 12 MP: {reference_ms / single_ms:.1f}x")
+    assert single_ms * 3 < reference_ms, "Thumbnail gate is not meaningfully faster on 12 MP uploads"
+    # Same per-image work either way (see gate_statistics); the margin is timing noise
+    assert batched_ms < 1.25 * single_ms, "Batched gate is slower than gating one image at a time"
+    print()
+
+    print("All tests passed!")
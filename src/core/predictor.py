@@ -1,13 +1,35 @@
+import io
 import json
+import threading
+import time
+from collections import deque
 from pathlib import Path
 from typing import Dict, List, Tuple, Optional, Union
 
-import torch
 import numpy as np
-from PIL import Image, ImageFilter
+import torch
+from PIL import Image
 
-from src.core.model import load_model
+from src.core.model import load_model, weights_fingerprint
+from src.core.inference_graph import load_inference_graph
+from src.core.quantization import load_quantized_model
 from src.core.dataset import get_val_transforms
+from src.core.plant_gate import check_plant_image, check_plant_images
+from src.core.ood import REASON_OUT_OF_DISTRIBUTION, load_ood_detector
+from src.core.preprocessing import IMAGE_SIZE, BatchPreprocessor, ImageSource, open_image
+from src.core.tiling import (
+    DECODE_SIZE, MAX_TILES, TILE_OVERLAP, TILE_SIZE,
+    aggregate_tiles, load_for_tiling, tile_detections, tile_image,
+)
+from src.core.cache import PredictionCache, checkpoint_identity
+from src.core.autotune import apply_thread_settings
+
+
+def heatmap_png(heatmap: np.ndarray) -> bytes:
+    """Encode a uint8 heatmap as a grayscale PNG, at its native low resolution."""
+    buffer = io.BytesIO()
+    Image.fromarray(heatmap).save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
 
 
 class PlantDiseasePredictor:
@@ -19,29 +41,194 @@ class PlantDiseasePredictor:
         device: Optional[str] = None,
         confidence_threshold: float = 0.0,
         top_k: int = 3,
+        backend: str = "torch",
+        onnx_path: Optional[Union[str, Path]] = None,
+        precision: str = "fp32",
+        int8_path: Optional[Union[str, Path]] = None,
+        cache_size: int = 0,
+        cache_ttl: float = 3600.0,
+        frozen_graph: bool = True,
+        shared_weights: bool = False,
+        shared_dir: Optional[Union[str, Path]] = None,
+        cascade_model_path: Optional[Union[str, Path]] = None,
+        cascade_threshold: float = 0.9,
+        return_embeddings: bool = False,
+        return_heatmaps: bool = False,
+        feature_gate: bool = False,
+        num_threads: Optional[int] = None,
+        num_interop_threads: Optional[int] = None,
     ):
         self.model_path = Path(model_path)
         self.class_mapping_path = Path(class_mapping_path)
         self.confidence_threshold = confidence_threshold
         self.top_k = top_k
         
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unsupported backend: {backend}. Expected 'torch' or 'onnx'.")
+        self.backend = backend
+        
+        if precision not in ("fp32", "int8"):
+            raise ValueError(f"Unsupported precision: {precision}. Expected 'fp32' or 'int8'.")
+        if precision == "int8" and backend != "torch":
+            raise ValueError("INT8 precision is only available with the torch backend.")
+        self.precision = precision
+        
+        if return_embeddings and (backend != "torch" or precision != "fp32"):
+            raise ValueError("Embeddings are only available with the torch backend at fp32 precision.")
+        self.return_embeddings = return_embeddings
+        if return_heatmaps and (backend != "torch" or precision != "fp32"):
+            raise ValueError("Heatmaps are only available with the torch backend at fp32 precision.")
+        self.return_heatmaps = return_heatmaps
+        if feature_gate and (backend != "torch" or precision != "fp32"):
+            raise ValueError("The feature-space plant gate is only available with the torch backend at fp32 precision.")
+        if feature_gate and cascade_model_path is not None:
+            raise ValueError(
+                "The feature-space plant gate needs the main model's features for every image; "
+                "it cannot be combined with the cascade."
+            )
+        self.feature_gate = feature_gate
+        # Penultimate features are needed for embeddings and for the feature gate
+        self._return_features = return_embeddings or feature_gate
+        self.frozen = False
+        self.shared_weights = False
+        
         if device is None:
             device = "cuda" if torch.cuda.is_available() else "cpu"
         self.device = torch.device(device)
         
+        # CPU thread pools (from the autotuned profile); process-wide in torch
+        apply_thread_settings(num_threads, num_interop_threads)
+        self.num_threads = num_threads
+        
+        # Taken before the weights are read: if the file changes during the
+        # load, the cache treats this model as stale rather than current
+        model_identity = checkpoint_identity(self.model_path)
         print(f"Loading model from {self.model_path}...")
-        self.model = load_model(
-            self.model_path,
-            device=self.device.type,
-            for_inference=True
-        )
+        if self.backend == "onnx":
+            # ONNX Runtime runs on the CPU execution provider; keep tensors there.
+            from src.core.onnx_backend import load_onnx_model
+
+            self.device = torch.device("cpu")
+            self.model = load_onnx_model(self.model_path, onnx_path=onnx_path, num_threads=num_threads)
+        elif self.precision == "int8":
+            # Quantized kernels only exist for CPU.
+            self.device = torch.device("cpu")
+            if int8_path is None:
+                int8_path = self.model_path.with_name(f"{self.model_path.stem}_int8.pt")
+            self.model = load_quantized_model(int8_path, source_checkpoint=self.model_path)
+        elif shared_weights and self.device.type == "cpu":
+            from src.core.shared_weights import load_shared_model
+
+            # Weights mmap'd from shared memory, one physical copy per host
+            self.model = load_shared_model(
+                self.model_path, fold=frozen_graph, shared_dir=shared_dir,
+                return_features=self._return_features, return_heatmap=return_heatmaps,
+            )
+            self.frozen = frozen_graph
+            self.shared_weights = True
+        elif frozen_graph and self.device.type == "cpu":
+            # BatchNorm-folded TorchScript graph expecting channels_last input
+            self.model = load_inference_graph(
+                self.model_path, return_features=self._return_features, return_heatmap=return_heatmaps
+            )
+            self.frozen = True
+        else:
+            self.model = load_model(
+                self.model_path,
+                device=self.device.type,
+                for_inference=True
+            )
+            self.model.set_return_features(self._return_features)
+            self.model.set_return_heatmap(return_heatmaps)
+        
+        # Stored embeddings are only comparable between identical weights
+        self.embedding_model = None
+        self.embedding_dim = None
+        self.heatmap_size = None
+        if self._return_features or return_heatmaps:
+            _, features, heatmaps = self._forward(torch.zeros((1, 3, *IMAGE_SIZE), device=self.device))
+        if return_embeddings:
+            self.embedding_model = weights_fingerprint(self.model_path)
+            self.embedding_dim = features.shape[1]
+        if return_heatmaps:
+            # Last conv stage resolution, e.g. 7x7 for a 224x224 ResNet input
+            side = int(round(heatmaps.shape[1] ** 0.5))
+            self.heatmap_size = (side, heatmaps.shape[1] // side)
+        
+        # Feature-space plant gate: class statistics stored in the checkpoint
+        # by src/fit_ood.py, scored on the features of the same forward pass
+        self.ood = None
+        if feature_gate:
+            detector = load_ood_detector(self.model_path)
+            if detector is None:
+                raise ValueError(f"{self.model_path} has no OOD statistics; run src/fit_ood.py on it first.")
+            if detector.feature_dim != features.shape[1]:
+                raise ValueError(
+                    f"OOD statistics in {self.model_path} are for {detector.feature_dim}-d features, "
+                    f"the model produces {features.shape[1]}."
+                )
+            self.ood = detector.to(self.device)
+        
+        # Cascade: a cheap first-stage model answers confident images; only
+        # the rest are escalated to the main model.
+        self.stage1_model = None
+        self.cascade_threshold = cascade_threshold
+        if cascade_model_path is not None:
+            cascade_model_path = Path(cascade_model_path)
+            print(f"Loading first-stage cascade model from {cascade_model_path}...")
+            self.stage1_model = self._load_stage1_model(cascade_model_path, frozen_graph, shared_weights, shared_dir)
+            self._check_stage1_outputs()
+            self._cascade_variant = f"cascade={checkpoint_identity(cascade_model_path)}@{cascade_threshold}"
+        self._cascade_lock = threading.Lock()
+        self._cascade_images = 0
+        self._cascade_escalated = 0
+        self._stage1_ms = deque(maxlen=1000)
+        self._stage2_ms = deque(maxlen=1000)
         
         self.idx_to_class = self._load_class_mapping()
         self.num_classes = len(self.idx_to_class)
         
         self.transform = get_val_transforms()
+        self.preprocess = BatchPreprocessor(channels_last=self.frozen)
         
-        print(f"Predictor ready: {self.num_classes} classes on {self.device}")
+        # Uploads are often retried; results are cached by content hash
+        self.cache = PredictionCache(
+            self.model_path, max_entries=cache_size, ttl_seconds=cache_ttl, identity=model_identity
+        ) if cache_size > 0 else None
+        
+        print(f"Predictor ready: {self.num_classes} classes on {self.device} ({self.backend} backend, {self.precision}{', folded graph' if self.frozen else ''}{', shared weights' if self.shared_weights else ''}{', cascade' if self.stage1_model is not None else ''}{', embeddings' if self.return_embeddings else ''}{', heatmaps' if self.return_heatmaps else ''}{', feature gate' if self.feature_gate else ''})")
+    
+    def _load_stage1_model(
+        self,
+        path: Path,
+        frozen_graph: bool,
+        shared_weights: bool,
+        shared_dir: Optional[Union[str, Path]],
+    ):
+        # Same serving route as the main model where one exists for it; INT8
+        # artifacts are only built for the main model, so that falls back to fp32.
+        if self.backend == "onnx":
+            from src.core.onnx_backend import load_onnx_model
+
+            return load_onnx_model(path, num_threads=self.num_threads)
+        if shared_weights and self.device.type == "cpu":
+            from src.core.shared_weights import load_shared_model
+
+            return load_shared_model(path, fold=frozen_graph, shared_dir=shared_dir)
+        if frozen_graph and self.device.type == "cpu":
+            return load_inference_graph(path)
+        return load_model(path, device=self.device.type, for_inference=True)
+    
+    def _check_stage1_outputs(self):
+        probe = torch.zeros((1, 3, *IMAGE_SIZE), device=self.device)
+        with torch.no_grad():
+            stage1_classes = self.stage1_model(probe).shape[1]
+            stage2_classes = self._forward(probe)[0].shape[1]
+        if stage1_classes != stage2_classes:
+            raise ValueError(
+                f"Cascade models disagree on the label space: first stage predicts {stage1_classes} classes, "
+                f"main model {stage2_classes}."
+            )
     
     def _load_class_mapping(self) -> Dict[int, str]:
         with open(self.class_mapping_path, 'r') as f:
@@ -55,191 +242,489 @@ class PlantDiseasePredictor:
         Check if image contains plant-like characteristics.
         Returns (is_plant, reason)
         """
-        # Convert to numpy array
-        img_array = np.array(image)
-        
-        # Check if image is too uniform (like text on paper or solid colors)
-        std_dev = np.std(img_array)
-        if std_dev < 20:
-            return False, "Image appears to be too uniform (text, drawing, or solid color), not a natural photograph"
-        
-        # Check for green pixels (plants typically have green)
-        r, g, b = img_array[:,:,0], img_array[:,:,1], img_array[:,:,2]
-        
-        # Green dominant pixels (typical for plant leaves)
-        green_dominant = (g > r) & (g > b) & (g > 50)
-        green_ratio = np.sum(green_dominant) / (img_array.shape[0] * img_array.shape[1])
-        
-        # Plant images should have at least 10% green pixels
-        if green_ratio < 0.10:
-            return False, "Image does not contain sufficient plant-like colors. Please upload a photo of a plant leaf."
-        
-        # Check for texture complexity (leaves have veins and texture)
-        # Convert to grayscale for edge detection
-        gray_image = image.convert('L')
-        edges = gray_image.filter(ImageFilter.FIND_EDGES)
-        edge_array = np.array(edges)
-        edge_density = np.sum(edge_array > 30) / (edge_array.shape[0] * edge_array.shape[1])
-        
-        # Leaves have moderate edge density (0.05 to 0.4)
-        # Too few edges = solid color object, too many = text/noise
-        if edge_density < 0.05:
-            return False, "Image appears to be a solid colored object, not a natural leaf. Please upload a photo of a plant leaf with visible texture."
-        
-        if edge_density > 0.5:
-            return False, "Image contains too much noise or text patterns, not a natural photograph"
-        
-        # Check color variance in green channel - leaves have variation
-        green_channel = img_array[:,:,1]
-        green_std = np.std(green_channel)
-        if green_std < 15:
-            return False, "Image has uniform green color (like painted surface), not a natural leaf with texture variation"
-        
-        # Check aspect ratio - extremely wide/tall images are suspicious
-        width, height = image.size
-        aspect_ratio = max(width, height) / min(width, height)
-        if aspect_ratio > 5:
-            return False, "Image has unusual aspect ratio, not typical of plant photographs"
-        
-        return True, "Valid plant image"
+        return check_plant_image(image)
     
-    def _preprocess_image(self, image: Union[str, Path, Image.Image]) -> torch.Tensor:
-        if isinstance(image, (str, Path)):
-            image = Image.open(image).convert('RGB')
-        elif isinstance(image, Image.Image):
-            image = image.convert('RGB')
-        else:
-            raise ValueError(f"Unsupported image type: {type(image)}")
+    def _are_plant_images(self, images: List[Image.Image]) -> List[Tuple[bool, str]]:
+        # The feature gate replaces the heuristics and runs after the forward pass
+        if self.feature_gate:
+            return [(True, '')] * len(images)
+        return check_plant_images(images)
+    
+    def _forward(self, batch: torch.Tensor) -> Tuple[torch.Tensor, Optional[torch.Tensor], Optional[torch.Tensor]]:
+        """
+        Main model logits, plus the pooled penultimate features when
+        embeddings or the feature gate are on and the flattened top-1 Grad-CAM map when heatmaps
+        are on (None otherwise), all from the one forward pass.
+        """
+        with torch.no_grad():
+            outputs = self.model(batch)
+        if not (self._return_features or self.return_heatmaps):
+            return outputs, None, None
+        features = outputs[1] if self._return_features else None
+        heatmaps = outputs[-1] if self.return_heatmaps else None
+        return outputs[0], features, heatmaps
+    
+    def _classify(
+        self,
+        batch: torch.Tensor,
+    ) -> Tuple[torch.Tensor, Optional[List[int]], Optional[torch.Tensor], Optional[torch.Tensor]]:
+        """
+        Class probabilities for a preprocessed batch, cascading if enabled.
+        Also returns which stage answered each row (None without a cascade)
+        and the main model's features and heatmaps (None when off). Rows
+        answered by the first stage never reach the main model, so their
+        feature and heatmap rows are NaN.
+        """
+        if self.stage1_model is None:
+            logits, features, heatmaps = self._forward(batch)
+            return torch.softmax(logits, dim=1), None, features, heatmaps
+        
+        t0 = time.perf_counter()
+        with torch.no_grad():
+            probabilities = torch.softmax(self.stage1_model(batch), dim=1)
+        stage1_ms = 1000.0 * (time.perf_counter() - t0)
+        
+        confidence = probabilities.max(dim=1).values
+        escalate = torch.nonzero(confidence < self.cascade_threshold).flatten()
+        
+        stage2_ms = None
+        features = heatmaps = None
+        if escalate.numel():
+            # Only the uncertain subset goes through the main model, as one batch
+            t0 = time.perf_counter()
+            logits, escalated_features, escalated_heatmaps = self._forward(batch.index_select(0, escalate))
+            probabilities[escalate] = torch.softmax(logits, dim=1)
+            stage2_ms = 1000.0 * (time.perf_counter() - t0)
+            if escalated_features is not None:
+                features = escalated_features.new_full((batch.shape[0], escalated_features.shape[1]), float("nan"))
+                features[escalate] = escalated_features
+            if escalated_heatmaps is not None:
+                heatmaps = escalated_heatmaps.new_full((batch.shape[0], escalated_heatmaps.shape[1]), float("nan"))
+                heatmaps[escalate] = escalated_heatmaps
+        
+        with self._cascade_lock:
+            self._cascade_images += batch.shape[0]
+            self._cascade_escalated += escalate.numel()
+            self._stage1_ms.append(stage1_ms)
+            if stage2_ms is not None:
+                self._stage2_ms.append(stage2_ms)
         
-        tensor = self.transform(image).unsqueeze(0)
-        return tensor
+        stages = [1] * batch.shape[0]
+        for i in escalate.tolist():
+            stages[i] = 2
+        return probabilities, stages, features, heatmaps
+    
+    def _load_image(self, image: ImageSource) -> Image.Image:
+        return open_image(image)
+    
+    def _preprocess_image(self, image: ImageSource) -> torch.Tensor:
+        return self.preprocess([self._load_image(image)])
     
     def predict(
         self,
-        image: Union[str, Path, Image.Image],
+        image: ImageSource,
         return_all: bool = False
     ) -> Dict[str, any]:
-        # Load image if needed
+        return self.predict_batch([image], return_all=return_all)[0]
+    
+    def predict_batch(
+        self,
+        images: List[ImageSource],
+        return_all: bool = False
+    ) -> List[Dict[str, any]]:
+        if self.cache is None:
+            return self._predict_uncached(images, return_all)
+        
+        variant = f"return_all={return_all}"
+        if self.stage1_model is not None:
+            variant += f"|{self._cascade_variant}"
+        results: List[Optional[Dict[str, any]]] = [None] * len(images)
+        keys = [None] * len(images)
+        sources = list(images)
+        missing = []
+        
+        for i, img in enumerate(images):
+            data = self._cacheable_bytes(img)
+            if data is not None:
+                # Decode from the bytes already read instead of reading twice
+                sources[i] = data
+                keys[i] = self.cache.make_key(data, variant)
+                cached = self.cache.get(keys[i])
+                if cached is not None:
+                    results[i] = cached
+                    continue
+            missing.append(i)
+        
+        if missing:
+            computed = self._predict_uncached([sources[i] for i in missing], return_all)
+            for i, result in zip(missing, computed):
+                results[i] = result
+                if keys[i] is not None:
+                    self.cache.put(keys[i], result)
+        
+        return results
+    
+    @staticmethod
+    def _cacheable_bytes(image: ImageSource) -> Optional[bytes]:
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            return bytes(image)
         if isinstance(image, (str, Path)):
-            pil_image = Image.open(image).convert('RGB')
-        else:
-            pil_image = image.convert('RGB')
+            return Path(image).read_bytes()
+        return None
+    
+    def predict_arrays(
+        self,
+        images: List[ImageSource],
+        return_probabilities: bool = False,
+    ) -> Dict[str, np.ndarray]:
+        """
+        Score a batch and return the results column-wise, one array per field
+        with a row per image. Meant for offline and bulk scoring; it bypasses
+        the result cache.
+        
+            is_plant       bool    (N,)    plant-gate mask
+            gate_reason    object  (N,)    gate message, '' for plant images
+            ood_score      float32 (N,)    with the feature gate: distance to
+                                           the nearest class in feature space
+                                           (rejected above the checkpoint's
+                                           threshold); NaN where not scored
+            class_idx      int64   (N,)    top-1 class, -1 where rejected
+            confidence     float32 (N,)    top-1 probability, 0 where rejected
+            top_k_indices  int64   (N, k)  -1 where rejected
+            top_k_probs    float32 (N, k)  0 where rejected
+            probabilities  float32 (N, C)  only with return_probabilities
+            model_stage    int8    (N,)    cascade only; 0 where rejected
+            embeddings     float32 (N, D)  with return_embeddings; NaN rows
+                                           where no embedding was produced
+            heatmaps       float32 (N, h, w) with return_heatmaps: top-1
+                                           Grad-CAM over the last conv stage,
+                                           scaled to [0, 1]; NaN where none
+        """
+        # Load all images, then run the plant gate over them in one batch
+        loaded = [self._load_image(img) for img in images]
+        gate = self._are_plant_images(loaded)
+        
+        is_plant = np.fromiter((ok for ok, _ in gate), dtype=bool, count=len(loaded))
+        valid = np.flatnonzero(is_plant)
+        batch = self.preprocess([loaded[i] for i in valid]) if valid.size else None
         
-        # First check if it's actually a plant image
-        is_plant, reason = self._is_plant_image(pil_image)
-        if not is_plant:
+        return self.predict_preprocessed(
+            batch,
+            is_plant,
+            gate_reason=['' if ok else reason for ok, reason in gate],
+            return_probabilities=return_probabilities,
+        )
+    
+    def predict_preprocessed(
+        self,
+        batch: Optional[torch.Tensor],
+        is_plant: np.ndarray,
+        gate_reason: Optional[List[str]] = None,
+        return_probabilities: bool = False,
+    ) -> Dict[str, np.ndarray]:
+        """
+        predict_arrays for images that were already gated and preprocessed
+        elsewhere (e.g. in DataLoader workers). batch holds one normalized
+        row per True entry of is_plant, in order. With the feature gate,
+        rows it rejects come back with is_plant False.
+        """
+        n = len(is_plant)
+        k = min(self.top_k, self.num_classes)
+        valid = np.flatnonzero(is_plant)
+        
+        arrays = {
+            'is_plant': np.array(is_plant, dtype=bool),
+            'gate_reason': np.array(gate_reason if gate_reason is not None else [''] * n, dtype=object),
+            'class_idx': np.full(n, -1, dtype=np.int64),
+            'confidence': np.zeros(n, dtype=np.float32),
+            'top_k_indices': np.full((n, k), -1, dtype=np.int64),
+            'top_k_probs': np.zeros((n, k), dtype=np.float32),
+        }
+        if self.stage1_model is not None:
+            arrays['model_stage'] = np.zeros(n, dtype=np.int8)
+        if self.return_embeddings:
+            arrays['embeddings'] = np.full((n, self.embedding_dim), np.nan, dtype=np.float32)
+        if self.return_heatmaps:
+            arrays['heatmaps'] = np.full((n, *self.heatmap_size), np.nan, dtype=np.float32)
+        if self.ood is not None:
+            arrays['ood_score'] = np.full(n, np.nan, dtype=np.float32)
+        
+        if valid.size:
+            batch = batch.to(self.device).contiguous(memory_format=self.preprocess.memory_format)
+            probabilities, stages, features, heatmaps = self._classify(batch)
+            
+            if self.ood is not None:
+                # Rows far from every training class are rejected like the
+                # heuristic gate would have, at the cost of one small matmul
+                scores = self.ood.score(features)
+                arrays['ood_score'][valid] = scores.cpu().numpy()
+                accept = scores <= self.ood.threshold
+                keep = accept.cpu().numpy()
+                arrays['is_plant'][valid[~keep]] = False
+                arrays['gate_reason'][valid[~keep]] = REASON_OUT_OF_DISTRIBUTION
+                valid = valid[keep]
+                probabilities = probabilities[accept]
+                features = features[accept] if self.return_embeddings else None
+                if heatmaps is not None:
+                    heatmaps = heatmaps[accept]
+        
+        if valid.size:
+            # One top-k and one device-to-host copy per field for the whole batch
+            top_k_probs, top_k_indices = probabilities.topk(k, dim=1)
+            top_k_probs = top_k_probs.float().cpu().numpy()
+            top_k_indices = top_k_indices.cpu().numpy()
+            
+            arrays['top_k_probs'][valid] = top_k_probs
+            arrays['top_k_indices'][valid] = top_k_indices
+            arrays['confidence'][valid] = top_k_probs[:, 0]
+            arrays['class_idx'][valid] = top_k_indices[:, 0]
+            if return_probabilities:
+                arrays['probabilities'] = np.zeros((n, probabilities.shape[1]), dtype=np.float32)
+                arrays['probabilities'][valid] = probabilities.float().cpu().numpy()
+            if stages is not None:
+                arrays['model_stage'][valid] = stages
+            if features is not None:
+                arrays['embeddings'][valid] = features.float().cpu().numpy()
+            if heatmaps is not None:
+                # Per-image scale: only the relative evidence within a leaf matters
+                heatmaps = heatmaps / heatmaps.amax(dim=1, keepdim=True).clamp_min(1e-12)
+                arrays['heatmaps'][valid] = heatmaps.float().cpu().numpy().reshape(-1, *self.heatmap_size)
+        elif return_probabilities:
+            arrays['probabilities'] = np.zeros((n, self.num_classes), dtype=np.float32)
+        
+        return arrays
+    
+    def predict_tiled(
+        self,
+        image: ImageSource,
+        return_all: bool = False,
+        max_tiles: int = MAX_TILES,
+        tile_size: int = TILE_SIZE,
+        overlap: float = TILE_OVERLAP,
+        decode_size: int = DECODE_SIZE,
+    ) -> Dict[str, any]:
+        """
+        Diagnose a field photo with many leaves: decode once at decode_size,
+        classify up to max_tiles overlapping tiles over its green regions in
+        one forward pass, and aggregate. The result has the usual top-level
+        fields (from the green-weighted mean of tile probabilities) plus
+        'tiles' (box as fractions of the photo, green_ratio and the tile's
+        own prediction) and 'detections' (every class that wins a tile).
+        """
+        variant = f"tiled={max_tiles},{tile_size},{overlap},{decode_size}|return_all={return_all}"
+        if self.stage1_model is not None:
+            variant += f"|{self._cascade_variant}"
+        key = None
+        data = self._cacheable_bytes(image) if self.cache is not None else None
+        if data is not None:
+            image = data
+            key = self.cache.make_key(data, variant)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+        
+        loaded = load_for_tiling(image, decode_size)
+        tiles, plan = tile_image(loaded, tile_size, overlap, max_tiles)
+        
+        # Gated per tile: leaves may cover only a small part of a field photo
+        gate = self._are_plant_images(tiles)
+        result = self._aggregate_tiles(tiles, plan, gate, loaded.size, return_all) if any(ok for ok, _ in gate) else None
+        if result is None:
+            greenest = max(range(len(plan)), key=lambda i: plan[i][1])
             result = {
                 'class_name': 'Not a plant image',
                 'class_idx': -1,
                 'confidence': 0.0,
-                'error': reason,
+                'error': gate[greenest][1] or REASON_OUT_OF_DISTRIBUTION,
                 'is_plant': False
             }
-            return result
         
-        tensor = self._preprocess_image(pil_image).to(self.device)
-        
-        with torch.no_grad():
-            logits = self.model(tensor)
-            probabilities = torch.softmax(logits, dim=1)
+        if key is not None:
+            self.cache.put(key, result)
+        return result
+    
+    def _aggregate_tiles(
+        self,
+        tiles: List[Image.Image],
+        plan: List[Tuple[Tuple[int, int, int, int], float]],
+        gate: List[Tuple[bool, str]],
+        image_size: Tuple[int, int],
+        return_all: bool,
+    ) -> Optional[Dict[str, any]]:
+        is_plant = np.fromiter((ok for ok, _ in gate), dtype=bool, count=len(tiles))
+        arrays = self.predict_preprocessed(
+            self.preprocess([tiles[i] for i in np.flatnonzero(is_plant)]),
+            is_plant,
+            gate_reason=['' if ok else reason for ok, reason in gate],
+            return_probabilities=True,
+        )
+        # The feature gate may still reject every tile
+        valid = np.flatnonzero(arrays['is_plant'])
+        if not valid.size:
+            return None
         
-        top_prob, top_idx = probabilities[0].max(dim=0)
+        green = np.array([ratio for _, ratio in plan])
+        aggregated = aggregate_tiles(arrays['probabilities'][valid], green[valid])
+        k = min(self.top_k, self.num_classes)
+        order = np.argsort(-aggregated, kind="stable")[:k].tolist()
         
         result = {
-            'class_name': self.idx_to_class.get(top_idx.item(), 'Unknown'),
-            'class_idx': top_idx.item(),
-            'confidence': top_prob.item(),
-            'is_plant': True
+            'class_name': self.idx_to_class.get(order[0], 'Unknown'),
+            'class_idx': order[0],
+            'confidence': float(aggregated[order[0]]),
+            'is_plant': True,
+            'num_tiles': int(valid.size),
         }
-        
         if return_all:
-            top_k_probs, top_k_indices = probabilities[0].topk(self.top_k)
-            
-            top_k_predictions = []
-            for prob, idx in zip(top_k_probs, top_k_indices):
-                prob_val = prob.item()
-                if prob_val >= self.confidence_threshold:
-                    top_k_predictions.append({
-                        'class_name': self.idx_to_class.get(idx.item(), 'Unknown'),
-                        'class_idx': idx.item(),
-                        'confidence': prob_val,
-                    })
-            
-            result['top_k'] = top_k_predictions
+            result['top_k'] = [
+                {
+                    'class_name': self.idx_to_class.get(idx, 'Unknown'),
+                    'class_idx': idx,
+                    'confidence': float(aggregated[idx]),
+                }
+                for idx in order
+                if aggregated[idx] >= self.confidence_threshold
+            ]
+        
+        detections = tile_detections(
+            arrays['class_idx'][valid], arrays['confidence'][valid], self.confidence_threshold
+        )
+        for detection in detections:
+            detection['class_name'] = self.idx_to_class.get(detection['class_idx'], 'Unknown')
+        result['detections'] = detections
+        
+        # Rejected tiles are listed too, with the gate's reason
+        width, height = image_size
+        tile_results = self._results_from_arrays(arrays, return_all)
+        for tile_result, ((x0, y0, x1, y1), ratio) in zip(tile_results, plan):
+            tile_result.pop('embedding', None)
+            tile_result.pop('embedding_model', None)
+            tile_result.pop('heatmap', None)
+            tile_result['box'] = [x0 / width, y0 / height, x1 / width, y1 / height]
+            tile_result['green_ratio'] = round(ratio, 4)
+        result['tiles'] = tile_results
         
         return result
     
-    def predict_batch(
+    def _predict_uncached(
         self,
-        images: List[Union[str, Path, Image.Image]],
+        images: List[ImageSource],
         return_all: bool = False
     ) -> List[Dict[str, any]]:
-        # First validate all images
-        pil_images = []
-        results = []
-        valid_indices = []
+        return self._results_from_arrays(self.predict_arrays(images), return_all)
+    
+    def _results_from_arrays(self, arrays: Dict[str, np.ndarray], return_all: bool) -> List[Dict[str, any]]:
+        """Per-image result dicts, built from predict_arrays output."""
+        # Convert each column to Python scalars in one call
+        is_plant = arrays['is_plant'].tolist()
+        class_idx = arrays['class_idx'].tolist()
+        confidence = arrays['confidence'].tolist()
+        stages = arrays['model_stage'].tolist() if 'model_stage' in arrays else None
+        if return_all:
+            keep = (arrays['top_k_probs'] >= self.confidence_threshold).tolist()
+            top_k_indices = arrays['top_k_indices'].tolist()
+            top_k_probs = arrays['top_k_probs'].tolist()
+        if self.return_embeddings:
+            has_embedding = ~np.isnan(arrays['embeddings'][:, 0])
+        if self.return_heatmaps:
+            has_heatmap = ~np.isnan(arrays['heatmaps'][:, 0, 0])
+            heatmaps = np.round(np.nan_to_num(arrays['heatmaps']) * 255).astype(np.uint8)
         
-        for i, img in enumerate(images):
-            # Load image if needed
-            if isinstance(img, (str, Path)):
-                pil_image = Image.open(img).convert('RGB')
-            else:
-                pil_image = img.convert('RGB')
-            
-            # Check if it's a plant image
-            is_plant, reason = self._is_plant_image(pil_image)
-            if not is_plant:
+        results = []
+        for i, plant in enumerate(is_plant):
+            if not plant:
                 results.append({
                     'class_name': 'Not a plant image',
                     'class_idx': -1,
                     'confidence': 0.0,
-                    'error': reason,
+                    'error': arrays['gate_reason'][i],
                     'is_plant': False
                 })
-            else:
-                pil_images.append(pil_image)
-                valid_indices.append(i)
-                results.append(None)  # Placeholder
-        
-        # Process valid images
-        if pil_images:
-            tensors = [self._preprocess_image(img) for img in pil_images]
-            batch = torch.cat(tensors, dim=0).to(self.device)
+                continue
             
-            with torch.no_grad():
-                logits = self.model(batch)
-                probabilities = torch.softmax(logits, dim=1)
+            result = {
+                'class_name': self.idx_to_class.get(class_idx[i], 'Unknown'),
+                'class_idx': class_idx[i],
+                'confidence': confidence[i],
+                'is_plant': True
+            }
             
-            for j, i in enumerate(valid_indices):
-                probs = probabilities[j]
-                top_prob, top_idx = probs.max(dim=0)
-                
-                result = {
-                    'class_name': self.idx_to_class.get(top_idx.item(), 'Unknown'),
-                    'class_idx': top_idx.item(),
-                    'confidence': top_prob.item(),
-                    'is_plant': True
-                }
-                
-                if return_all:
-                    top_k_probs, top_k_indices = probs.topk(self.top_k)
-                    
-                    top_k_predictions = []
-                    for prob, idx in zip(top_k_probs, top_k_indices):
-                        prob_val = prob.item()
-                        if prob_val >= self.confidence_threshold:
-                            top_k_predictions.append({
-                                'class_name': self.idx_to_class.get(idx.item(), 'Unknown'),
-                                'class_idx': idx.item(),
-                                'confidence': prob_val,
-                            })
-                    
-                    result['top_k'] = top_k_predictions
-                
-                results[i] = result
+            if stages is not None:
+                result['model_stage'] = stages[i]
+            
+            if self.return_embeddings:
+                result['embedding'] = arrays['embeddings'][i].copy() if has_embedding[i] else None
+                result['embedding_model'] = self.embedding_model
+            
+            if self.return_heatmaps:
+                result['heatmap'] = heatmaps[i] if has_heatmap[i] else None
+            
+            if return_all:
+                result['top_k'] = [
+                    {
+                        'class_name': self.idx_to_class.get(idx, 'Unknown'),
+                        'class_idx': idx,
+                        'confidence': prob,
+                    }
+                    for idx, prob, ok in zip(top_k_indices[i], top_k_probs[i], keep[i])
+                    if ok
+                ]
+            
+            results.append(result)
         
         return results
     
+    def warmup(self, batch_sizes: Tuple[int, ...] = (1,), iterations: int = 2) -> Dict[int, float]:
+        """
+        Run forward passes at the expected batch sizes so allocator pools and
+        kernel selection are settled before real traffic arrives.
+        Returns the last pass's latency in milliseconds per batch size.
+        """
+        timings = {}
+        height, width = self.preprocess.image_size
+        for batch_size in batch_sizes:
+            batch = torch.zeros((batch_size, 3, height, width), device=self.device)
+            if self.frozen:
+                batch = batch.contiguous(memory_format=torch.channels_last)
+            for _ in range(max(iterations, 1)):
+                if self.stage1_model is not None:
+                    with torch.no_grad():
+                        self.stage1_model(batch)
+                t0 = time.perf_counter()
+                self._forward(batch)
+                timings[batch_size] = 1000.0 * (time.perf_counter() - t0)
+        print("Warmup complete: " + ", ".join(f"bs={bs} {ms:.1f} ms" for bs, ms in timings.items()))
+        return timings
+    
+    def get_cascade_metrics(self) -> Optional[Dict[str, any]]:
+        if self.stage1_model is None:
+            return None
+        
+        with self._cascade_lock:
+            images = self._cascade_images
+            escalated = self._cascade_escalated
+            stage1_ms = np.asarray(self._stage1_ms)
+            stage2_ms = np.asarray(self._stage2_ms)
+        
+        def summarise(values: np.ndarray) -> Dict[str, float]:
+            if values.size == 0:
+                return {"batches": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0}
+            return {
+                "batches": int(values.size),
+                "mean": round(float(values.mean()), 3),
+                "p50": round(float(np.percentile(values, 50)), 3),
+                "p95": round(float(np.percentile(values, 95)), 3),
+            }
+        
+        return {
+            "threshold": self.cascade_threshold,
+            "images": images,
+            "escalated": escalated,
+            "escalation_rate": round(escalated / images, 4) if images else 0.0,
+            "stage1_ms": summarise(stage1_ms),
+            "stage2_ms": summarise(stage2_ms),
+        }
+    
     def get_all_classes(self) -> List[str]:
         return sorted(self.idx_to_class.values())
     
@@ -263,5 +748,7 @@ class PlantDiseasePredictor:
             f"PlantDiseasePredictor("
             f"model={self.model_path.name}, "
             f"classes={self.num_classes}, "
-            f"device={self.device})"
+            f"device={self.device}, "
+            f"backend={self.backend}, "
+            f"precision={self.precision})"
         )
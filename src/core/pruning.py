@@ -0,0 +1,232 @@
+import copy
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+from torchvision.models.resnet import BasicBlock, Bottleneck
+
+
+# Kept channel counts are rounded to this multiple: oneDNN convolutions
+# vectorize over blocks of 8/16 channels, so ragged widths give back part of
+# the FLOP savings.
+CHANNEL_MULTIPLE = 8
+
+
+def _blocks(model: nn.Module) -> Iterator[Tuple[str, nn.Module]]:
+    for name, module in model.named_modules():
+        if isinstance(module, (Bottleneck, BasicBlock)):
+            yield name, module
+
+
+def _inner_layers(block: nn.Module) -> List[Tuple[str, str, str]]:
+    """
+    (conv, bn, consumer conv) attribute names of the channels inside a
+    residual block. Only these are pruned: the block's output channels are
+    added to the shortcut and shared with every other block of the stage.
+    """
+    if isinstance(block, Bottleneck):
+        return [("conv1", "bn1", "conv2"), ("conv2", "bn2", "conv3")]
+    return [("conv1", "bn1", "conv2")]
+
+
+def channel_widths(model: nn.Module) -> Dict[str, List[int]]:
+    """Inner channel count of every residual block, keyed by module path."""
+    return {
+        name: [getattr(block, conv).out_channels for conv, _, _ in _inner_layers(block)]
+        for name, block in _blocks(model)
+    }
+
+
+def channel_importance(conv: nn.Conv2d, bn: nn.BatchNorm2d) -> torch.Tensor:
+    """
+    L1 norm of each output filter as it leaves the BatchNorm: the filter's
+    weights scaled by |gamma| / sqrt(running_var + eps).
+    """
+    scale = bn.weight.detach().abs() / torch.sqrt(bn.running_var + bn.eps)
+    return conv.weight.detach().abs().flatten(1).sum(dim=1) * scale
+
+
+def kept_channels(channels: int, sparsity: float, multiple: int = CHANNEL_MULTIPLE) -> int:
+    keep = round(channels * (1.0 - sparsity) / multiple) * multiple
+    return int(min(channels, max(multiple, keep)))
+
+
+def _narrow_conv(conv: nn.Conv2d, out_index: Optional[torch.Tensor], in_index: Optional[torch.Tensor]) -> nn.Conv2d:
+    weight = conv.weight.detach()
+    if out_index is not None:
+        weight = weight.index_select(0, out_index.to(weight.device))
+    if in_index is not None:
+        weight = weight.index_select(1, in_index.to(weight.device))
+    narrowed = nn.Conv2d(
+        weight.shape[1] * conv.groups, weight.shape[0], conv.kernel_size, stride=conv.stride,
+        padding=conv.padding, dilation=conv.dilation, groups=conv.groups, bias=conv.bias is not None,
+        device=weight.device, dtype=weight.dtype,
+    )
+    narrowed.weight = nn.Parameter(weight.clone(), requires_grad=conv.weight.requires_grad)
+    if conv.bias is not None:
+        bias = conv.bias.detach()
+        if out_index is not None:
+            bias = bias.index_select(0, out_index.to(bias.device))
+        narrowed.bias = nn.Parameter(bias.clone(), requires_grad=conv.bias.requires_grad)
+    return narrowed.train(conv.training)
+
+
+def _narrow_bn(bn: nn.BatchNorm2d, index: torch.Tensor) -> nn.BatchNorm2d:
+    device = bn.weight.device
+    index = index.to(device)
+    narrowed = nn.BatchNorm2d(index.numel(), eps=bn.eps, momentum=bn.momentum, device=device, dtype=bn.weight.dtype)
+    narrowed.weight = nn.Parameter(bn.weight.detach().index_select(0, index).clone(), requires_grad=bn.weight.requires_grad)
+    narrowed.bias = nn.Parameter(bn.bias.detach().index_select(0, index).clone(), requires_grad=bn.bias.requires_grad)
+    narrowed.running_mean = bn.running_mean.index_select(0, index).clone()
+    narrowed.running_var = bn.running_var.index_select(0, index).clone()
+    narrowed.num_batches_tracked = bn.num_batches_tracked.clone()
+    return narrowed.train(bn.training)
+
+
+def _narrow_block(block: nn.Module, keep: Sequence[torch.Tensor]):
+    for (conv, bn, consumer), index in zip(_inner_layers(block), keep):
+        setattr(block, conv, _narrow_conv(getattr(block, conv), index, None))
+        setattr(block, bn, _narrow_bn(getattr(block, bn), index))
+        setattr(block, consumer, _narrow_conv(getattr(block, consumer), None, index))
+
+
+def _check_prunable(model: nn.Module):
+    if not any(True for _ in _blocks(model)):
+        raise ValueError(
+            f"Channel pruning needs a ResNet backbone; {getattr(model, 'backbone_name', type(model).__name__)} has no residual blocks."
+        )
+
+
+def prune_channels(model: nn.Module, sparsity: float, multiple: int = CHANNEL_MULTIPLE) -> nn.Module:
+    """
+    A dense copy of a ResNet-backed DiseaseClassifier with the given
+    fraction of every block's inner channels removed, lowest importance
+    first. The copy records its widths in channel_widths, so save_model /
+    load_model rebuild the smaller architecture.
+    """
+    if not 0 <= sparsity < 1:
+        raise ValueError(f"sparsity must be in [0, 1), got {sparsity}")
+    _check_prunable(model)
+
+    pruned = copy.deepcopy(model)
+    for _, block in _blocks(pruned):
+        keep = []
+        for conv, bn, _ in _inner_layers(block):
+            importance = channel_importance(getattr(block, conv), getattr(block, bn))
+            count = kept_channels(importance.numel(), sparsity, multiple)
+            # Sorted so surviving channels keep their original order
+            keep.append(importance.topk(count).indices.sort().values)
+        _narrow_block(block, keep)
+
+    pruned.channel_widths = channel_widths(pruned)
+    return pruned
+
+
+def apply_channel_widths(model: nn.Module, widths: Dict[str, List[int]]) -> nn.Module:
+    """Reshape a freshly built model to recorded channel widths (weights are loaded afterwards)."""
+    blocks = dict(_blocks(model))
+    for name, block_widths in widths.items():
+        if name not in blocks:
+            raise ValueError(f"Checkpoint prunes {name}, which the {getattr(model, 'backbone_name', '')} backbone does not have.")
+        _narrow_block(blocks[name], [torch.arange(width) for width in block_widths])
+    model.channel_widths = {name: list(w) for name, w in widths.items()}
+    return model
+
+
+def count_macs(model: nn.Module, image_size: Tuple[int, int] = (224, 224)) -> int:
+    """Multiply-accumulates of one forward pass at batch size 1 (convolutions and linear layers)."""
+    total = 0
+
+    def conv_hook(module, inputs, output):
+        nonlocal total
+        kernel = module.weight.shape[1] * module.weight.shape[2] * module.weight.shape[3]
+        total += output[0].numel() * kernel
+
+    def linear_hook(module, inputs, output):
+        nonlocal total
+        total += module.in_features * module.out_features
+
+    handles = []
+    for module in model.modules():
+        if isinstance(module, nn.Conv2d):
+            handles.append(module.register_forward_hook(conv_hook))
+        elif isinstance(module, nn.Linear):
+            handles.append(module.register_forward_hook(linear_hook))
+    try:
+        device = next(model.parameters()).device
+        was_training = model.training
+        model.eval()
+        with torch.no_grad():
+            model(torch.zeros(1, 3, *image_size, device=device))
+        model.train(was_training)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return total
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+    from pathlib import Path
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    from src.core.model import DiseaseClassifier, convert_checkpoint, load_model, save_model
+    from src.utils.benchmark import measure_latency
+
+    torch.manual_seed(0)
+
+    print("Testing Channel Pruning...")
+    print()
+
+    model = DiseaseClassifier(num_classes=10, pretrained=False, backbone="resnet50").eval()
+    # Give BatchNorm non-trivial statistics so importance is not uniform
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm2d):
+            module.weight.data.uniform_(0.1, 1.0)
+            module.running_var.uniform_(0.5, 2.0)
+    batch = torch.randn(4, 3, 224, 224)
+
+    print("Test 1: Pruned models are dense and smaller...")
+    base_macs = count_macs(model)
+    base_params = model.get_total_parameters()
+    for sparsity in (0.25, 0.5):
+        pruned = prune_channels(model, sparsity).eval()
+        macs = count_macs(pruned)
+        with torch.no_grad():
+            assert pruned(batch).shape == (4, 10)
+        assert all(not (p == 0).all(dim=tuple(range(1, p.ndim))).any() for p in pruned.parameters() if p.ndim == 4)
+        print(f"sparsity {sparsity:.2f}: {macs / 1e9:.2f} vs {base_macs / 1e9:.2f} GMACs, "
+              f"{pruned.get_total_parameters() / 1e6:.1f}M vs {base_params / 1e6:.1f}M params")
+        assert macs < base_macs and pruned.get_total_parameters() < base_params
+    widths = channel_widths(pruned)
+    assert widths["backbone.layer1.0"] == [32, 32] and widths["backbone.layer4.2"] == [256, 256]
+    print()
+
+    print("Test 2: Sparsity 0 keeps the function unchanged...")
+    with torch.no_grad():
+        assert torch.allclose(prune_channels(model, 0.0)(batch), model(batch), atol=1e-5)
+    print()
+
+    print("Test 3: save_model / load_model rebuild the pruned architecture...")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "pruned.pth"
+        save_model(pruned, path)
+        for checkpoint in (path, convert_checkpoint(path)):
+            reloaded = load_model(checkpoint, device="cpu", for_inference=True)
+            assert channel_widths(reloaded) == widths
+            with torch.no_grad():
+                assert torch.allclose(reloaded(batch), pruned(batch), atol=1e-5)
+    print()
+
+    print("Test 4: CPU latency...")
+    single = torch.randn(1, 3, 224, 224)
+    for name, candidate in (("dense", model), ("pruned 0.50", pruned)):
+        stats = measure_latency(lambda: candidate(single), warmup=2, iterations=5)
+        print(f"{name}: {stats['mean_ms']:.1f} ms")
+    print()
+
+    print("All tests passed!")
@@ -0,0 +1,247 @@
+import copy
+import json
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Subset, random_split
+
+from src.core.dataset import PlantDiseaseDataset, get_val_transforms
+
+
+def get_calibration_loaders(
+    data_directories: List[Path],
+    calibration_images: int = 512,
+    batch_size: int = 32,
+    train_split: float = 0.8,
+    num_workers: int = 4,
+    seed: int = 42,
+) -> Tuple[DataLoader, DataLoader, PlantDiseaseDataset]:
+    """
+    Rebuild the validation split used by create_dataloaders and cut it in two:
+    a calibration slice for the observers and the held-out remainder for the
+    accuracy report, so calibration images are never scored.
+    """
+    dataset = PlantDiseaseDataset(
+        data_directories=data_directories,
+        transform=get_val_transforms()
+    )
+
+    total_size = len(dataset)
+    train_size = int(train_split * total_size)
+    val_size = total_size - train_size
+
+    _, val_dataset = random_split(
+        dataset,
+        [train_size, val_size],
+        generator=torch.Generator().manual_seed(seed)
+    )
+
+    val_indices = list(val_dataset.indices)
+    calibration_images = min(calibration_images, len(val_indices) // 2)
+    calibration_set = Subset(dataset, val_indices[:calibration_images])
+    evaluation_set = Subset(dataset, val_indices[calibration_images:])
+
+    print(f"Calibration images: {len(calibration_set):,}")
+    print(f"Evaluation images: {len(evaluation_set):,}")
+
+    calibration_loader = DataLoader(
+        calibration_set,
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+    )
+    evaluation_loader = DataLoader(
+        evaluation_set,
+        batch_size=batch_size,
+        shuffle=False,
+        num_workers=num_workers,
+    )
+
+    return calibration_loader, evaluation_loader, dataset
+
+
+def quantize_model(
+    model: nn.Module,
+    calibration_loader: DataLoader,
+    engine: str = "x86",
+    image_size=(224, 224),
+) -> nn.Module:
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+    torch.backends.quantized.engine = engine
+
+    model = copy.deepcopy(model).to("cpu").eval()
+    example_inputs = (torch.randn(1, 3, *image_size),)
+
+    prepared = prepare_fx(model, get_default_qconfig_mapping(engine), example_inputs)
+
+    print(f"Calibrating on {len(calibration_loader)} batches...")
+    with torch.no_grad():
+        for images, _ in calibration_loader:
+            prepared(images)
+
+    quantized = convert_fx(prepared)
+    quantized.eval()
+    return quantized
+
+
+def _source_metadata(checkpoint_path: Union[str, Path]) -> str:
+    from src.core.model import weights_fingerprint
+
+    checkpoint_path = Path(checkpoint_path)
+    return json.dumps({"checkpoint": checkpoint_path.name, "weights": weights_fingerprint(checkpoint_path)}, sort_keys=True)
+
+
+def save_quantized_model(
+    model: nn.Module,
+    save_path: Union[str, Path],
+    image_size=(224, 224),
+    source_checkpoint: Optional[Union[str, Path]] = None,
+) -> Path:
+    """
+    Save the INT8 model as a frozen TorchScript graph. With source_checkpoint
+    the fp32 weights it was calibrated from are recorded, so loading can
+    refuse an artifact left behind by a retrain.
+    """
+    save_path = Path(save_path)
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with torch.no_grad():
+        scripted = torch.jit.trace(model, torch.randn(1, 3, *image_size))
+        scripted = torch.jit.freeze(scripted)
+    extra_files = {"source.json": _source_metadata(source_checkpoint)} if source_checkpoint else {}
+    torch.jit.save(scripted, str(save_path), _extra_files=extra_files)
+
+    print(f"Quantized model saved to: {save_path}")
+    return save_path
+
+
+def load_quantized_model(
+    load_path: Union[str, Path],
+    engine: str = "x86",
+    source_checkpoint: Optional[Union[str, Path]] = None,
+) -> torch.jit.ScriptModule:
+    """
+    Load an INT8 artifact. With source_checkpoint, refuse one that was not
+    calibrated from those weights: re-quantizing needs calibration data, so
+    it cannot happen at serving time.
+    """
+    load_path = Path(load_path)
+    if not load_path.exists():
+        raise FileNotFoundError(
+            f"Quantized model not found: {load_path}. Run `python src/quantize.py` to calibrate one."
+        )
+
+    torch.backends.quantized.engine = engine
+    extra_files = {"source.json": ""}
+    model = torch.jit.load(str(load_path), map_location="cpu", _extra_files=extra_files)
+    if source_checkpoint is not None:
+        # _extra_files comes back as bytes (empty when the entry is absent)
+        recorded = extra_files["source.json"].decode() if extra_files["source.json"] else ""
+        if recorded != _source_metadata(source_checkpoint):
+            built_from = f"other weights ({json.loads(recorded)['checkpoint']})" if recorded else "unrecorded weights"
+            raise ValueError(
+                f"Quantized model {load_path} was calibrated from {built_from}, not the current "
+                f"{Path(source_checkpoint).name}. Run `python src/quantize.py` to re-quantize it."
+            )
+    model.eval()
+    return model
+
+
+def per_class_accuracy(
+    model: nn.Module,
+    loader: DataLoader,
+    num_classes: int,
+) -> Tuple[np.ndarray, np.ndarray, float]:
+    correct = np.zeros(num_classes, dtype=np.int64)
+    total = np.zeros(num_classes, dtype=np.int64)
+    elapsed = 0.0
+
+    with torch.no_grad():
+        for images, labels in loader:
+            t0 = time.perf_counter()
+            predicted = model(images).argmax(dim=1)
+            elapsed += time.perf_counter() - t0
+
+            labels = labels.numpy()
+            hits = (predicted.numpy() == labels)
+            np.add.at(total, labels, 1)
+            np.add.at(correct, labels, hits.astype(np.int64))
+
+    images_per_sec = total.sum() / elapsed if elapsed > 0 else 0.0
+    return correct, total, images_per_sec
+
+
+def accuracy_delta_report(
+    fp32_model: nn.Module,
+    int8_model: nn.Module,
+    loader: DataLoader,
+    idx_to_class: Dict[int, str],
+    fp32_path: Optional[Path] = None,
+    int8_path: Optional[Path] = None,
+) -> Dict:
+    num_classes = len(idx_to_class)
+
+    print("Scoring fp32 model...")
+    fp32_correct, total, fp32_ips = per_class_accuracy(fp32_model, loader, num_classes)
+    print("Scoring int8 model...")
+    int8_correct, _, int8_ips = per_class_accuracy(int8_model, loader, num_classes)
+
+    per_class = []
+    for idx in range(num_classes):
+        if total[idx] == 0:
+            continue
+        fp32_acc = 100.0 * fp32_correct[idx] / total[idx]
+        int8_acc = 100.0 * int8_correct[idx] / total[idx]
+        per_class.append({
+            "class_name": idx_to_class.get(idx, "Unknown"),
+            "support": int(total[idx]),
+            "fp32_acc": round(fp32_acc, 2),
+            "int8_acc": round(int8_acc, 2),
+            "delta": round(int8_acc - fp32_acc, 2),
+        })
+    per_class.sort(key=lambda row: row["delta"])
+
+    report = {
+        "num_images": int(total.sum()),
+        "fp32_acc": round(100.0 * fp32_correct.sum() / max(total.sum(), 1), 2),
+        "int8_acc": round(100.0 * int8_correct.sum() / max(total.sum(), 1), 2),
+        "fp32_images_per_sec": round(float(fp32_ips), 1),
+        "int8_images_per_sec": round(float(int8_ips), 1),
+        "speedup": round(float(int8_ips / fp32_ips), 2) if fp32_ips else None,
+        "per_class": per_class,
+    }
+    report["delta"] = round(report["int8_acc"] - report["fp32_acc"], 2)
+
+    if fp32_path is not None and int8_path is not None:
+        fp32_mb = Path(fp32_path).stat().st_size / 2**20
+        int8_mb = Path(int8_path).stat().st_size / 2**20
+        report["fp32_size_mb"] = round(fp32_mb, 1)
+        report["int8_size_mb"] = round(int8_mb, 1)
+        report["size_ratio"] = round(fp32_mb / int8_mb, 2) if int8_mb else None
+
+    return report
+
+
+def print_report(report: Dict, worst_n: int = 10):
+    print("=" * 70)
+    print("INT8 vs FP32 ACCURACY REPORT")
+    print("=" * 70)
+    print(f"Images: {report['num_images']:,}")
+    print(f"FP32 Acc: {report['fp32_acc']:.2f}%  INT8 Acc: {report['int8_acc']:.2f}%  Delta: {report['delta']:+.2f}")
+    print(f"Throughput: {report['fp32_images_per_sec']} -> {report['int8_images_per_sec']} img/s (x{report['speedup']})")
+    if "size_ratio" in report:
+        print(f"Artifact size: {report['fp32_size_mb']} MB -> {report['int8_size_mb']} MB (x{report['size_ratio']})")
+    print("-" * 70)
+    print(f"Largest per-class drops (worst {worst_n}):")
+    for row in report["per_class"][:worst_n]:
+        print(
+            f"  {row['class_name']:<45} n={row['support']:<5} "
+            f"{row['fp32_acc']:6.2f}% -> {row['int8_acc']:6.2f}% ({row['delta']:+.2f})"
+        )
+    print("=" * 70)
@@ -0,0 +1,565 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from src.core.cache import checkpoint_identity
+from src.core.executor import PRIORITY_SHADOW, InferenceExecutor, QueueFullError
+
+
+# Nice value for shadow threads (Linux applies it per thread): candidate
+# inference only gets CPU time the serving threads leave unused.
+SHADOW_NICENESS = 10
+
+
+class RegistryError(Exception):
+    """Raised when a registry operation does not apply in the current state."""
+
+
+class ModelVersion:
+    """One loaded (or loading) checkpoint and its lifecycle state."""
+
+    def __init__(self, version: str, model_path: Union[str, Path]):
+        self.version = version
+        self.model_path = Path(model_path)
+        self.predictor = None
+        # loading -> warming -> ready (or failed)
+        self.status = "loading"
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.warmup_ms: Optional[Dict[str, float]] = None
+        self.loaded_at: Optional[str] = None
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "model_path": str(self.model_path),
+            "status": self.status,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "warmup_ms": self.warmup_ms,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ShadowStats:
+    """Top-1 agreement and per-image latency of the candidate against the active model."""
+
+    def __init__(self, window: int = 1000):
+        self.submitted = 0
+        self.skipped = 0
+        self.errors = 0
+        self.compared = 0
+        self.agreed = 0
+        self._active_ms = deque(maxlen=window)
+        self._candidate_ms = deque(maxlen=window)
+
+    def record(self, agreed: int, compared: int, active_ms: float, candidate_ms: float):
+        self.compared += compared
+        self.agreed += agreed
+        self._active_ms.append(active_ms)
+        self._candidate_ms.append(candidate_ms)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        def summarise(values) -> Dict[str, float]:
+            values = np.asarray(values)
+            if values.size == 0:
+                return {"mean": 0.0, "p50": 0.0, "p95": 0.0}
+            return {
+                "mean": round(float(values.mean()), 3),
+                "p50": round(float(np.percentile(values, 50)), 3),
+                "p95": round(float(np.percentile(values, 95)), 3),
+            }
+
+        return {
+            "submitted": self.submitted,
+            "skipped_busy": self.skipped,
+            "errors": self.errors,
+            "compared": self.compared,
+            "top1_agreement": round(self.agreed / self.compared, 4) if self.compared else None,
+            # Per image; the active side is as served, i.e. including cache hits
+            "active_ms_per_image": summarise(self._active_ms),
+            "candidate_ms_per_image": summarise(self._candidate_ms),
+        }
+
+
+def _lower_thread_priority():
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), SHADOW_NICENESS)
+    except (AttributeError, OSError):
+        pass
+
+
+class ModelRegistry:
+    """
+    The serving model plus an optional candidate, swappable without restarts.
+
+    build_fn(model_path) constructs a predictor and warmup_fn(predictor)
+    warms it, returning per-batch-size milliseconds. A candidate is loaded
+    and warmed on a background thread and promoted by swapping one
+    reference: calls already running finish on the model they started
+    with, and the previous version is kept for rollback.
+
+    With a shadow fraction set, that share of the images served by
+    predict_batch is re-scored by the ready candidate on a low-priority
+    thread after the response is produced. Shadow work is dropped instead
+    of queued when is_busy() reports serving load or max_pending shadow
+    batches are already outstanding. Given an executor, shadow batches run
+    on its workers in the shadow priority class, behind all interactive and
+    bulk work and subject to that class's share, queue and deadline.
+
+    The active version is recorded in state_path so every worker process
+    (and the next start) serves the same model; see sync(). on_activate is
+    called with each version after it is swapped in.
+    """
+
+    def __init__(
+        self,
+        build_fn: Callable[[Path], Any],
+        warmup_fn: Optional[Callable[[Any], Dict[int, float]]] = None,
+        state_path: Optional[Union[str, Path]] = None,
+        is_busy: Optional[Callable[[], bool]] = None,
+        shadow_max_pending: int = 2,
+        on_activate: Optional[Callable[[ModelVersion], None]] = None,
+        executor: Optional[InferenceExecutor] = None,
+    ):
+        self.build_fn = build_fn
+        self.warmup_fn = warmup_fn
+        self.state_path = Path(state_path) if state_path else None
+        self.is_busy = is_busy
+        self.shadow_max_pending = shadow_max_pending
+        self.on_activate = on_activate
+        self.executor = executor
+
+        self.active: Optional[ModelVersion] = None
+        self.previous: Optional[ModelVersion] = None
+        self.candidate: Optional[ModelVersion] = None
+        self.shadow_fraction = 0.0
+        self.shadow_stats = ShadowStats()
+
+        self._lock = threading.Lock()
+        self._syncing: Optional[ModelVersion] = None
+        self._sync_failed: Optional[Tuple[str, str]] = None
+        self._shadow_pending = 0
+        self._shadow_pool = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="shadow", initializer=_lower_thread_priority
+        )
+        self._rng = np.random.default_rng()
+
+    @property
+    def predictor(self):
+        active = self.active
+        return active.predictor if active is not None else None
+
+    # ---------------------------------------------------------------- loading
+
+    @staticmethod
+    def default_version(model_path: Union[str, Path]) -> str:
+        model_path = Path(model_path)
+        stat = model_path.stat()
+        return f"{model_path.stem}@{time.strftime('%Y%m%d-%H%M%S', time.localtime(stat.st_mtime))}"
+
+    def load(self, entry: ModelVersion) -> ModelVersion:
+        """Build and warm entry's predictor in the calling thread; failures end in status 'failed'."""
+        t0 = time.perf_counter()
+        try:
+            predictor = self.build_fn(entry.model_path)
+            entry.load_seconds = round(time.perf_counter() - t0, 2)
+            entry.status = "warming"
+            if self.warmup_fn is not None:
+                warmup_ms = self.warmup_fn(predictor)
+                entry.warmup_ms = {str(bs): round(ms, 2) for bs, ms in warmup_ms.items()}
+            entry.predictor = predictor
+            entry.loaded_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+            entry.status = "ready"
+        except Exception as e:
+            entry.status = "failed"
+            entry.error = str(e)
+            print(f"Model {entry.version} failed to load: {e}")
+        return entry
+
+    def load_candidate(
+        self,
+        model_path: Union[str, Path],
+        version: Optional[str] = None,
+        shadow_fraction: float = 0.0,
+    ) -> ModelVersion:
+        """Start loading a candidate in the background, replacing any previous candidate."""
+        model_path = Path(model_path)
+        if not model_path.exists():
+            raise RegistryError(f"Checkpoint not found: {model_path}")
+        if not 0.0 <= shadow_fraction <= 1.0:
+            raise RegistryError("Shadow fraction must be between 0 and 1")
+        entry = ModelVersion(version or self.default_version(model_path), model_path)
+
+        with self._lock:
+            if self.candidate is not None and self.candidate.status in ("loading", "warming"):
+                raise RegistryError(f"Candidate {self.candidate.version} is still loading")
+            self.candidate = entry
+            self.shadow_fraction = 0.0
+            self.shadow_stats = ShadowStats()
+
+        def load_then_shadow():
+            self.load(entry)
+            if entry.status == "ready" and self.candidate is entry:
+                self.set_shadow_fraction(shadow_fraction)
+
+        threading.Thread(target=load_then_shadow, name=f"load-{entry.version}", daemon=True).start()
+        return entry
+
+    def set_shadow_fraction(self, fraction: float):
+        if not 0.0 <= fraction <= 1.0:
+            raise RegistryError("Shadow fraction must be between 0 and 1")
+        self.shadow_fraction = fraction
+
+    def discard_candidate(self) -> ModelVersion:
+        with self._lock:
+            if self.candidate is None:
+                raise RegistryError("No candidate model is loaded")
+            entry, self.candidate = self.candidate, None
+            self.shadow_fraction = 0.0
+        return entry
+
+    # --------------------------------------------------------------- swapping
+
+    def activate(self, entry: ModelVersion, record: bool = True):
+        """Swap entry in as the serving model."""
+        if entry.status != "ready":
+            raise RegistryError(f"Model {entry.version} is not ready ({entry.status})")
+        with self._lock:
+            if self.active is not entry:
+                self.previous, self.active = self.active, entry
+            if self.candidate is entry:
+                self.candidate = None
+                self.shadow_fraction = 0.0
+        if record:
+            self._write_state(entry)
+        print(f"Serving model {entry.version} ({entry.model_path.name})")
+        if self.on_activate is not None:
+            self.on_activate(entry)
+
+    def promote(self) -> ModelVersion:
+        entry = self.candidate
+        if entry is None:
+            raise RegistryError("No candidate model is loaded")
+        self.activate(entry)
+        return entry
+
+    def rollback(self) -> ModelVersion:
+        entry = self.previous
+        if entry is None:
+            raise RegistryError("No previous model to roll back to")
+        self.activate(entry)
+        return entry
+
+    def _write_state(self, entry: ModelVersion):
+        if self.state_path is None:
+            return
+        state = {
+            "version": entry.version,
+            "model_path": str(entry.model_path),
+            "checkpoint": checkpoint_identity(entry.model_path),
+            "activated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(self.state_path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        tmp_path.replace(self.state_path)
+
+    def read_state(self) -> Optional[Dict[str, str]]:
+        if self.state_path is None or not self.state_path.exists():
+            return None
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not read model registry state {self.state_path} ({e})")
+            return None
+
+    def sync(self) -> bool:
+        """
+        Follow a promotion or rollback made by another worker process: if
+        the recorded version differs from ours, load it in the background
+        and swap it in when warm. Returns True if a load was started.
+
+        A version that failed to load is not retried until the recorded
+        version or its checkpoint file changes.
+        """
+        state = self.read_state()
+        active = self.active
+        if state is None or active is None or state["version"] == active.version:
+            return False
+        if self._syncing is not None and self._syncing.version == state["version"]:
+            return False
+        if self.previous is not None and self.previous.version == state["version"]:
+            self.activate(self.previous, record=False)
+            return False
+        attempt = (state["version"], checkpoint_identity(state["model_path"]))
+        if attempt == self._sync_failed:
+            return False
+
+        entry = ModelVersion(state["version"], state["model_path"])
+        self._syncing = entry
+
+        def load_and_activate():
+            self.load(entry)
+            if entry.status == "ready":
+                self._sync_failed = None
+                self.activate(entry, record=False)
+            else:
+                self._sync_failed = attempt
+                print(f"Staying on {self.active.version} until the registry entry for {entry.version} changes")
+            self._syncing = None
+
+        print(f"Model registry changed to {entry.version}; loading it...")
+        threading.Thread(target=load_and_activate, name=f"sync-{entry.version}", daemon=True).start()
+        return True
+
+    # ---------------------------------------------------------------- serving
+
+    def predict_batch(self, images: List[Any], return_all: bool = False) -> List[Dict[str, Any]]:
+        active = self.active
+        if active is None:
+            raise RegistryError("No model is loaded")
+        t0 = time.perf_counter()
+        results = active.predictor.predict_batch(images, return_all=return_all)
+        active_ms = 1000.0 * (time.perf_counter() - t0) / max(len(images), 1)
+
+        if self.shadow_fraction > 0.0:
+            self._submit_shadow(images, results, active_ms)
+        return results
+
+    def _submit_shadow(self, images: List[Any], results: List[Dict[str, Any]], active_ms: float):
+        candidate = self.candidate
+        if candidate is None or candidate.status != "ready":
+            return
+        picked = np.flatnonzero(self._rng.random(len(images)) < self.shadow_fraction)
+        if picked.size == 0:
+            return
+
+        with self._lock:
+            stats = self.shadow_stats
+            busy = self._shadow_pending >= self.shadow_max_pending or (self.is_busy is not None and self.is_busy())
+            if busy:
+                stats.skipped += int(picked.size)
+                return
+            self._shadow_pending += 1
+            stats.submitted += int(picked.size)
+
+        args = (candidate, stats, [images[i] for i in picked], [results[i] for i in picked], active_ms)
+        if self.executor is None:
+            self._shadow_pool.submit(self._run_shadow, *args)
+            return
+
+        try:
+            future = self.executor.submit(self._run_shadow, *args, priority=PRIORITY_SHADOW)
+        except QueueFullError:
+            self._shed_shadow(stats, int(picked.size))
+            return
+        # _run_shadow handles its own errors: an exception means it was
+        # dropped past its deadline (or cancelled at shutdown) and never ran
+        future.add_done_callback(
+            lambda f: (f.cancelled() or f.exception() is not None) and self._shed_shadow(stats, int(picked.size))
+        )
+
+    def _shed_shadow(self, stats: ShadowStats, count: int):
+        with self._lock:
+            self._shadow_pending -= 1
+            stats.submitted -= count
+            stats.skipped += count
+
+    def _run_shadow(self, candidate: ModelVersion, stats: ShadowStats, images, results, active_ms: float):
+        try:
+            t0 = time.perf_counter()
+            # Column-wise and uncached, so the latency is the model's own
+            arrays = candidate.predictor.predict_arrays(images)
+            candidate_ms = 1000.0 * (time.perf_counter() - t0) / len(images)
+
+            names = candidate.predictor.idx_to_class
+            compared = agreed = 0
+            for result, plant, idx in zip(results, arrays["is_plant"].tolist(), arrays["class_idx"].tolist()):
+                if not (plant and result.get("is_plant", True)):
+                    continue
+                compared += 1
+                agreed += names.get(idx) == result["class_name"]
+            with self._lock:
+                stats.record(agreed, compared, active_ms, candidate_ms)
+        except Exception as e:
+            with self._lock:
+                stats.errors += 1
+            print(f"Shadow evaluation of {candidate.version} failed: {e}")
+        finally:
+            with self._lock:
+                self._shadow_pending -= 1
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            active, previous, candidate = self.active, self.previous, self.candidate
+            shadow = self.shadow_stats.get_metrics()
+        return {
+            "active": active.describe() if active else None,
+            "previous": previous.describe() if previous else None,
+            "candidate": candidate.describe() if candidate else None,
+            "shadow": {"fraction": self.shadow_fraction, **shadow} if candidate else None,
+        }
+
+    def shutdown(self):
+        self._shadow_pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    import sys
+    import tempfile
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    class FakePredictor:
+        # Deterministic stand-in: class = first byte of the upload, offset per model
+        def __init__(self, model_path: Path, delay: float = 0.02):
+            self.offset = int(Path(model_path).read_text())
+            self.delay = delay
+            self.idx_to_class = {i: f"class_{i}" for i in range(10)}
+
+        def predict_batch(self, images, return_all=False):
+            time.sleep(self.delay)
+            return [{"class_name": f"class_{(img[0] + self.offset) % 10}", "is_plant": True} for img in images]
+
+        def predict_arrays(self, images):
+            time.sleep(self.delay)
+            return {
+                "is_plant": np.ones(len(images), dtype=bool),
+                "class_idx": np.array([(img[0] + self.offset) % 10 for img in images]),
+            }
+
+    def wait_for(predicate, timeout: float = 5.0):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            assert time.monotonic() < deadline, "Timed out"
+            time.sleep(0.01)
+
+    print("Testing Model Registry...")
+    print()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        for name, offset in (("v1.pth", 0), ("v2.pth", 0), ("v3.pth", 5)):
+            (tmp_dir / name).write_text(str(offset))
+        state_path = tmp_dir / "active_model.json"
+        registry = ModelRegistry(FakePredictor, state_path=state_path)
+
+        print("Test 1: Initial load...")
+        registry.activate(registry.load(ModelVersion("v1", tmp_dir / "v1.pth")))
+        assert registry.predict_batch([b"\x03"])[0]["class_name"] == "class_3"
+        assert json.loads(state_path.read_text())["version"] == "v1"
+        print()
+
+        print("Test 2: Swap under load drops no requests...")
+        stop = threading.Event()
+        failures = []
+        served = [0]
+
+        def client():
+            while not stop.is_set():
+                try:
+                    registry.predict_batch([b"\x01", b"\x02"])
+                    served[0] += 1
+                except Exception as e:
+                    failures.append(e)
+
+        clients = [threading.Thread(target=client) for _ in range(4)]
+        for thread in clients:
+            thread.start()
+        registry.load_candidate(tmp_dir / "v2.pth", version="v2")
+        wait_for(lambda: registry.candidate.status == "ready")
+        registry.promote()
+        time.sleep(0.2)
+        stop.set()
+        for thread in clients:
+            thread.join()
+        print(f"Served {served[0]} batches during the swap, {len(failures)} failures")
+        assert not failures
+        assert registry.active.version == "v2" and registry.previous.version == "v1"
+        print()
+
+        print("Test 3: Shadow agreement...")
+        registry.load_candidate(tmp_dir / "v2.pth", version="v2b", shadow_fraction=1.0)
+        wait_for(lambda: registry.shadow_fraction == 1.0)
+        for i in range(20):
+            registry.predict_batch([bytes([i])])
+            wait_for(lambda: registry._shadow_pending == 0)
+        shadow = registry.get_status()["shadow"]
+        print(shadow)
+        assert shadow["compared"] == 20 and shadow["top1_agreement"] == 1.0
+
+        registry.load_candidate(tmp_dir / "v3.pth", version="v3", shadow_fraction=1.0)
+        wait_for(lambda: registry.shadow_fraction == 1.0)
+        for i in range(20):
+            registry.predict_batch([bytes([i])])
+            wait_for(lambda: registry._shadow_pending == 0)
+        assert registry.get_status()["shadow"]["top1_agreement"] == 0.0
+        print()
+
+        print("Test 4: Shadow work is shed when serving is busy...")
+        registry.is_busy = lambda: True
+        registry.predict_batch([b"\x01"] * 8)
+        shadow = registry.get_status()["shadow"]
+        assert shadow["skipped_busy"] == 8 and shadow["compared"] == 20
+        registry.is_busy = None
+        print()
+
+        print("Test 5: Shadow batches run in the executor's shadow class...")
+        registry.executor = InferenceExecutor(max_workers=1)
+        for i in range(5):
+            registry.predict_batch([bytes([i])])
+            wait_for(lambda: registry._shadow_pending == 0)
+        shadow_class = registry.executor.get_metrics()["classes"][PRIORITY_SHADOW]
+        assert shadow_class["completed"] == 5 and registry.get_status()["shadow"]["compared"] == 25
+        registry.executor.shutdown()
+        registry.executor = None
+        print()
+
+        print("Test 6: Another worker follows the recorded version...")
+        other = ModelRegistry(FakePredictor, state_path=state_path)
+        other.activate(other.load(ModelVersion("v1", tmp_dir / "v1.pth")), record=False)
+        assert other.sync()
+        wait_for(lambda: other.active.version == "v2")
+        assert not other.sync()
+        print()
+
+        print("Test 7: Rollback...")
+        registry.discard_candidate()
+        registry.rollback()
+        assert registry.active.version == "v1"
+        assert json.loads(state_path.read_text())["version"] == "v1"
+        other.sync()
+        assert other.active.version == "v1"
+        print()
+
+        print("Test 8: A version that fails to load is not retried until it changes...")
+        broken_path = tmp_dir / "v4.pth"
+        broken_path.write_text("not a checkpoint")
+        state = json.loads(state_path.read_text())
+        state.update(version="v4", model_path=str(broken_path))
+        state_path.write_text(json.dumps(state))
+        assert other.sync()
+        wait_for(lambda: other._syncing is None)
+        assert other.active.version == "v1"
+        assert not other.sync() and not other.sync()
+        broken_path.write_text("7")
+        os.utime(broken_path, ns=(time.time_ns() + 10**9,) * 2)
+        assert other.sync()
+        wait_for(lambda: other.active.version == "v4")
+        registry.shutdown()
+        other.shutdown()
+        print()
+
+    print("All tests passed!")
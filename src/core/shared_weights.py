@@ -0,0 +1,268 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional, Union
+
+import torch
+import torch.nn as nn
+
+from src.core.cache import checkpoint_identity
+from src.core.inference_graph import fold_for_inference
+from src.core.model import build_model_from_config, load_model
+from src.utils.file_lock import exclusive_lock
+
+
+def default_shared_dir() -> Path:
+    # tmpfs: the published file lives in RAM, and every process that maps it
+    # shares the same physical pages.
+    shm = Path("/dev/shm")
+    return shm if shm.is_dir() else Path(tempfile.gettempdir())
+
+
+def shared_weights_path(
+    checkpoint_path: Union[str, Path],
+    fold: bool = True,
+    shared_dir: Optional[Union[str, Path]] = None,
+) -> Path:
+    checkpoint_path = Path(checkpoint_path)
+    shared_dir = Path(shared_dir) if shared_dir else default_shared_dir()
+    key = f"{checkpoint_identity(checkpoint_path)}:fold={fold}"
+    digest = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    return shared_dir / f"{_shared_prefix(checkpoint_path)}-{digest}.pt"
+
+
+def _shared_prefix(checkpoint_path: Path) -> str:
+    # One prefix per checkpoint location: files under it that are not the
+    # current identity were published for an earlier version of that file
+    location = hashlib.blake2b(str(checkpoint_path.resolve()).encode(), digest_size=4).hexdigest()
+    return f"vanaspati-{checkpoint_path.stem}-{location}"
+
+
+def remove_superseded_weights(
+    checkpoint_path: Union[str, Path],
+    shared_dir: Optional[Union[str, Path]] = None,
+) -> int:
+    """
+    Delete files published for earlier versions of the checkpoint (both
+    fold variants of the current version are kept). Processes still mapping
+    a deleted file keep their pages until they unmap it.
+    """
+    checkpoint_path = Path(checkpoint_path)
+    current = {shared_weights_path(checkpoint_path, fold, shared_dir) for fold in (True, False)}
+    shared_dir = Path(shared_dir) if shared_dir else default_shared_dir()
+    removed = 0
+    for path in shared_dir.glob(f"{_shared_prefix(checkpoint_path)}-*.pt"):
+        if path in current:
+            continue
+        try:
+            path.unlink()
+            path.with_suffix(".lock").unlink(missing_ok=True)
+            removed += 1
+        except OSError:
+            # Already gone, or (on Windows) still mapped by a worker
+            pass
+    if removed:
+        print(f"Removed {removed} superseded shared weight file(s) for {checkpoint_path.name}")
+    return removed
+
+
+def publish_shared_weights(
+    checkpoint_path: Union[str, Path],
+    fold: bool = True,
+    shared_dir: Optional[Union[str, Path]] = None,
+) -> Path:
+    """
+    Write the inference weights of a checkpoint to shared memory once per
+    host. The first worker to take the lock does the work; the others wait
+    for it and then find the file already in place.
+    """
+    path = shared_weights_path(checkpoint_path, fold, shared_dir)
+    if path.exists():
+        return path
+
+    with exclusive_lock(path.with_suffix(".lock")):
+        if path.exists():
+            return path
+
+        model = load_model(Path(checkpoint_path), device="cpu", for_inference=True)
+        payload = {
+            "model_config": model.get_model_config(),
+            "folded": fold,
+            "state_dict": (fold_for_inference(model) if fold else model).state_dict(),
+        }
+        del model
+
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        torch.save(payload, tmp_path)
+        tmp_path.replace(path)
+        print(f"Published shared model weights: {path}")
+        # Every retrain or promotion would otherwise leave a copy in RAM
+        remove_superseded_weights(checkpoint_path, shared_dir)
+
+    return path
+
+
+def attach_shared_model(
+    path: Union[str, Path],
+    return_features: bool = False,
+    return_heatmap: bool = False,
+) -> nn.Module:
+    """
+    Build the model around weights memory-mapped from a published file.
+    The module is created on the meta device so no private copy of the
+    weights is ever allocated; assign=True makes the mapped tensors the
+    parameters themselves.
+    """
+    payload = torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+    config = payload["model_config"]
+
+    with torch.device("meta"):
+        model = build_model_from_config(config)
+    model.set_return_features(return_features)
+    model.set_return_heatmap(return_heatmap)
+    if payload["folded"]:
+        model = fold_for_inference(model)
+
+    model.load_state_dict(payload["state_dict"], strict=True, assign=True)
+    for param in model.parameters():
+        param.requires_grad_(False)
+
+    print(f"Attached shared model weights: {path}")
+    return model.eval()
+
+
+def load_shared_model(
+    checkpoint_path: Union[str, Path],
+    fold: bool = True,
+    shared_dir: Optional[Union[str, Path]] = None,
+    return_features: bool = False,
+    return_heatmap: bool = False,
+) -> nn.Module:
+    try:
+        return attach_shared_model(
+            publish_shared_weights(checkpoint_path, fold, shared_dir), return_features, return_heatmap
+        )
+    except FileNotFoundError:
+        # Removed as superseded between publish and attach: the checkpoint
+        # changed meanwhile, so publishing again picks up its new version
+        return attach_shared_model(
+            publish_shared_weights(checkpoint_path, fold, shared_dir), return_features, return_heatmap
+        )
+
+
+if __name__ == "__main__":
+    import multiprocessing as mp
+    import sys
+
+    import psutil
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    from src.core.model import DiseaseClassifier, save_model
+
+    NUM_WORKERS = 3
+    MB = 1024 * 1024
+
+    def worker(mode, checkpoint_path, shared_dir, barrier, results):
+        torch.set_num_threads(1)
+        if mode == "private":
+            model = load_model(Path(checkpoint_path), device="cpu", for_inference=True)
+            batch = torch.randn(1, 3, 224, 224)
+        else:
+            model = load_shared_model(checkpoint_path, fold=True, shared_dir=shared_dir)
+            batch = torch.randn(1, 3, 224, 224).contiguous(memory_format=torch.channels_last)
+
+        with torch.no_grad():
+            logits = model(batch)
+
+        # Measure while every worker is alive, so shared pages really are shared.
+        barrier.wait()
+        info = psutil.Process().memory_full_info()
+        results.put((mode, info.rss / MB, info.pss / MB, info.uss / MB, tuple(logits.shape)))
+        barrier.wait()
+
+    def run_workers(mode, checkpoint_path, shared_dir):
+        ctx = mp.get_context("fork")
+        barrier = ctx.Barrier(NUM_WORKERS)
+        results = ctx.Queue()
+        procs = [
+            ctx.Process(target=worker, args=(mode, str(checkpoint_path), str(shared_dir), barrier, results))
+            for _ in range(NUM_WORKERS)
+        ]
+        for proc in procs:
+            proc.start()
+        measurements = [results.get() for _ in procs]
+        for proc in procs:
+            proc.join()
+            assert proc.exitcode == 0, f"{mode} worker failed"
+        return measurements
+
+    print("Testing Shared Weights...")
+    print()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        shared_dir = default_shared_dir()
+
+        torch.manual_seed(0)
+        model = DiseaseClassifier(num_classes=38, pretrained=False, freeze_backbone=False).eval()
+        checkpoint_path = tmp_dir / "model.pth"
+        save_model(model, checkpoint_path)
+        weights_mb = sum(t.numel() * t.element_size() for t in model.state_dict().values()) / MB
+        print(f"Weights: {weights_mb:.1f} MB")
+        print()
+
+        published = None
+        try:
+            print("Test 1: Publishing and attaching in-process...")
+            published = publish_shared_weights(checkpoint_path, shared_dir=shared_dir)
+            attached = attach_shared_model(published)
+            batch = torch.randn(2, 3, 224, 224)
+            with torch.no_grad():
+                diff = (model(batch) - attached(batch.contiguous(memory_format=torch.channels_last))).abs().max().item()
+            print(f"Max abs logit difference: {diff:.2e}")
+            assert diff < 1e-3, "Shared model diverges from the checkpoint"
+            del attached
+            print()
+
+            print(f"Test 2: Per-worker memory with {NUM_WORKERS} workers...")
+            rows = {
+                "private": run_workers("private", checkpoint_path, shared_dir),
+                "shared": run_workers("shared", checkpoint_path, shared_dir),
+            }
+            print(f"{'Mode':<10}{'RSS (MB)':>12}{'PSS (MB)':>12}{'USS (MB)':>12}{'total PSS':>12}")
+            for mode, measurements in rows.items():
+                rss = sum(m[1] for m in measurements) / NUM_WORKERS
+                pss = sum(m[2] for m in measurements) / NUM_WORKERS
+                uss = sum(m[3] for m in measurements) / NUM_WORKERS
+                print(f"{mode:<10}{rss:>12.1f}{pss:>12.1f}{uss:>12.1f}{pss * NUM_WORKERS:>12.1f}")
+
+            private_uss = sum(m[3] for m in rows["private"]) / NUM_WORKERS
+            shared_uss = sum(m[3] for m in rows["shared"]) / NUM_WORKERS
+            saved = private_uss - shared_uss
+            print(f"Private memory saved per worker: {saved:.1f} MB ({100 * saved / weights_mb:.0f}% of the weights)")
+            assert saved > 0.8 * weights_mb, "Workers still hold private copies of the weights"
+            print()
+
+            print("Test 3: Publishing a retrained checkpoint removes the superseded file...")
+            other_path = tmp_dir / "other" / "model.pth"
+            other_path.parent.mkdir()
+            save_model(model, other_path)
+            other = publish_shared_weights(other_path, shared_dir=shared_dir)
+            with torch.no_grad():
+                next(model.parameters()).add_(1.0)
+            save_model(model, checkpoint_path)
+            retrained = publish_shared_weights(checkpoint_path, shared_dir=shared_dir)
+            assert retrained != published and retrained.exists()
+            assert not published.exists(), "Superseded shared weights were left behind"
+            assert other.exists(), "Removed the weights of another checkpoint with the same name"
+            print()
+        finally:
+            for path in (checkpoint_path, tmp_dir / "other" / "model.pth"):
+                for stale in shared_dir.glob(f"{_shared_prefix(path)}-*"):
+                    stale.unlink(missing_ok=True)
+
+    print("All tests passed!")
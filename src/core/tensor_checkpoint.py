@@ -0,0 +1,199 @@
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+import torch
+
+
+# Layout (same as safetensors): an 8-byte little-endian header length, a JSON
+# header mapping each tensor name to its dtype, shape and byte range, then the
+# raw tensor bytes. Nothing is pickled, so a reader can map the data section
+# and point tensors straight at it.
+TENSOR_CHECKPOINT_SUFFIX = ".safetensors"
+
+_DTYPE_NAMES = {
+    torch.float64: "F64",
+    torch.float32: "F32",
+    torch.float16: "F16",
+    torch.bfloat16: "BF16",
+    torch.int64: "I64",
+    torch.int32: "I32",
+    torch.int16: "I16",
+    torch.int8: "I8",
+    torch.uint8: "U8",
+    torch.bool: "BOOL",
+}
+_DTYPES = {name: dtype for dtype, name in _DTYPE_NAMES.items()}
+
+_HEADER_ALIGNMENT = 8
+
+
+def write_tensor_file(
+    tensors: Dict[str, torch.Tensor],
+    path: Union[str, Path],
+    metadata: Optional[Dict[str, str]] = None,
+):
+    path = Path(path)
+
+    # Widest dtypes first so every tensor starts on a multiple of its element size.
+    names = sorted(tensors, key=lambda n: (-tensors[n].element_size(), n))
+    header = {}
+    if metadata:
+        header["__metadata__"] = {str(k): str(v) for k, v in metadata.items()}
+
+    offset = 0
+    for name in names:
+        tensor = tensors[name]
+        if tensor.dtype not in _DTYPE_NAMES:
+            raise ValueError(f"Unsupported dtype for {name}: {tensor.dtype}")
+        nbytes = tensor.numel() * tensor.element_size()
+        header[name] = {
+            "dtype": _DTYPE_NAMES[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + nbytes],
+        }
+        offset += nbytes
+
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    header_bytes += b" " * (-len(header_bytes) % _HEADER_ALIGNMENT)
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name in names:
+            tensor = tensors[name].detach().to("cpu").contiguous()
+            if tensor.numel():
+                f.write(tensor.view(-1).view(torch.uint8).numpy().tobytes())
+    tmp_path.replace(path)
+
+
+def read_tensor_file(path: Union[str, Path]) -> Tuple[Dict[str, torch.Tensor], Dict[str, str]]:
+    """
+    Map a tensor file and return (tensors, metadata) without copying data.
+
+    The mapping is private copy-on-write: pages are read lazily from the page
+    cache (and shared with every other process mapping the same file) until
+    something writes to them.
+    """
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+        has_data = os.fstat(f.fileno()).st_size > 8 + header_len
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) if has_data else None
+
+    metadata = header.pop("__metadata__", {})
+    data_start = 8 + header_len
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = _DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        count = (end - start) // torch.empty((), dtype=dtype).element_size()
+        if count:
+            tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + start)
+        else:
+            tensor = torch.empty(0, dtype=dtype)
+        tensors[name] = tensor.view(info["shape"])
+
+    return tensors, metadata
+
+
+def is_tensor_checkpoint(path: Union[str, Path]) -> bool:
+    return Path(path).suffix == TENSOR_CHECKPOINT_SUFFIX
+
+
+if __name__ == "__main__":
+    import subprocess
+    import sys
+    import tempfile
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    from src.core.model import DiseaseClassifier, convert_checkpoint, load_model, save_model
+
+    def cold_start(model_path: Path) -> Dict[str, float]:
+        # Fresh interpreter per measurement so page-faulted memory and import
+        # costs are not shared between formats. Imports are not timed.
+        # ru_maxrss would inherit the parent's high-water mark across fork, so
+        # the peak is read from VmHWM, which exec resets.
+        code = (
+            "import json, sys, time\n"
+            f"sys.path.insert(0, {str(ROOT)!r})\n"
+            "from pathlib import Path\n"
+            "import torch\n"
+            "from src.core.model import load_model\n"
+            "def status(field):\n"
+            "    for line in open('/proc/self/status'):\n"
+            "        if line.startswith(field + ':'):\n"
+            "            return int(line.split()[1]) / 1024\n"
+            "torch.set_num_threads(1)\n"
+            "base = status('VmRSS')\n"
+            "t0 = time.perf_counter()\n"
+            f"model = load_model(Path({str(model_path)!r}), device='cpu')\n"
+            "load_s = time.perf_counter() - t0\n"
+            "peak = status('VmHWM')\n"
+            "with torch.no_grad():\n"
+            "    model(torch.zeros(1, 3, 224, 224))\n"
+            "first_s = time.perf_counter() - t0\n"
+            "print(json.dumps({'load_s': load_s, 'first_s': first_s, 'peak_mb': peak - base}))\n"
+        )
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    print("Testing Tensor Checkpoint Format...")
+    print()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+
+        print("Test 1: Round trip of every supported dtype...")
+        tensors = {
+            f"t_{name.lower()}": (torch.arange(24) % 2).to(dtype).view(2, 3, 4) for dtype, name in _DTYPE_NAMES.items()
+        }
+        tensors["empty"] = torch.empty(0, 5)
+        tensors["scalar"] = torch.tensor(3.5)
+        write_tensor_file(tensors, tmp_dir / "roundtrip.safetensors", metadata={"note": "test"})
+        loaded, metadata = read_tensor_file(tmp_dir / "roundtrip.safetensors")
+        assert metadata == {"note": "test"}
+        for name, tensor in tensors.items():
+            assert loaded[name].dtype == tensor.dtype and torch.equal(loaded[name], tensor), name
+        print(f"{len(tensors)} tensors round-tripped")
+        print()
+
+        print("Test 2: Converted checkpoint loads identical weights...")
+        torch.manual_seed(0)
+        model = DiseaseClassifier(num_classes=38, pretrained=False, freeze_backbone=False).eval()
+        # Training checkpoints carry Adam state (two moments per parameter) and metrics.
+        optimizer = torch.optim.Adam(model.parameters())
+        model(torch.randn(2, 3, 224, 224)).sum().backward()
+        optimizer.step()
+        model.eval()
+        pth_path = tmp_dir / "model.pth"
+        save_model(model, pth_path, epoch=10, optimizer_state=optimizer.state_dict(), metrics={"val_acc": 0.97})
+
+        tensor_path = convert_checkpoint(pth_path)
+
+        reference = load_model(pth_path, device="cpu")
+        mapped = load_model(tensor_path, device="cpu")
+        batch = torch.randn(2, 3, 224, 224)
+        with torch.no_grad():
+            assert torch.equal(reference(batch), mapped(batch)), "Converted checkpoint changes outputs"
+        print()
+
+        print("Test 3: Cold start and peak memory (fresh process each)...")
+        print(f"{'Format':<14}{'file (MB)':>11}{'load (s)':>10}{'+1st fwd (s)':>14}{'load peak (MB)':>16}")
+        for label, path in (("pickle .pth", pth_path), ("safetensors", tensor_path)):
+            runs = [cold_start(path) for _ in range(3)]
+            best = min(runs, key=lambda r: r["load_s"])
+            size_mb = path.stat().st_size / (1024 * 1024)
+            print(f"{label:<14}{size_mb:>11.1f}{best['load_s']:>10.3f}{best['first_s']:>14.3f}{best['peak_mb']:>16.1f}")
+        print()
+
+    print("All tests passed!")
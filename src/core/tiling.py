@@ -0,0 +1,211 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from src.core.plant_gate import MIN_GREEN_RATIO, green_mask, make_thumbnail
+from src.core.preprocessing import ImageSource, open_image
+
+
+# Field photos are decoded once at this long side: enough detail for leaf-sized
+# tiles without paying for a full 12 MP decode.
+DECODE_SIZE = 1536
+# Tile side in decoded pixels (each tile is resized to the model input)
+TILE_SIZE = 448
+TILE_OVERLAP = 0.25
+# Hard bound on tiles per photo, i.e. on the forward batch size
+MAX_TILES = 16
+
+Box = Tuple[int, int, int, int]
+
+
+def load_for_tiling(source: ImageSource, decode_size: int = DECODE_SIZE) -> Image.Image:
+    """Decode with JPEG draft scaling, then cap the long side at decode_size."""
+    image = open_image(source, draft_size=(decode_size, decode_size))
+    width, height = image.size
+    scale = decode_size / max(width, height)
+    if scale < 1:
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image = image.resize(size, Image.BILINEAR, reducing_gap=3.0)
+    return image
+
+
+def _positions(length: int, tile: int, stride: int) -> List[int]:
+    positions = list(range(0, length - tile + 1, stride))
+    if positions[-1] + tile < length:
+        positions.append(length - tile)
+    return positions
+
+
+def _green_ratios(boxes: List[Box], mask: np.ndarray, width: int, height: int) -> np.ndarray:
+    # Summed-area table over the gate's thumbnail mask: O(1) per tile.
+    mask_h, mask_w = mask.shape
+    table = np.zeros((mask_h + 1, mask_w + 1), dtype=np.int64)
+    table[1:, 1:] = mask.cumsum(axis=0).cumsum(axis=1)
+
+    ratios = np.empty(len(boxes), dtype=np.float64)
+    for i, (x0, y0, x1, y1) in enumerate(boxes):
+        mx0, mx1 = x0 * mask_w // width, max(x0 * mask_w // width + 1, -(-x1 * mask_w // width))
+        my0, my1 = y0 * mask_h // height, max(y0 * mask_h // height + 1, -(-y1 * mask_h // height))
+        green = table[my1, mx1] - table[my0, mx1] - table[my1, mx0] + table[my0, mx0]
+        ratios[i] = green / ((mx1 - mx0) * (my1 - my0))
+    return ratios
+
+
+def plan_tiles(
+    width: int,
+    height: int,
+    tile_size: int = TILE_SIZE,
+    overlap: float = TILE_OVERLAP,
+    max_tiles: int = MAX_TILES,
+    mask: Optional[np.ndarray] = None,
+    min_green_ratio: float = MIN_GREEN_RATIO,
+) -> List[Tuple[Box, float]]:
+    """
+    Overlapping square tiles over a width x height image as (box, green ratio)
+    pairs, box = (x0, y0, x1, y1). With a green mask (any resolution, stretched
+    over the image) tiles below min_green_ratio are dropped and the greenest
+    max_tiles are kept; at least one tile is always returned. Tiles come back
+    in reading order.
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError(f"overlap must be in [0, 1), got {overlap}")
+
+    tile = min(tile_size, width, height)
+    stride = max(1, int(tile * (1 - overlap)))
+    boxes = [
+        (x, y, x + tile, y + tile)
+        for y in _positions(height, tile, stride)
+        for x in _positions(width, tile, stride)
+    ]
+
+    if mask is None:
+        ratios = np.ones(len(boxes))
+        order = np.arange(len(boxes))
+    else:
+        ratios = _green_ratios(boxes, mask, width, height)
+        order = np.argsort(-ratios, kind="stable")
+        keep = order[ratios[order] >= min_green_ratio]
+        order = keep if keep.size else order[:1]
+
+    if order.size > max_tiles:
+        if mask is None:
+            # Evenly spread over the grid rather than the first rows only
+            order = order[np.linspace(0, order.size - 1, max_tiles).round().astype(int)]
+        else:
+            order = order[:max_tiles]
+
+    return [(boxes[i], float(ratios[i])) for i in sorted(order.tolist())]
+
+
+def tile_image(
+    image: Image.Image,
+    tile_size: int = TILE_SIZE,
+    overlap: float = TILE_OVERLAP,
+    max_tiles: int = MAX_TILES,
+) -> Tuple[List[Image.Image], List[Tuple[Box, float]]]:
+    """Crops of the greenest tiles of an RGB image, plus their plan_tiles entries."""
+    width, height = image.size
+    mask = green_mask(make_thumbnail(image))
+    plan = plan_tiles(width, height, tile_size, overlap, max_tiles, mask)
+    return [image.crop(box) for box, _ in plan], plan
+
+
+def aggregate_tiles(probabilities: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Photo-level class distribution: tile probabilities averaged by weight (green coverage)."""
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.sum() <= 0:
+        weights = np.ones_like(weights)
+    return (weights @ probabilities.astype(np.float64) / weights.sum()).astype(np.float32)
+
+
+def tile_detections(class_idx: np.ndarray, confidence: np.ndarray, min_confidence: float = 0.0) -> List[Dict[str, float]]:
+    """
+    Every class that is top-1 on at least one tile, with its tile count and
+    best confidence, most frequent first. A disease on a few leaves of an
+    otherwise healthy plant shows up here even when the average does not.
+    """
+    detections = []
+    confident = confidence >= min_confidence
+    for idx in np.unique(class_idx[confident]):
+        hits = confident & (class_idx == idx)
+        detections.append({
+            "class_idx": int(idx),
+            "tiles": int(hits.sum()),
+            "max_confidence": float(confidence[hits].max()),
+        })
+    detections.sort(key=lambda d: (-d["tiles"], -d["max_confidence"]))
+    return detections
+
+
+if __name__ == "__main__":
+    import io
+    import sys
+    import time
+    from pathlib import Path
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    def field_photo(width: int, height: int, leaves: List[Tuple[int, int]], seed: int = 0) -> bytes:
+        rng = np.random.default_rng(seed)
+        pixels = np.empty((height, width, 3), dtype=np.float32)
+        pixels[:] = (120, 95, 70)
+        yy, xx = np.mgrid[0:height, 0:width]
+        for cx, cy in leaves:
+            leaf = ((yy - cy) / 260.0) ** 2 + ((xx - cx) / 180.0) ** 2 < 1
+            pixels[leaf] = (50, 150, 40)
+        pixels += rng.normal(0, 12, pixels.shape)
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+        return buffer.getvalue()
+
+    print("Testing Tiling...")
+    print()
+
+    print("Test 1: Grid covers the image and respects the tile bound...")
+    for width, height in ((1536, 1152), (1536, 864), (300, 1200), (200, 150)):
+        plan = plan_tiles(width, height, max_tiles=10_000)
+        covered = np.zeros((height, width), dtype=bool)
+        for (x0, y0, x1, y1), _ in plan:
+            assert 0 <= x0 < x1 <= width and 0 <= y0 < y1 <= height
+            covered[y0:y1, x0:x1] = True
+        assert covered.all(), f"Grid leaves gaps at {width}x{height}"
+        bounded = plan_tiles(width, height, max_tiles=4)
+        assert 1 <= len(bounded) <= 4
+        print(f"{width}x{height}: {len(plan)} tiles in the full grid, {len(bounded)} with max_tiles=4")
+    print()
+
+    print("Test 2: Tiles follow the green regions...")
+    photo = field_photo(4000, 3000, leaves=[(700, 800), (3200, 2200)])
+    t0 = time.perf_counter()
+    image = load_for_tiling(photo)
+    decode_ms = 1000 * (time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    tiles, plan = tile_image(image)
+    tile_ms = 1000 * (time.perf_counter() - t0)
+    print(f"Decoded 4000x3000 to {image.size[0]}x{image.size[1]} in {decode_ms:.1f} ms; "
+          f"{len(tiles)} tiles in {tile_ms:.1f} ms")
+    assert max(image.size) == DECODE_SIZE
+    assert 1 <= len(tiles) <= MAX_TILES
+    assert all(tile.size == (TILE_SIZE, TILE_SIZE) for tile in tiles)
+    assert all(ratio >= MIN_GREEN_RATIO for _, ratio in plan)
+    scale = image.size[0] / 4000
+    for cx, cy in ((700, 800), (3200, 2200)):
+        x, y = cx * scale, cy * scale
+        assert any(x0 <= x < x1 and y0 <= y < y1 for (x0, y0, x1, y1), _ in plan), "A leaf has no tile"
+    print()
+
+    print("Test 3: Aggregation and detections...")
+    probabilities = np.array([[0.9, 0.1, 0.0], [0.8, 0.2, 0.0], [0.1, 0.0, 0.9]], dtype=np.float32)
+    aggregated = aggregate_tiles(probabilities, np.array([1.0, 1.0, 2.0]))
+    assert np.isclose(aggregated.sum(), 1.0)
+    assert np.allclose(aggregated, [0.475, 0.075, 0.45])
+    detections = tile_detections(probabilities.argmax(1), probabilities.max(1))
+    print(f"Aggregated: {aggregated.round(3).tolist()}, detections: {detections}")
+    assert [d["class_idx"] for d in detections] == [0, 2]
+    assert detections[0]["tiles"] == 2 and np.isclose(detections[1]["max_confidence"], 0.9)
+    print()
+
+    print("All tests passed!")
@@ -33,6 +33,18 @@ def mixup_criterion(criterion, pred, y_a, y_b, lam):
     return lam * criterion(pred, y_a) + (1 - lam) * criterion(pred, y_b)
 
 
+def distillation_loss(
+    student_logits: torch.Tensor,
+    teacher_logits: torch.Tensor,
+    temperature: float = 4.0,
+) -> torch.Tensor:
+    """KL divergence between temperature-softened teacher and student outputs."""
+    log_p_student = torch.log_softmax(student_logits / temperature, dim=1)
+    log_p_teacher = torch.log_softmax(teacher_logits / temperature, dim=1)
+    # T^2 keeps the soft-target gradients on the same scale as the hard loss.
+    return nn.functional.kl_div(log_p_student, log_p_teacher, reduction="batchmean", log_target=True) * temperature ** 2
+
+
 def train_one_epoch(
     model: nn.Module,
     loader: DataLoader,
@@ -43,6 +55,9 @@ def train_one_epoch(
     log_interval: int = 50,
     use_mixup: bool = False,
     mixup_alpha: float = 0.2,
+    teacher: Optional[nn.Module] = None,
+    distill_alpha: float = 0.7,
+    distill_temperature: float = 4.0,
 ) -> Tuple[float, float]:
     model.train()
     running_loss = 0.0
@@ -66,6 +81,13 @@ def train_one_epoch(
             else:
                 loss = criterion(outputs, labels)
 
+            # Distillation: the teacher sees the same (possibly mixed) images
+            if teacher is not None:
+                with torch.no_grad():
+                    teacher_outputs = teacher(images)
+                soft_loss = distillation_loss(outputs.float(), teacher_outputs.float(), distill_temperature)
+                loss = distill_alpha * soft_loss + (1 - distill_alpha) * loss
+
         scaler.scale(loss).backward()
         scaler.step(optimizer)
         scaler.update()
@@ -139,8 +161,16 @@ def train(
     mixup_alpha: float = 0.2,
     two_stage: bool = False,
     stage1_epochs: int = 5,
+    teacher: Optional[nn.Module] = None,
+    distill_alpha: float = 0.7,
+    distill_temperature: float = 4.0,
 ) -> Dict[str, List[float]]:
     criterion = nn.CrossEntropyLoss()
+
+    if teacher is not None:
+        teacher = teacher.to(device).eval()
+        for param in teacher.parameters():
+            param.requires_grad = False
     optimizer = torch.optim.AdamW(model.parameters(), lr=lr, weight_decay=weight_decay)
     
     # Create scheduler based on type
@@ -166,6 +196,8 @@ def train(
 
     print("Starting training...")
     print(f"Optimizer: AdamW | Scheduler: {scheduler_type.upper()} | MixUp: {use_mixup}")
+    if teacher is not None:
+        print(f"Distillation: alpha={distill_alpha} temperature={distill_temperature}")
     if two_stage:
         print(f"Two-stage training: Stage 1 ({stage1_epochs} epochs) → Stage 2 ({epochs - stage1_epochs} epochs)")
     
@@ -205,6 +237,9 @@ def train(
             log_interval=log_interval,
             use_mixup=use_mixup,
             mixup_alpha=mixup_alpha,
+            teacher=teacher,
+            distill_alpha=distill_alpha,
+            distill_temperature=distill_temperature,
         )
 
         val_loss, val_acc = evaluate(model, val_loader, criterion, device)
@@ -0,0 +1,332 @@
+import math
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from src.core.preprocessing import ImageSource, open_image
+
+
+# Frames examined per second of video; everything in between is only grabbed
+# (demuxed and decoded by OpenCV, never converted or scored).
+SAMPLE_FPS = 4.0
+# Hard bound on keyframes per clip, i.e. on the frames held in memory and classified
+MAX_KEYFRAMES = 16
+MAX_DURATION_SECONDS = 300
+# Long side of the thumbnail the sharpness and difference scores use
+ANALYSIS_SIZE = 192
+# Long side keyframes are kept at; the model input is 224
+KEYFRAME_SIZE = 512
+# Variance of the Laplacian on the analysis thumbnail below which a frame is
+# too blurred (motion or focus) to diagnose from
+MIN_SHARPNESS = 30.0
+# Mean absolute colour difference to the previous keyframe that counts as a
+# new view; closer frames compete with it on sharpness instead. Colour, not
+# grey: a leaf and the soil around it are close in luminance.
+MIN_DIFFERENCE = 8.0
+
+Frame = Tuple[int, Optional[float], Image.Image]
+
+
+class Keyframe:
+    """A selected frame: position, its scores and the downscaled RGB image."""
+
+    def __init__(self, index: int, timestamp: Optional[float], sharpness: float, difference: float,
+                 thumbnail: np.ndarray, image: Image.Image):
+        self.index = index
+        self.timestamp = timestamp
+        self.sharpness = sharpness
+        # To the previous keyframe (inf for the first)
+        self.difference = difference
+        self.thumbnail = thumbnail
+        self.image = image
+
+    def take(self, other: "Keyframe"):
+        """Adopt other's frame, keeping this keyframe's place in the sequence."""
+        self.index, self.timestamp = other.index, other.timestamp
+        self.sharpness, self.thumbnail, self.image = other.sharpness, other.thumbnail, other.image
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "frame": self.index,
+            "time": None if self.timestamp is None else round(self.timestamp, 3),
+            "sharpness": round(self.sharpness, 2),
+            "difference": None if math.isinf(self.difference) else round(self.difference, 2),
+        }
+
+
+def _fit(image: Image.Image, long_side: int) -> Image.Image:
+    scale = long_side / max(image.size)
+    if scale >= 1:
+        return image
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return image.resize(size, Image.BILINEAR, reducing_gap=3.0)
+
+
+def analysis_thumbnail(image: Image.Image, size: int = ANALYSIS_SIZE) -> np.ndarray:
+    return np.asarray(_fit(image, size).convert("RGB"), dtype=np.float32)
+
+
+def sharpness(thumbnail: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian of the luma: low for blurred frames."""
+    luma = thumbnail @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    laplacian = (
+        4 * luma[1:-1, 1:-1]
+        - luma[:-2, 1:-1] - luma[2:, 1:-1]
+        - luma[1:-1, :-2] - luma[1:-1, 2:]
+    )
+    return float(laplacian.var())
+
+
+def difference(a: np.ndarray, b: np.ndarray) -> float:
+    if a.shape != b.shape:
+        return math.inf
+    return float(np.abs(a - b).mean())
+
+
+def _merge_least_distinct(keyframes: List[Keyframe]):
+    # Fold the keyframe closest to its predecessor into it, keeping the
+    # sharper frame, then re-score the neighbour that now follows. The newest
+    # keyframe is left alone: frames still arriving are compared with it.
+    candidates = range(1, len(keyframes) - 1) or range(1, len(keyframes))
+    i = min(candidates, key=lambda j: keyframes[j].difference)
+    if keyframes[i].sharpness > keyframes[i - 1].sharpness:
+        keyframes[i - 1].take(keyframes[i])
+    del keyframes[i]
+    if i < len(keyframes):
+        keyframes[i].difference = difference(keyframes[i].thumbnail, keyframes[i - 1].thumbnail)
+
+
+def select_keyframes(
+    frames: Iterable[Frame],
+    max_keyframes: int = MAX_KEYFRAMES,
+    min_sharpness: float = MIN_SHARPNESS,
+    min_difference: float = MIN_DIFFERENCE,
+) -> Tuple[List[Keyframe], Dict[str, int]]:
+    """
+    Single pass over (index, timestamp, RGB image) frames. Blurred frames are
+    skipped; a frame close to the last keyframe replaces it if sharper,
+    otherwise it starts a new keyframe. Past max_keyframes the least distinct
+    neighbours are merged, so at most max_keyframes + 1 frames are ever held.
+    If every frame is blurred the sharpest one is returned.
+    """
+    keyframes: List[Keyframe] = []
+    sharpest: Optional[Keyframe] = None
+    stats = {"examined": 0, "blurred": 0, "merged": 0}
+
+    for index, timestamp, image in frames:
+        stats["examined"] += 1
+        thumbnail = analysis_thumbnail(image)
+        score = sharpness(thumbnail)
+        if score < min_sharpness:
+            stats["blurred"] += 1
+            if not keyframes and (sharpest is None or score > sharpest.sharpness):
+                sharpest = Keyframe(index, timestamp, score, math.inf, thumbnail, _fit(image, KEYFRAME_SIZE))
+            continue
+
+        last = keyframes[-1] if keyframes else None
+        distance = difference(thumbnail, last.thumbnail) if last is not None else math.inf
+        if last is not None and distance < min_difference:
+            if score > last.sharpness:
+                last.take(Keyframe(index, timestamp, score, distance, thumbnail, _fit(image, KEYFRAME_SIZE)))
+            continue
+
+        keyframes.append(Keyframe(index, timestamp, score, distance, thumbnail, _fit(image, KEYFRAME_SIZE)))
+        if len(keyframes) > max_keyframes:
+            _merge_least_distinct(keyframes)
+            stats["merged"] += 1
+
+    if not keyframes and sharpest is not None:
+        keyframes.append(sharpest)
+    return keyframes, stats
+
+
+def video_frames(
+    path: Union[str, Path],
+    sample_fps: float = SAMPLE_FPS,
+    max_duration: float = MAX_DURATION_SECONDS,
+    info: Optional[Dict[str, object]] = None,
+) -> Iterator[Frame]:
+    """
+    Stream a video file's frames at about sample_fps with OpenCV. Only the
+    sampled frames are converted to RGB; decoding stops at max_duration.
+    Clip properties are written into info as they become known.
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise ValueError("Could not decode the video")
+    info = info if info is not None else {}
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS)
+        if not fps or not math.isfinite(fps) or fps <= 0:
+            fps = 30.0
+        step = max(1, round(fps / sample_fps))
+        info.update({"fps": round(fps, 3), "frames": 0, "truncated": False})
+
+        index = -1
+        while capture.grab():
+            index += 1
+            info["frames"] = index + 1
+            if index / fps > max_duration:
+                info["truncated"] = True
+                break
+            if index % step:
+                continue
+            ok, frame = capture.retrieve()
+            if not ok:
+                break
+            yield index, index / fps, Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        info["duration"] = round(info["frames"] / fps, 3)
+    finally:
+        capture.release()
+
+
+def image_frames(sources: Iterable[ImageSource]) -> Iterator[Frame]:
+    """A burst of photos as frames, decoded one at a time; unreadable ones are skipped."""
+    for index, source in enumerate(sources):
+        try:
+            image = open_image(source)
+        except Exception:
+            continue
+        yield index, None, image
+
+
+def summarize_keyframes(
+    keyframes: List[Keyframe],
+    results: List[Dict[str, object]],
+    min_confidence: float = 0.0,
+) -> Dict[str, object]:
+    """
+    Aggregate per-keyframe predictions. The clip's diagnosis is the class
+    that wins the most plant frames (ties: higher total confidence), with
+    its summed confidence over all plant frames as the confidence. Every
+    class that wins a frame at min_confidence is listed under detections.
+    """
+    timeline = []
+    votes: Dict[int, Dict[str, object]] = {}
+    plant_frames = 0
+    for keyframe, result in zip(keyframes, results):
+        entry = keyframe.describe()
+        entry.update({key: result[key] for key in ("class_name", "class_idx", "confidence", "is_plant")})
+        if "top_k" in result:
+            entry["top_k"] = result["top_k"]
+        if not result["is_plant"]:
+            entry["error"] = result.get("error")
+        timeline.append(entry)
+
+        if not result["is_plant"]:
+            continue
+        plant_frames += 1
+        if result["confidence"] < min_confidence:
+            continue
+        vote = votes.setdefault(result["class_idx"], {
+            "class_idx": result["class_idx"],
+            "class_name": result["class_name"],
+            "frames": 0,
+            "total_confidence": 0.0,
+            "max_confidence": 0.0,
+            "first_seen": entry["time"] if entry["time"] is not None else entry["frame"],
+        })
+        vote["frames"] += 1
+        vote["total_confidence"] += result["confidence"]
+        vote["max_confidence"] = max(vote["max_confidence"], result["confidence"])
+
+    detections = sorted(votes.values(), key=lambda v: (-v["frames"], -v["total_confidence"]))
+    summary = {"timeline": timeline, "num_keyframes": len(keyframes), "plant_frames": plant_frames}
+    if not detections:
+        errors = [entry["error"] for entry in timeline if entry.get("error")]
+        summary.update({
+            "class_name": "Not a plant image",
+            "class_idx": -1,
+            "confidence": 0.0,
+            "is_plant": False,
+            "error": errors[0] if errors else "No sharp frames of a plant were found in the video.",
+            "detections": [],
+        })
+        return summary
+
+    best = detections[0]
+    for detection in detections:
+        detection.pop("total_confidence")
+    summary.update({
+        "class_name": best["class_name"],
+        "class_idx": best["class_idx"],
+        "confidence": sum(r["confidence"] for r in results if r["is_plant"] and r["class_idx"] == best["class_idx"]) / plant_frames,
+        "is_plant": True,
+        "detections": detections,
+    })
+    return summary
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    ROOT = Path(__file__).resolve().parent.parent.parent
+    if str(ROOT) not in sys.path:
+        sys.path.insert(0, str(ROOT))
+
+    rng = np.random.default_rng(0)
+    # Distinct blocky scenes: sharp edges, and far apart even as thumbnails
+    scenes = [
+        np.asarray(Image.fromarray(rng.integers(0, 256, (9, 16, 3), dtype=np.uint8)).resize((640, 360), Image.NEAREST))
+        for _ in range(5)
+    ]
+
+    def clip(frames_per_scene: int, blur_every: int = 0) -> Iterator[Frame]:
+        index = 0
+        for scene in scenes:
+            for j in range(frames_per_scene):
+                pixels = np.clip(scene.astype(np.int16) + rng.integers(-3, 4, scene.shape), 0, 255).astype(np.uint8)
+                image = Image.fromarray(pixels)
+                if blur_every and j % blur_every == 0:
+                    image = image.resize((40, 22)).resize((640, 360))
+                yield index, index / 30.0, image
+                index += 1
+
+    print("Testing Video Keyframes...")
+    print()
+
+    print("Test 1: One sharp keyframe per scene, blurred frames skipped...")
+    t0 = time.perf_counter()
+    keyframes, stats = select_keyframes(clip(12, blur_every=3))
+    elapsed = 1000 * (time.perf_counter() - t0)
+    print(f"{stats['examined']} frames in {elapsed:.0f} ms: {len(keyframes)} keyframes, {stats['blurred']} blurred")
+    assert len(keyframes) == len(scenes)
+    assert stats["blurred"] == 4 * len(scenes)
+    assert all(k.image.size == (512, 288) for k in keyframes)
+    assert [k.index // 12 for k in keyframes] == list(range(len(scenes)))
+    print()
+
+    print("Test 2: Memory stays bounded by max_keyframes...")
+    keyframes, stats = select_keyframes(clip(3), max_keyframes=3)
+    assert len(keyframes) == 3 and stats["merged"] == 2
+    print(f"{len(scenes)} scenes folded into {len(keyframes)} keyframes ({stats['merged']} merges)")
+    print()
+
+    print("Test 3: All-blurred input still yields the sharpest frame...")
+    blurred = [(i, None, Image.fromarray(np.full((100, 100, 3), 90 + i, dtype=np.uint8))) for i in range(4)]
+    keyframes, stats = select_keyframes(blurred)
+    assert len(keyframes) == 1 and stats["blurred"] == 4
+    print()
+
+    print("Test 4: Aggregation across keyframes...")
+    keyframes, _ = select_keyframes(clip(2))
+    results = [
+        {"class_name": "A", "class_idx": 0, "confidence": 0.9, "is_plant": True},
+        {"class_name": "B", "class_idx": 1, "confidence": 0.6, "is_plant": True},
+        {"class_name": "A", "class_idx": 0, "confidence": 0.7, "is_plant": True},
+        {"class_name": "Not a plant image", "class_idx": -1, "confidence": 0.0, "is_plant": False, "error": "no"},
+        {"class_name": "B", "class_idx": 1, "confidence": 0.5, "is_plant": True},
+    ]
+    summary = summarize_keyframes(keyframes, results)
+    print({k: v for k, v in summary.items() if k != "timeline"})
+    assert summary["class_name"] == "A" and np.isclose(summary["confidence"], 0.4)
+    assert [d["frames"] for d in summary["detections"]] == [2, 2]
+    assert summary["plant_frames"] == 4 and summary["timeline"][3]["error"] == "no"
+    print()
+
+    print("All tests passed!")
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ARRAY, Float, ForeignKey, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, Text, ARRAY, Float, ForeignKey, JSON, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
@@ -94,6 +94,9 @@ class DiagnosisHistory(Base):
     diagnosed_at = Column(DateTime, default=datetime.utcnow, index=True)
     notes = Column(Text)
     status = Column(String, default='active')  # active, archived
+    embedding = Column(LargeBinary)  # int8 penultimate features of the diagnosed image
+    embedding_scale = Column(Float)  # dequantize: int8 value * scale
+    embedding_model = Column(String, index=True)  # weights the embedding came from
 
 
 def get_db():
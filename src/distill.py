@@ -0,0 +1,113 @@
+from pathlib import Path
+import sys
+
+import torch
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import active_config as cfg
+from src.core.dataset import create_dataloaders
+from src.core.model import create_model, save_model, load_model
+from src.core.trainer import train
+from src.utils.benchmark import measure_latency, print_latency_table
+
+
+def compare_cpu_latency(teacher: torch.nn.Module, student: torch.nn.Module) -> None:
+    results = {}
+    for name, model in (("teacher", teacher), ("student", student)):
+        model = model.to("cpu").eval()
+        for batch_size in (1, 8):
+            batch = torch.randn(batch_size, 3, *cfg.IMAGE_SIZE)
+
+            def run():
+                with torch.no_grad():
+                    model(batch)
+
+            results[f"{name} bs={batch_size}"] = measure_latency(run, batch_size=batch_size)
+    print_latency_table(results, title="CPU LATENCY: TEACHER VS STUDENT")
+
+    for batch_size in (1, 8):
+        speedup = results[f"teacher bs={batch_size}"]["mean_ms"] / results[f"student bs={batch_size}"]["mean_ms"]
+        print(f"Student speedup at bs={batch_size}: {speedup:.1f}x")
+
+
+def main() -> None:
+    cfg.validate_paths()
+
+    data_dirs = cfg.get_data_directories()
+    if not data_dirs:
+        raise FileNotFoundError(
+            "No data directories found. Ensure data/PlantVillage or data/NewPlantDiseases/train exists."
+        )
+
+    train_loader, val_loader, full_dataset = create_dataloaders(
+        data_directories=data_dirs,
+        batch_size=cfg.BATCH_SIZE,
+        train_split=cfg.TRAIN_SPLIT,
+        num_workers=cfg.NUM_WORKERS,
+        pin_memory=cfg.PIN_MEMORY,
+    )
+
+    num_classes = len(full_dataset.class_to_idx)
+    device = torch.device(cfg.DEVICE)
+
+    teacher = load_model(cfg.MODEL_SAVE_PATH, device=device.type, for_inference=True)
+    if teacher.num_classes != num_classes:
+        raise ValueError(
+            f"Teacher predicts {teacher.num_classes} classes but the dataset has {num_classes}. "
+            "Retrain the teacher on the current class mapping first."
+        )
+
+    student = create_model(
+        num_classes=num_classes,
+        pretrained=cfg.USE_PRETRAINED,
+        freeze_backbone=cfg.FREEZE_BACKBONE if not cfg.TWO_STAGE_TRAINING else True,  # Freeze for stage 1
+        hidden_units=cfg.HIDDEN_UNITS,
+        dropout_rate=cfg.DROPOUT_RATE,
+        device=device.type,
+        backbone=cfg.STUDENT_MODEL_NAME,
+    )
+
+    total_epochs = cfg.STAGE1_EPOCHS + cfg.STAGE2_EPOCHS if cfg.TWO_STAGE_TRAINING else cfg.NUM_EPOCHS
+
+    history = train(
+        student,
+        train_loader,
+        val_loader,
+        device=device,
+        epochs=total_epochs,
+        lr=cfg.LEARNING_RATE,
+        weight_decay=cfg.WEIGHT_DECAY,
+        scheduler_type=cfg.LR_SCHEDULER,
+        step_size=cfg.LR_STEP_SIZE,
+        gamma=cfg.LR_GAMMA,
+        lr_min=cfg.LR_MIN,
+        use_amp=cfg.USE_MIXED_PRECISION,
+        log_interval=cfg.LOG_EVERY_N_BATCHES,
+        save_best=cfg.SAVE_BEST_MODEL,
+        checkpoint_path=str(cfg.STUDENT_MODEL_PATH.with_suffix(".ckpt")),
+        use_mixup=cfg.USE_MIXUP,
+        mixup_alpha=cfg.MIXUP_ALPHA,
+        two_stage=cfg.TWO_STAGE_TRAINING,
+        stage1_epochs=cfg.STAGE1_EPOCHS,
+        teacher=teacher,
+        distill_alpha=cfg.DISTILL_ALPHA,
+        distill_temperature=cfg.DISTILL_TEMPERATURE,
+    )
+
+    save_model(student, cfg.STUDENT_MODEL_PATH, record_latency=True)
+    print(f"Distillation complete. Student saved to: {cfg.STUDENT_MODEL_PATH}")
+
+    if history["val_acc"]:
+        print(
+            f"Best Val Acc: {max(history['val_acc']):.2f}%  "
+            f"Final Val Acc: {history['val_acc'][-1]:.2f}%"
+        )
+
+    compare_cpu_latency(teacher, student)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,39 @@ from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 from PIL import Image
+import numpy as np
+import asyncio
+import base64
 import io
 import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
 from typing import Dict, List, Optional
 from sqlalchemy.orm import Session
 from datetime import timedelta
 from pydantic import BaseModel
 
 from config import active_config as cfg
-from src.core.predictor import PlantDiseasePredictor
-from src.database import get_db, User, Remedy, Feedback, SavedPlant, DiagnosisHistory, init_db
+from src.core.predictor import PlantDiseasePredictor, heatmap_png
+from src.core.batcher import MicroBatcher
+from src.core.executor import (
+    PRIORITY_BULK,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_MODEL_LOAD,
+    PRIORITY_SHADOW,
+    InferenceExecutor,
+    PriorityClass,
+    QueueFullError,
+)
+from src.core.cache import PredictionCache
+from src.core.autotune import load_perf_profile
+from src.core.embeddings import IVFPQIndex, dequantize_embedding, quantize_embedding
+from src.core.registry import ModelRegistry, ModelVersion, RegistryError
+from src.core.video import image_frames, select_keyframes, summarize_keyframes, video_frames
+from src.database import get_db, SessionLocal, User, Remedy, Feedback, SavedPlant, DiagnosisHistory, init_db
 from src.auth import (
     create_access_token,
     get_current_active_user,
@@ -22,13 +45,272 @@ from src.auth import (
 )
 
 
-predictor = PlantDiseasePredictor(
-    model_path=cfg.MODEL_SAVE_PATH,
-    class_mapping_path=cfg.CLASS_MAPPING_PATH,
-    top_k=cfg.TOP_K_PREDICTIONS,
-    confidence_threshold=cfg.CONFIDENCE_THRESHOLD,
+# Per-host settings measured by src/autotune.py; None falls back to config.py
+perf_settings = load_perf_profile(cfg.PERF_PROFILE_PATH, cfg.PERF_PROFILE)
+
+
+def tuned(key: str, default):
+    return perf_settings.get(key, default) if perf_settings else default
+
+
+def build_predictor(model_path: Path = cfg.MODEL_SAVE_PATH) -> PlantDiseasePredictor:
+    return PlantDiseasePredictor(
+        model_path=model_path,
+        class_mapping_path=cfg.CLASS_MAPPING_PATH,
+        top_k=cfg.TOP_K_PREDICTIONS,
+        confidence_threshold=cfg.CONFIDENCE_THRESHOLD,
+        backend=tuned("backend", cfg.INFERENCE_BACKEND),
+        onnx_path=cfg.ONNX_MODEL_PATH if Path(model_path) == cfg.MODEL_SAVE_PATH else None,
+        precision=tuned("precision", cfg.INFERENCE_PRECISION),
+        int8_path=cfg.INT8_MODEL_PATH if Path(model_path) == cfg.MODEL_SAVE_PATH else None,
+        cache_size=cfg.PREDICTION_CACHE_SIZE,
+        cache_ttl=cfg.PREDICTION_CACHE_TTL_SECONDS,
+        frozen_graph=cfg.USE_FROZEN_GRAPH,
+        shared_weights=cfg.SHARE_MODEL_WEIGHTS,
+        shared_dir=cfg.SHARED_WEIGHTS_DIR,
+        cascade_model_path=cfg.STUDENT_MODEL_PATH if cfg.USE_CASCADE else None,
+        cascade_threshold=cfg.CASCADE_THRESHOLD,
+        return_embeddings=cfg.RETURN_EMBEDDINGS,
+        return_heatmaps=cfg.RETURN_HEATMAPS,
+        feature_gate=cfg.PLANT_GATE == "features",
+        num_threads=tuned("num_threads", None),
+        num_interop_threads=tuned("num_interop_threads", None),
+    )
+
+
+def warm_predictor(loaded: PlantDiseasePredictor) -> Dict[int, float]:
+    warmup_sizes = tuple(sorted({1, tuned("batch_size", cfg.MICRO_BATCH_MAX_SIZE)})) if perf_settings else cfg.WARMUP_BATCH_SIZES
+    return loaded.warmup(warmup_sizes, cfg.WARMUP_ITERATIONS)
+
+
+def on_model_activated(entry: ModelVersion):
+    # Embeddings from different weights are not comparable: follow the new model
+    loaded = entry.predictor
+    if loaded.return_embeddings and (similar_index is None or similar_index.model_id != loaded.embedding_model):
+        load_similar_cases_index()
+
+
+# Inference runs on dedicated threads so the event loop stays responsive;
+# interactive requests are always served ahead of queued bulk and shadow work
+executor = InferenceExecutor(
+    max_workers=cfg.INFERENCE_WORKERS,
+    max_queue=cfg.INFERENCE_MAX_QUEUE,
+    retry_after=cfg.INFERENCE_RETRY_AFTER_SECONDS,
+    classes=[
+        PriorityClass(
+            PRIORITY_INTERACTIVE,
+            max_queue=cfg.INFERENCE_MAX_QUEUE,
+            deadline_ms=cfg.INFERENCE_INTERACTIVE_DEADLINE_MS,
+        ),
+        PriorityClass(
+            PRIORITY_BULK,
+            share=cfg.INFERENCE_BULK_SHARE,
+            max_queue=cfg.INFERENCE_BULK_MAX_QUEUE,
+            deadline_ms=cfg.INFERENCE_BULK_DEADLINE_MS,
+        ),
+        PriorityClass(
+            PRIORITY_SHADOW,
+            share=cfg.INFERENCE_SHADOW_SHARE,
+            max_queue=cfg.SHADOW_MAX_PENDING,
+            deadline_ms=cfg.INFERENCE_SHADOW_DEADLINE_MS,
+        ),
+        PriorityClass(PRIORITY_MODEL_LOAD, share=0.25, max_queue=1),
+    ],
 )
 
+# Serving model, candidate and shadow evaluation; swapped via /admin/models.
+# Concurrent calls keep the model they started with across a swap.
+registry = ModelRegistry(
+    build_fn=build_predictor,
+    warmup_fn=warm_predictor,
+    state_path=cfg.MODEL_REGISTRY_PATH,
+    is_busy=lambda: executor.queue_depth > 0,
+    shadow_max_pending=cfg.SHADOW_MAX_PENDING,
+    on_activate=on_model_activated,
+    executor=executor,
+)
+
+# The first model, loaded and warmed in the background at startup; see
+# load_and_warm_predictor. Lifecycle: loading -> warming -> ready (or failed)
+startup_model: Optional[ModelVersion] = None
+
+
+def model_state() -> Dict:
+    if startup_model is None:
+        return {"status": "not_loaded", "error": None, "load_seconds": None, "warmup_ms": None}
+    return startup_model.describe()
+
+
+def load_and_warm_predictor():
+    global startup_model
+    
+    # A version promoted through /admin/models outlives restarts
+    state = registry.read_state()
+    if state and Path(state["model_path"]).exists():
+        entry = ModelVersion(state["version"], state["model_path"])
+    else:
+        entry = ModelVersion("initial", cfg.MODEL_SAVE_PATH)
+    startup_model = entry
+    
+    registry.load(entry)
+    if entry.status != "ready":
+        return
+    registry.activate(entry, record=False)
+    
+    loaded = entry.predictor
+    print("=" * 70)
+    print(f"Model ready: {entry.model_path.name} ({entry.version})")
+    print(f"Classes: {loaded.num_classes}")
+    print(f"Device: {loaded.device}")
+    print(f"Backend: {loaded.backend} ({loaded.precision})")
+    print(f"Load time: {entry.load_seconds}s")
+    print("=" * 70)
+
+
+async def follow_model_registry():
+    """Pick up promotions and rollbacks made through another worker process."""
+    while True:
+        await asyncio.sleep(cfg.MODEL_REGISTRY_POLL_SECONDS)
+        if model_ready():
+            registry.sync()
+
+
+# ==================== Similar Cases ====================
+
+# Embeddings of recent predictions and the weights that produced them, keyed
+# by prediction_id (the upload's content hash), waiting for the user to save the diagnosis to history
+pending_embeddings: "OrderedDict[str, object]" = OrderedDict()
+pending_embeddings_lock = threading.Lock()
+
+# Approximate nearest-neighbour index over saved diagnoses' embeddings
+similar_index: Optional[IVFPQIndex] = None
+# Serializes sync_similar_index: concurrent syncs would read and add the same rows
+similar_index_sync_lock = threading.Lock()
+
+
+def remember_embedding(contents: bytes, result: Dict) -> Optional[str]:
+    embedding = result.pop('embedding', None)
+    embedding_model = result.pop('embedding_model', None)
+    if embedding is None:
+        return None
+    
+    prediction_id = PredictionCache.digest(contents)
+    with pending_embeddings_lock:
+        pending_embeddings[prediction_id] = (embedding, embedding_model)
+        pending_embeddings.move_to_end(prediction_id)
+        while len(pending_embeddings) > cfg.PENDING_EMBEDDINGS_MAX:
+            pending_embeddings.popitem(last=False)
+    return prediction_id
+
+
+def heatmap_field(result: Dict) -> Optional[Dict]:
+    """
+    The top-1 Grad-CAM heatmap as a small grayscale PNG (last conv stage
+    resolution, e.g. 7x7; upscale it over the image when displaying).
+    """
+    heatmap = result.pop('heatmap', None)
+    if heatmap is None:
+        return None
+    return {
+        "width": heatmap.shape[1],
+        "height": heatmap.shape[0],
+        "png_base64": base64.b64encode(heatmap_png(heatmap)).decode("ascii"),
+    }
+
+
+def check_explain(loaded: PlantDiseasePredictor, explain: bool):
+    if explain and not loaded.return_heatmaps:
+        raise HTTPException(status_code=400, detail="Explanations are not enabled on this server")
+
+
+def new_similar_index() -> IVFPQIndex:
+    predictor = registry.predictor
+    return IVFPQIndex(
+        dim=predictor.embedding_dim,
+        n_lists=cfg.EMBEDDING_INDEX_LISTS,
+        n_subvectors=cfg.EMBEDDING_INDEX_SUBVECTORS,
+        nprobe=cfg.EMBEDDING_INDEX_NPROBE,
+        model_id=predictor.embedding_model,
+        background_training=True,
+    )
+
+
+def sync_similar_index(db: Session, batch_size: int = 5000):
+    """
+    Add saved diagnoses newer than the index's last id, in id order. This
+    is the only way rows enter the index, so last_id is a high-water mark
+    of the database rather than of this worker's own inserts.
+    """
+    index = similar_index
+    with similar_index_sync_lock:
+        while True:
+            rows = db.query(
+                DiagnosisHistory.id, DiagnosisHistory.embedding, DiagnosisHistory.embedding_scale
+            ).filter(
+                DiagnosisHistory.id > index.last_id,
+                DiagnosisHistory.embedding_model == index.model_id,
+                DiagnosisHistory.embedding.isnot(None),
+            ).order_by(DiagnosisHistory.id).limit(batch_size).all()
+            if not rows:
+                return
+            index.add(
+                [row.id for row in rows],
+                np.stack([dequantize_embedding(row.embedding, row.embedding_scale) for row in rows]),
+            )
+
+
+def load_similar_cases_index():
+    global similar_index
+    
+    index = None
+    if cfg.EMBEDDING_INDEX_PATH.exists():
+        try:
+            index = IVFPQIndex.load(cfg.EMBEDDING_INDEX_PATH, background_training=True)
+            if index.model_id != registry.predictor.embedding_model:
+                print("Similar-cases index was built for different weights; rebuilding from history...")
+                index = None
+        except Exception as e:
+            print(f"Warning: could not load similar-cases index ({e}); rebuilding from history...")
+    
+    similar_index = index or new_similar_index()
+    db = SessionLocal()
+    try:
+        sync_similar_index(db)
+    finally:
+        db.close()
+    print(f"Similar-cases index ready: {len(similar_index):,} diagnoses")
+
+
+def model_ready() -> bool:
+    return registry.predictor is not None
+
+
+def get_predictor() -> PlantDiseasePredictor:
+    if not model_ready():
+        raise HTTPException(
+            status_code=503,
+            detail="Model is still loading. Please retry shortly.",
+            headers={"Retry-After": str(cfg.MODEL_NOT_READY_RETRY_AFTER_SECONDS)},
+        )
+    return registry.predictor
+
+# Concurrent /predict calls are merged into predict_batch calls
+batcher = MicroBatcher(
+    lambda images: registry.predict_batch(images, return_all=True),
+    max_batch_size=tuned("batch_size", cfg.MICRO_BATCH_MAX_SIZE),
+    max_wait_ms=cfg.MICRO_BATCH_MAX_WAIT_MS,
+    executor=executor,
+    max_pending=cfg.MICRO_BATCH_MAX_PENDING,
+)
+
+
+def overloaded_error(error: QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server is busy processing other images. Please retry shortly.",
+        headers={"Retry-After": str(max(1, int(round(error.retry_after))))},
+    )
+
 
 app = FastAPI(
     title="Mission Vanaspati API",
@@ -53,11 +335,17 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     init_db()
+    await batcher.start()
+    app.state.registry_follower = asyncio.create_task(follow_model_registry())
+    # Load and warm on an inference worker without blocking startup, so
+    # liveness answers immediately and readiness flips once the model is warm.
+    # Submitted as a job so the scheduler counts the worker it occupies.
+    app.state.model_loader = asyncio.ensure_future(
+        executor.run(load_and_warm_predictor, priority=PRIORITY_MODEL_LOAD)
+    )
     print("=" * 70)
     print("Mission Vanaspati API Started")
-    print(f"Model: {cfg.MODEL_SAVE_PATH.name}")
-    print(f"Classes: {predictor.num_classes}")
-    print(f"Device: {predictor.device}")
+    print(f"Model: {cfg.MODEL_SAVE_PATH.name} (loading in background)")
     print("=" * 70)
 
 
@@ -194,6 +482,87 @@ def delete_user(
     return {"message": f"User {user.email} deleted successfully"}
 
 
+# ==================== Model Registry ====================
+
+class CandidateModelRequest(BaseModel):
+    model_path: str  # checkpoint inside the models directory
+    version: Optional[str] = None
+    shadow_fraction: float = 0.0
+
+
+class ShadowRequest(BaseModel):
+    fraction: float
+
+
+def registry_error(error: RegistryError) -> HTTPException:
+    return HTTPException(status_code=409, detail=str(error))
+
+
+@app.get("/admin/models", tags=["Admin"])
+def get_model_registry(admin_user: User = Depends(get_admin_user)) -> Dict:
+    return registry.get_status()
+
+
+@app.post("/admin/models/candidate", tags=["Admin"])
+def load_candidate_model(
+    data: CandidateModelRequest,
+    admin_user: User = Depends(get_admin_user)
+) -> Dict:
+    """Load and warm a checkpoint in the background next to the serving model."""
+    # Checkpoints are unpickled on load: only accept files under models/
+    models_dir = cfg.MODELS_DIR.resolve()
+    model_path = (models_dir / data.model_path).resolve()
+    if models_dir not in model_path.parents:
+        raise HTTPException(status_code=400, detail="model_path must be inside the models directory")
+    
+    try:
+        entry = registry.load_candidate(model_path, data.version, data.shadow_fraction)
+    except RegistryError as e:
+        raise registry_error(e)
+    return {"message": f"Loading candidate {entry.version}", "candidate": entry.describe()}
+
+
+@app.put("/admin/models/candidate/shadow", tags=["Admin"])
+def set_shadow_fraction(
+    data: ShadowRequest,
+    admin_user: User = Depends(get_admin_user)
+) -> Dict:
+    if registry.candidate is None or registry.candidate.status != "ready":
+        raise HTTPException(status_code=409, detail="No ready candidate model to shadow")
+    try:
+        registry.set_shadow_fraction(data.fraction)
+    except RegistryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return registry.get_status()["shadow"]
+
+
+@app.post("/admin/models/promote", tags=["Admin"])
+def promote_candidate_model(admin_user: User = Depends(get_admin_user)) -> Dict:
+    try:
+        entry = registry.promote()
+    except RegistryError as e:
+        raise registry_error(e)
+    return {"message": f"Now serving {entry.version}", "active": entry.describe()}
+
+
+@app.post("/admin/models/rollback", tags=["Admin"])
+def rollback_model(admin_user: User = Depends(get_admin_user)) -> Dict:
+    try:
+        entry = registry.rollback()
+    except RegistryError as e:
+        raise registry_error(e)
+    return {"message": f"Rolled back to {entry.version}", "active": entry.describe()}
+
+
+@app.delete("/admin/models/candidate", tags=["Admin"])
+def discard_candidate_model(admin_user: User = Depends(get_admin_user)) -> Dict:
+    try:
+        entry = registry.discard_candidate()
+    except RegistryError as e:
+        raise registry_error(e)
+    return {"message": f"Candidate {entry.version} discarded"}
+
+
 @app.get("/remedies", tags=["Remedies"])
 def get_all_remedies(db: Session = Depends(get_db)) -> List[Dict]:
     remedies = db.query(Remedy).all()
@@ -233,28 +602,72 @@ def root() -> Dict[str, str]:
 
 
 @app.get("/health", tags=["Health"])
-def health_check() -> Dict[str, str]:
+def health_check() -> Dict:
+    predictor = registry.predictor
+    response = {
+        "status": "healthy" if model_ready() else model_state()["status"],
+        "model_loaded": predictor is not None,
+        "model_warm": model_ready(),
+        "model_state": model_state(),
+    }
+    if predictor is not None:
+        response.update({
+            "model_version": registry.active.version,
+            "num_classes": predictor.num_classes,
+            "device": str(predictor.device),
+            "backend": predictor.backend,
+            "precision": predictor.precision,
+            "plant_gate": "features" if predictor.feature_gate else "heuristic",
+        })
+    return response
+
+
+@app.get("/health/live", tags=["Health"])
+def liveness_check() -> Dict[str, str]:
+    return {"status": "alive"}
+
+
+@app.get("/health/ready", tags=["Health"])
+def readiness_check() -> JSONResponse:
+    return JSONResponse(
+        status_code=200 if model_ready() else 503,
+        content={
+            "ready": model_ready(),
+            "model_state": model_state(),
+        },
+    )
+
+
+@app.get("/metrics", tags=["Health"])
+def get_metrics() -> Dict:
+    predictor = registry.predictor
     return {
-        "status": "healthy",
-        "model_loaded": True,
-        "num_classes": predictor.num_classes,
-        "device": str(predictor.device),
+        "batching": batcher.get_metrics(),
+        "inference_queue": executor.get_metrics(),
+        "prediction_cache": predictor.cache.get_metrics() if predictor and predictor.cache else None,
+        "cascade": predictor.get_cascade_metrics() if predictor else None,
+        "shadow": registry.get_status()["shadow"],
     }
 
 
 @app.get("/classes", tags=["Info"])
 def get_classes() -> Dict[str, List[str]]:
+    loaded = get_predictor()
     return {
-        "classes": predictor.get_all_classes(),
-        "count": predictor.num_classes
+        "classes": loaded.get_all_classes(),
+        "count": loaded.num_classes
     }
 
 
 @app.post("/predict", tags=["Prediction"])
 async def predict_disease(
     file: UploadFile = File(...),
+    explain: bool = False,
     current_user: User = Depends(get_current_active_user)
 ) -> JSONResponse:
+    """With explain=true the response includes a heatmap of the leaf regions behind the top prediction."""
+    check_explain(get_predictor(), explain)
+    
     if not file.content_type.startswith("image/"):
         raise HTTPException(
             status_code=400,
@@ -270,7 +683,10 @@ async def predict_disease(
         )
     
     try:
-        image = Image.open(io.BytesIO(contents)).convert('RGB')
+        # Only the header is parsed here. The raw bytes go to the predictor,
+        # which serves repeat uploads from its cache and otherwise decodes on
+        # the inference worker.
+        image = Image.open(io.BytesIO(contents))
         
         # Check minimum image dimensions
         width, height = image.size
@@ -280,7 +696,7 @@ async def predict_disease(
                 detail="Image is too small. Please upload a clear image of at least 50x50 pixels."
             )
         
-        result = predictor.predict(image, return_all=True)
+        result = await batcher.submit(contents)
         
         # Check if it's a plant image
         if not result.get('is_plant', True):
@@ -289,23 +705,29 @@ async def predict_disease(
                 detail=result.get('error', 'The uploaded image does not appear to be a plant leaf. Please upload a clear image of a plant leaf.')
             )
         
-        return JSONResponse(
-            content={
-                "predicted_class": result['class_name'],
-                "confidence": round(result['confidence'], 4),
-                "top_predictions": [
-                    {
-                        "class_name": pred['class_name'],
-                        "confidence": round(pred['confidence'], 4)
-                    }
-                    for pred in result['top_k']
-                ],
-                "filename": file.filename,
-            }
-        )
+        # Heatmaps come from the same forward pass and are cached with the result
+        heatmap = heatmap_field(result)
+        content = {
+            "predicted_class": result['class_name'],
+            "confidence": round(result['confidence'], 4),
+            "top_predictions": [
+                {
+                    "class_name": pred['class_name'],
+                    "confidence": round(pred['confidence'], 4)
+                }
+                for pred in result['top_k']
+            ],
+            "filename": file.filename,
+            "prediction_id": remember_embedding(contents, result),
+        }
+        if explain:
+            content["heatmap"] = heatmap
+        return JSONResponse(content=content)
         
     except HTTPException:
         raise
+    except QueueFullError as e:
+        raise overloaded_error(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -316,8 +738,12 @@ async def predict_disease(
 @app.post("/predict/batch", tags=["Prediction"])
 async def predict_batch(
     files: List[UploadFile] = File(...),
+    explain: bool = False,
     current_user: User = Depends(get_current_active_user)
 ) -> JSONResponse:
+    loaded = get_predictor()
+    check_explain(loaded, explain)
+    
     if len(files) > 10:
         raise HTTPException(
             status_code=400,
@@ -342,7 +768,7 @@ async def predict_batch(
                 continue
             
             try:
-                image = Image.open(io.BytesIO(contents)).convert('RGB')
+                image = Image.open(io.BytesIO(contents))
                 
                 # Check minimum dimensions
                 width, height = image.size
@@ -350,7 +776,7 @@ async def predict_batch(
                     errors.append(f"{file.filename}: Image too small")
                     continue
                     
-                images.append(image)
+                images.append(contents)
                 filenames.append(file.filename)
             except Exception as e:
                 errors.append(f"{file.filename}: Failed to process - {str(e)}")
@@ -361,12 +787,16 @@ async def predict_batch(
                 detail=f"No valid images found. Errors: {'; '.join(errors)}"
             )
         
-        results = predictor.predict_batch(images, return_all=True)
+        results = []
+        for start in range(0, len(images), cfg.INFERENCE_BULK_CHUNK_SIZE):
+            chunk = images[start:start + cfg.INFERENCE_BULK_CHUNK_SIZE]
+            results.extend(await executor.run(registry.predict_batch, chunk, return_all=True, priority=PRIORITY_BULK))
         
         predictions = []
         non_plant_images = []
         
-        for filename, result in zip(filenames, results):
+        for filename, contents, result in zip(filenames, images, results):
+            heatmap = heatmap_field(result)
             # Check if it's a plant image
             if not result.get('is_plant', True):
                 non_plant_images.append(filename)
@@ -388,8 +818,11 @@ async def predict_batch(
                             "confidence": round(pred['confidence'], 4)
                         }
                         for pred in result.get('top_k', [result])
-                    ]
+                    ],
+                    "prediction_id": remember_embedding(contents, result),
                 })
+                if explain:
+                    predictions[-1]["heatmap"] = heatmap
         
         response_data = {"predictions": predictions}
         if non_plant_images:
@@ -397,6 +830,10 @@ async def predict_batch(
         
         return JSONResponse(content=response_data)
         
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise overloaded_error(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -404,6 +841,217 @@ async def predict_batch(
         )
 
 
+@app.post("/predict/tiled", tags=["Prediction"])
+async def predict_tiled(
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_active_user)
+) -> JSONResponse:
+    """Field photos with many leaves: per-tile predictions plus an aggregated diagnosis."""
+    loaded = get_predictor()
+    
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type: {file.content_type}. Please upload an image."
+        )
+    
+    contents = await file.read()
+    if len(contents) > 10 * 1024 * 1024:
+        raise HTTPException(
+            status_code=400,
+            detail="File size exceeds 10MB limit. Please upload a smaller image."
+        )
+    
+    try:
+        width, height = Image.open(io.BytesIO(contents)).size
+        if width < 50 or height < 50:
+            raise HTTPException(
+                status_code=400,
+                detail="Image is too small. Please upload a clear image of at least 50x50 pixels."
+            )
+        
+        result = await executor.run(
+            loaded.predict_tiled,
+            contents,
+            return_all=True,
+            max_tiles=cfg.TILING_MAX_TILES,
+            tile_size=cfg.TILING_TILE_SIZE,
+            overlap=cfg.TILING_OVERLAP,
+            decode_size=cfg.TILING_DECODE_SIZE,
+        )
+        
+        if not result.get('is_plant', True):
+            raise HTTPException(
+                status_code=400,
+                detail=result.get('error', 'No plant leaves were found in the uploaded photo.')
+            )
+        
+        return JSONResponse(
+            content={
+                "predicted_class": result['class_name'],
+                "confidence": round(result['confidence'], 4),
+                "top_predictions": [
+                    {
+                        "class_name": pred['class_name'],
+                        "confidence": round(pred['confidence'], 4)
+                    }
+                    for pred in result['top_k']
+                ],
+                "detections": [
+                    {
+                        "class_name": detection['class_name'],
+                        "tiles": detection['tiles'],
+                        "max_confidence": round(detection['max_confidence'], 4)
+                    }
+                    for detection in result['detections']
+                ],
+                "tiles": [
+                    {
+                        "box": [round(v, 4) for v in tile['box']],
+                        "is_plant": tile['is_plant'],
+                        "predicted_class": tile['class_name'],
+                        "confidence": round(tile['confidence'], 4),
+                        "green_ratio": tile['green_ratio']
+                    }
+                    for tile in result['tiles']
+                ],
+                "num_tiles": result['num_tiles'],
+                "filename": file.filename,
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise overloaded_error(e)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Prediction failed: {str(e)}"
+        )
+
+
+@app.post("/predict/video", tags=["Prediction"])
+async def predict_video(
+    files: List[UploadFile] = File(...),
+    current_user: User = Depends(get_current_active_user)
+) -> JSONResponse:
+    """
+    A short video of a crop row (one video file) or a burst of photos
+    (several image files): the sharpest distinct keyframes are classified in
+    batches and returned as a timeline plus an aggregated diagnosis.
+    """
+    get_predictor()
+    
+    videos = [f for f in files if (f.content_type or "").startswith("video/")]
+    images = [f for f in files if (f.content_type or "").startswith("image/")]
+    if len(videos) + len(images) != len(files) or (videos and len(files) > 1):
+        raise HTTPException(
+            status_code=400,
+            detail="Upload either one video file or a burst of image files."
+        )
+    if len(images) > cfg.VIDEO_MAX_BURST_IMAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Maximum {cfg.VIDEO_MAX_BURST_IMAGES} images allowed per burst"
+        )
+    
+    video_path = None
+    info = {}
+    try:
+        if videos:
+            # OpenCV reads from a path; copy the upload in chunks so memory stays flat
+            upload = videos[0]
+            with tempfile.NamedTemporaryFile(suffix=Path(upload.filename or "").suffix, delete=False) as f:
+                video_path = Path(f.name)
+                size = 0
+                while True:
+                    chunk = await upload.read(1 << 20)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > cfg.VIDEO_MAX_UPLOAD_SIZE:
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"Video exceeds the {cfg.VIDEO_MAX_UPLOAD_SIZE // (1024 * 1024)}MB limit."
+                        )
+                    f.write(chunk)
+            frames = video_frames(video_path, cfg.VIDEO_SAMPLE_FPS, cfg.VIDEO_MAX_DURATION_SECONDS, info)
+        else:
+            # Spooled uploads, read one at a time as the selection reaches them
+            frames = image_frames(image.file.read() for image in images)
+        
+        # Decoding and keyframe scoring stay off the inference threads
+        keyframes, stats = await asyncio.to_thread(select_keyframes, frames, cfg.VIDEO_MAX_KEYFRAMES)
+        if not keyframes:
+            raise HTTPException(status_code=400, detail="No decodable frames were found in the upload.")
+        
+        results = []
+        for start in range(0, len(keyframes), cfg.VIDEO_BATCH_SIZE):
+            batch = [keyframe.image for keyframe in keyframes[start:start + cfg.VIDEO_BATCH_SIZE]]
+            results.extend(await executor.run(registry.predict_batch, batch, return_all=True, priority=PRIORITY_BULK))
+        summary = summarize_keyframes(keyframes, results, cfg.CONFIDENCE_THRESHOLD)
+        
+        if not summary['is_plant']:
+            raise HTTPException(status_code=400, detail=summary['error'])
+        
+        return JSONResponse(
+            content={
+                "predicted_class": summary['class_name'],
+                "confidence": round(summary['confidence'], 4),
+                "detections": [
+                    {
+                        "class_name": detection['class_name'],
+                        "frames": detection['frames'],
+                        "max_confidence": round(detection['max_confidence'], 4),
+                        "first_seen": detection['first_seen'],
+                    }
+                    for detection in summary['detections']
+                ],
+                "timeline": [
+                    {
+                        "frame": entry['frame'],
+                        "time": entry['time'],
+                        "sharpness": entry['sharpness'],
+                        "is_plant": entry['is_plant'],
+                        "predicted_class": entry['class_name'],
+                        "confidence": round(entry['confidence'], 4),
+                        "top_predictions": [
+                            {
+                                "class_name": pred['class_name'],
+                                "confidence": round(pred['confidence'], 4)
+                            }
+                            for pred in entry.get('top_k', [])
+                        ],
+                    }
+                    for entry in summary['timeline']
+                ],
+                "num_keyframes": summary['num_keyframes'],
+                "frames_examined": stats['examined'],
+                "blurred_frames": stats['blurred'],
+                "video": info or None,
+                "filenames": [f.filename for f in files],
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise overloaded_error(e)
+    except ImportError:
+        raise HTTPException(status_code=503, detail="Video decoding is not available on this server (OpenCV is not installed).")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Prediction failed: {str(e)}"
+        )
+    finally:
+        if video_path is not None:
+            video_path.unlink(missing_ok=True)
+
+
 @app.post("/feedback", tags=["Feedback"])
 def submit_feedback(
     subject: str,
@@ -546,6 +1194,7 @@ class DiagnosisHistoryRequest(BaseModel):
     alternatives: Optional[List[Dict]] = None
     remedy_info: Optional[Dict] = None
     notes: Optional[str] = None
+    prediction_id: Optional[str] = None  # links the stored embedding for similar-case search
 
 
 @app.post("/history/diagnosis", tags=["History"])
@@ -555,6 +1204,11 @@ def save_diagnosis_to_history(
     db: Session = Depends(get_db)
 ) -> Dict:
     """Save a diagnosis to user's history"""
+    embedding = embedding_model = None
+    if data.prediction_id:
+        with pending_embeddings_lock:
+            embedding, embedding_model = pending_embeddings.pop(data.prediction_id, (None, None))
+    
     try:
         diagnosis = DiagnosisHistory(
             user_id=current_user.id,
@@ -566,9 +1220,14 @@ def save_diagnosis_to_history(
             remedy_info=data.remedy_info,
             notes=data.notes
         )
+        if embedding is not None:
+            diagnosis.embedding, diagnosis.embedding_scale = quantize_embedding(embedding)
+            diagnosis.embedding_model = embedding_model
         db.add(diagnosis)
         db.commit()
         db.refresh(diagnosis)
+        # Not added to similar_index here: the next sync picks it up in id
+        # order together with rows saved by other workers
         
         return {
             "status": "success",
@@ -622,6 +1281,76 @@ def get_diagnosis_history(
         raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
 
 
+@app.get("/history/similar", tags=["History"])
+def get_similar_cases(
+    prediction_id: Optional[str] = None,
+    diagnosis_id: Optional[int] = None,
+    k: int = 5,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+) -> Dict:
+    """
+    Past diagnoses that look most like a recent prediction or a saved
+    diagnosis. Other users' cases are returned without identifying details.
+    """
+    if similar_index is None:
+        raise HTTPException(status_code=503, detail="Similar-case search is not enabled")
+    if not 1 <= k <= 50:
+        raise HTTPException(status_code=400, detail="k must be between 1 and 50")
+    
+    if prediction_id:
+        with pending_embeddings_lock:
+            query, embedding_model = pending_embeddings.get(prediction_id, (None, None))
+        if query is None or embedding_model != similar_index.model_id:
+            raise HTTPException(status_code=404, detail="Prediction not found or expired")
+    elif diagnosis_id is not None:
+        diagnosis = db.query(DiagnosisHistory).filter(
+            DiagnosisHistory.id == diagnosis_id,
+            DiagnosisHistory.user_id == current_user.id
+        ).first()
+        if not diagnosis:
+            raise HTTPException(status_code=404, detail="Diagnosis not found")
+        if diagnosis.embedding is None or diagnosis.embedding_model != similar_index.model_id:
+            raise HTTPException(status_code=404, detail="No embedding stored for this diagnosis")
+        query = dequantize_embedding(diagnosis.embedding, diagnosis.embedding_scale)
+    else:
+        raise HTTPException(status_code=400, detail="Provide prediction_id or diagnosis_id")
+    
+    # Pick up diagnoses saved by other workers since the last search
+    sync_similar_index(db)
+    
+    # Over-fetch: deleted or archived rows stay in the index until a rebuild
+    matches = [(i, score) for i, score in similar_index.search(query, k=3 * k + 1) if i != diagnosis_id]
+    rows = {
+        row.id: row
+        for row in db.query(DiagnosisHistory).filter(
+            DiagnosisHistory.id.in_([i for i, _ in matches]),
+            DiagnosisHistory.status == 'active'
+        ).all()
+    }
+    
+    cases = []
+    for i, score in matches:
+        row = rows.get(i)
+        if row is None:
+            continue
+        own = row.user_id == current_user.id
+        case = {
+            "similarity": round(score, 4),
+            "disease_name": row.disease_name,
+            "confidence": row.confidence,
+            "diagnosed_at": row.diagnosed_at.isoformat(),
+            "own": own,
+        }
+        if own:
+            case.update({"id": row.id, "image_name": row.image_name, "notes": row.notes})
+        cases.append(case)
+        if len(cases) == k:
+            break
+    
+    return {"count": len(cases), "cases": cases}
+
+
 @app.delete("/history/diagnosis/{diagnosis_id}", tags=["History"])
 def delete_diagnosis(
     diagnosis_id: int,
@@ -762,6 +1491,12 @@ def delete_plant_from_garden(
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    app.state.registry_follower.cancel()
+    await batcher.stop()
+    executor.shutdown()
+    registry.shutdown()
+    if similar_index is not None:
+        similar_index.save(cfg.EMBEDDING_INDEX_PATH)
     print("Mission Vanaspati API Shutting Down")
 
 
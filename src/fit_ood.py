@@ -0,0 +1,112 @@
+from pathlib import Path
+import argparse
+import sys
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import active_config as cfg
+from src.core.bulk_scoring import ImageSourceDataset, ScoringTransform, collate_scoring_batch
+from src.core.model import load_model
+from src.core.ood import ClassStatistics, extract_features, get_ood_loaders, roc_auc, save_ood_stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Fit the feature-space plant gate (PLANT_GATE=features): class statistics from the "
+                    "training split, threshold calibrated on the validation split, stored in the checkpoint."
+    )
+    parser.add_argument("checkpoint", nargs="?", type=Path, default=cfg.MODEL_SAVE_PATH,
+                        help="Checkpoint to fit and update in place (default: the configured model)")
+    parser.add_argument("--tpr", type=float, default=cfg.OOD_TPR,
+                        help="Share of held-out plant images the threshold accepts")
+    parser.add_argument("--shrinkage", type=float, default=cfg.OOD_SHRINKAGE)
+    parser.add_argument("--max-images", type=int, default=cfg.OOD_FIT_MAX_IMAGES,
+                        help="Images used per split (evenly spaced subset)")
+    parser.add_argument("--batch-size", type=int, default=cfg.BATCH_SIZE)
+    parser.add_argument("--ood-source", type=Path, default=None,
+                        help="Directory, tar or zip of non-plant images; reports how many the threshold rejects")
+    parser.add_argument("--dry-run", action="store_true", help="Report only, leave the checkpoint unchanged")
+    args = parser.parse_args()
+
+    cfg.validate_paths()
+
+    data_dirs = cfg.get_data_directories()
+    if not data_dirs:
+        raise FileNotFoundError(
+            "No data directories found. Fitting needs the training data the checkpoint was trained on."
+        )
+
+    fit_loader, calibration_loader, dataset = get_ood_loaders(
+        data_directories=data_dirs,
+        batch_size=args.batch_size,
+        train_split=cfg.TRAIN_SPLIT,
+        num_workers=cfg.NUM_WORKERS,
+        max_images=args.max_images,
+    )
+
+    device = torch.device(cfg.DEVICE)
+    model = load_model(args.checkpoint, device=device.type, for_inference=True).set_return_features(True)
+    if model.num_classes != len(dataset.class_to_idx):
+        raise ValueError(
+            f"{args.checkpoint} predicts {model.num_classes} classes but the dataset has {len(dataset.class_to_idx)}."
+        )
+
+    stats = ClassStatistics(model.num_classes, model.feature_dim)
+    for features, labels in extract_features(model, fit_loader, device):
+        stats.update(features, labels)
+    detector = stats.fit(args.shrinkage)
+
+    in_scores = np.concatenate([
+        detector.score(torch.from_numpy(features)).numpy()
+        for features, _ in extract_features(model, calibration_loader, device)
+    ])
+    threshold = detector.calibrate(in_scores, args.tpr)
+    detector.info["calibration_images"] = int(in_scores.size)
+
+    print("=" * 70)
+    print(f"Fitted on {detector.info['num_images']:,} images, {detector.info['num_classes']} classes, "
+          f"{model.feature_dim}-d features")
+    print(f"Held-out plant scores: median {np.median(in_scores):.3f}, p99 {np.percentile(in_scores, 99):.3f}")
+    print(f"Threshold: {threshold:.4f} (accepts {(in_scores <= threshold).mean():.1%} of held-out plant images)")
+
+    if args.ood_source is not None:
+        ood_loader = DataLoader(
+            ImageSourceDataset(args.ood_source, ScoringTransform(plant_gate=False)),
+            batch_size=args.batch_size,
+            num_workers=cfg.NUM_WORKERS,
+            collate_fn=collate_scoring_batch,
+        )
+        out_scores = []
+        with torch.no_grad():
+            for collated in ood_loader:
+                if collated["batch"] is not None:
+                    _, features = model(collated["batch"].to(device))
+                    out_scores.append(detector.score(features.float().cpu()).numpy())
+        out_scores = np.concatenate(out_scores) if out_scores else np.empty(0)
+        if out_scores.size:
+            detector.info["ood_images"] = int(out_scores.size)
+            detector.info["ood_rejected"] = float((out_scores > threshold).mean())
+            detector.info["auroc"] = roc_auc(in_scores, out_scores)
+            print(f"Non-plant images: {out_scores.size:,}, rejected {detector.info['ood_rejected']:.1%}, "
+                  f"AUROC {detector.info['auroc']:.4f}")
+    print("=" * 70)
+
+    if args.dry_run:
+        print("Dry run: checkpoint left unchanged")
+        return
+
+    save_ood_stats(args.checkpoint, detector)
+    print(f"OOD statistics saved to: {args.checkpoint}")
+    # The checkpoint's identity changed: caches and embeddings keyed to it start afresh
+    print("Note: frozen graphs and shared weights are rebuilt on next load; similar-case embeddings "
+          "stored for the previous file are no longer matched.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+from pathlib import Path
+import argparse
+import json
+import sys
+from typing import Dict
+
+import torch
+import torch.nn as nn
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import active_config as cfg
+from src.core.dataset import create_dataloaders
+from src.core.inference_graph import fold_for_inference
+from src.core.model import load_model, save_model
+from src.core.pruning import count_macs, prune_channels
+from src.core.trainer import evaluate, train
+from src.utils.benchmark import measure_latency
+
+
+def cpu_latency(model: nn.Module) -> Dict[str, Dict[str, float]]:
+    # Timed as served: BatchNorm folded, channels_last, on the CPU
+    folded = fold_for_inference(model.to("cpu").eval())
+    results = {}
+    for batch_size in (1, 8):
+        batch = torch.randn(batch_size, 3, *cfg.IMAGE_SIZE).contiguous(memory_format=torch.channels_last)
+
+        def run():
+            with torch.no_grad():
+                folded(batch)
+
+        results[f"bs={batch_size}"] = measure_latency(run, batch_size=batch_size)
+    return results
+
+
+def describe(model: nn.Module, val_acc: float, path: Path = None, **extra) -> Dict:
+    return {
+        "path": str(path) if path else None,
+        "params": sum(p.numel() for p in model.parameters()),
+        "gmacs": count_macs(model.to("cpu"), cfg.IMAGE_SIZE) / 1e9,
+        "val_acc": val_acc,
+        "latency_ms": {name: stats["mean_ms"] for name, stats in cpu_latency(model).items()},
+        **extra,
+    }
+
+
+def print_pruning_table(rows: Dict[str, Dict]) -> None:
+    print("=" * 78)
+    print("PRUNING: LATENCY VS ACCURACY (CPU)")
+    print("=" * 78)
+    print(f"{'Variant':<14}{'params':>10}{'GMACs':>8}{'bs=1 ms':>10}{'bs=8 ms':>10}"
+          f"{'pruned acc':>12}{'val acc':>10}")
+    print("-" * 78)
+    for name, row in rows.items():
+        before = row.get("val_acc_before_finetune")
+        print(
+            f"{name:<14}{row['params'] / 1e6:>9.1f}M{row['gmacs']:>8.2f}"
+            f"{row['latency_ms']['bs=1']:>10.1f}{row['latency_ms']['bs=8']:>10.1f}"
+            f"{(f'{before:.2f}%' if before is not None else '-'):>12}{row['val_acc']:>9.2f}%"
+        )
+    print("=" * 78)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Structured channel pruning of the ResNet backbone: prune, fine-tune and save "
+                    "one smaller dense checkpoint per sparsity level, then report latency against accuracy."
+    )
+    parser.add_argument("checkpoint", nargs="?", type=Path, default=cfg.MODEL_SAVE_PATH,
+                        help="Trained model to prune (default: the configured model)")
+    parser.add_argument("--sparsity", type=float, nargs="+", default=cfg.PRUNE_SPARSITY_LEVELS,
+                        help="Fraction of each block's inner channels to remove, one model per level")
+    parser.add_argument("--epochs", type=int, default=cfg.PRUNE_FINETUNE_EPOCHS)
+    parser.add_argument("--lr", type=float, default=cfg.PRUNE_FINETUNE_LR)
+    parser.add_argument("--no-distill", dest="distill", action="store_false", default=cfg.PRUNE_DISTILL,
+                        help="Fine-tune on hard labels only instead of the unpruned model's soft targets")
+    parser.add_argument("--output-dir", type=Path, default=cfg.MODELS_DIR)
+    args = parser.parse_args()
+
+    cfg.validate_paths()
+
+    data_dirs = cfg.get_data_directories()
+    if not data_dirs:
+        raise FileNotFoundError(
+            "No data directories found. Ensure data/PlantVillage or data/NewPlantDiseases/train exists."
+        )
+
+    train_loader, val_loader, full_dataset = create_dataloaders(
+        data_directories=data_dirs,
+        batch_size=cfg.BATCH_SIZE,
+        train_split=cfg.TRAIN_SPLIT,
+        num_workers=cfg.NUM_WORKERS,
+        pin_memory=cfg.PIN_MEMORY,
+    )
+
+    device = torch.device(cfg.DEVICE)
+    criterion = nn.CrossEntropyLoss()
+
+    base = load_model(args.checkpoint, device=device.type, for_inference=True)
+    if base.num_classes != len(full_dataset.class_to_idx):
+        raise ValueError(
+            f"{args.checkpoint} predicts {base.num_classes} classes but the dataset has "
+            f"{len(full_dataset.class_to_idx)}."
+        )
+
+    _, base_acc = evaluate(base, val_loader, criterion, device)
+    rows = {"dense": describe(base, base_acc, args.checkpoint)}
+    base = base.to(device).eval()
+
+    for sparsity in sorted(args.sparsity):
+        print(f"\nPruning {sparsity:.0%} of the inner channels...")
+        # train() freezes its teacher, and the copy inherits that flag
+        pruned = prune_channels(base, sparsity).to(device).requires_grad_(True)
+        _, pruned_acc = evaluate(pruned, val_loader, criterion, device)
+        print(f"Before fine-tuning: {pruned_acc:.2f}% (dense {base_acc:.2f}%)")
+
+        save_path = args.output_dir / cfg.PRUNED_MODEL_PATTERN.format(level=round(sparsity * 100))
+        history = train(
+            pruned,
+            train_loader,
+            val_loader,
+            device=device,
+            epochs=args.epochs,
+            lr=args.lr,
+            weight_decay=cfg.WEIGHT_DECAY,
+            scheduler_type="cosine",
+            lr_min=cfg.LR_MIN,
+            use_amp=cfg.USE_MIXED_PRECISION,
+            log_interval=cfg.LOG_EVERY_N_BATCHES,
+            save_best=cfg.SAVE_BEST_MODEL,
+            checkpoint_path=str(save_path.with_suffix(".ckpt")),
+            teacher=base if args.distill else None,
+            distill_alpha=cfg.DISTILL_ALPHA,
+            distill_temperature=cfg.DISTILL_TEMPERATURE,
+        )
+
+        _, val_acc = evaluate(pruned, val_loader, criterion, device)
+        save_model(pruned, save_path, metrics={"val_acc": val_acc, "sparsity": sparsity}, record_latency=True)
+        rows[f"pruned {sparsity:.2f}"] = describe(
+            pruned, val_acc, save_path,
+            sparsity=sparsity,
+            val_acc_before_finetune=pruned_acc,
+            best_epoch_val_acc=max(history["val_acc"]) if history["val_acc"] else None,
+        )
+
+    print()
+    print_pruning_table(rows)
+    dense_ms = rows["dense"]["latency_ms"]["bs=1"]
+    for name, row in rows.items():
+        if name != "dense":
+            print(f"{name}: {dense_ms / row['latency_ms']['bs=1']:.2f}x faster at bs=1, "
+                  f"{row['val_acc'] - base_acc:+.2f} points accuracy")
+
+    with open(cfg.PRUNING_REPORT_PATH, "w") as f:
+        json.dump({"checkpoint": str(args.checkpoint), "finetune_epochs": args.epochs,
+                   "distill": args.distill, "models": rows}, f, indent=2)
+    print(f"Report saved to: {cfg.PRUNING_REPORT_PATH}")
+    print("Serve a pruned model by pointing MODEL_SAVE_PATH at it (or registering it as a candidate).")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+from pathlib import Path
+import json
+import sys
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import active_config as cfg
+from src.core.model import load_model
+from src.core.quantization import (
+    get_calibration_loaders,
+    quantize_model,
+    save_quantized_model,
+    load_quantized_model,
+    accuracy_delta_report,
+    print_report,
+)
+
+
+def main() -> None:
+    cfg.validate_paths()
+
+    data_dirs = cfg.get_data_directories()
+    if not data_dirs:
+        raise FileNotFoundError(
+            "No data directories found. Calibration needs the validation split of the training data."
+        )
+
+    calibration_loader, evaluation_loader, dataset = get_calibration_loaders(
+        data_directories=data_dirs,
+        calibration_images=cfg.QUANT_CALIBRATION_IMAGES,
+        batch_size=cfg.BATCH_SIZE,
+        train_split=cfg.TRAIN_SPLIT,
+        num_workers=cfg.NUM_WORKERS,
+    )
+
+    fp32_model = load_model(cfg.MODEL_SAVE_PATH, device="cpu", for_inference=True)
+
+    int8_model = quantize_model(fp32_model, calibration_loader)
+    save_quantized_model(int8_model, cfg.INT8_MODEL_PATH, source_checkpoint=cfg.MODEL_SAVE_PATH)
+
+    # Score the reloaded artifact so the report reflects exactly what is served.
+    served_model = load_quantized_model(cfg.INT8_MODEL_PATH, source_checkpoint=cfg.MODEL_SAVE_PATH)
+
+    report = accuracy_delta_report(
+        fp32_model,
+        served_model,
+        evaluation_loader,
+        dataset.idx_to_class,
+        fp32_path=cfg.MODEL_SAVE_PATH,
+        int8_path=cfg.INT8_MODEL_PATH,
+    )
+    print_report(report)
+
+    with open(cfg.INT8_REPORT_PATH, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report saved to: {cfg.INT8_REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+from pathlib import Path
+import argparse
+import sys
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import active_config as cfg
+from src.core.predictor import PlantDiseasePredictor
+from src.core.bulk_scoring import score_to_parquet
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Score a directory tree or a tar/zip archive of images into Parquet shards. "
+                    "Re-run the same command to resume after an interruption."
+    )
+    parser.add_argument("source", type=Path, help="Directory, .tar(.gz) or .zip of images")
+    parser.add_argument("output", type=Path, help="Output directory for part-NNNNN.parquet shards")
+    parser.add_argument("--model", type=Path, default=cfg.MODEL_SAVE_PATH,
+                        help="Checkpoint to score with (default: the configured model)")
+    parser.add_argument("--top-k", type=int, default=cfg.TOP_K_PREDICTIONS)
+    parser.add_argument("--batch-size", type=int, default=cfg.BULK_SCORING_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=cfg.BULK_SCORING_WORKERS,
+                        help="DataLoader processes decoding and preprocessing images")
+    parser.add_argument("--shard-size", type=int, default=cfg.BULK_SCORING_SHARD_SIZE,
+                        help="Images per output file (the unit of resumption)")
+    parser.add_argument("--row-group-size", type=int, default=cfg.BULK_SCORING_ROW_GROUP_SIZE)
+    parser.add_argument("--labeled", action="store_true",
+                        help="Source is a class-folder tree; record each folder as the image's label")
+    parser.add_argument("--probabilities", action="store_true",
+                        help="Also store the full class probability vector")
+    parser.add_argument("--device", default=None)
+    args = parser.parse_args()
+
+    predictor = PlantDiseasePredictor(
+        model_path=args.model,
+        class_mapping_path=cfg.CLASS_MAPPING_PATH,
+        device=args.device,
+        top_k=args.top_k,
+        backend=cfg.INFERENCE_BACKEND,
+        onnx_path=cfg.ONNX_MODEL_PATH,
+        precision=cfg.INFERENCE_PRECISION,
+        int8_path=cfg.INT8_MODEL_PATH,
+        frozen_graph=cfg.USE_FROZEN_GRAPH,
+        feature_gate=cfg.PLANT_GATE == "features",
+    )
+
+    stats = score_to_parquet(
+        predictor,
+        args.source,
+        args.output,
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        shard_size=args.shard_size,
+        row_group_size=args.row_group_size,
+        labeled=args.labeled,
+        return_probabilities=args.probabilities,
+    )
+
+    print("=" * 70)
+    print(f"Scored {stats['images']:,} images in {stats['seconds']:.1f}s "
+          f"({stats['images_per_sec']:.1f} img/s), {stats['shards_written']} shards written to {args.output}")
+    print("=" * 70)
+
+
+if __name__ == "__main__":
+    main()
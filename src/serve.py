@@ -0,0 +1,39 @@
+from pathlib import Path
+import argparse
+import os
+import sys
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from config import active_config as cfg
+from src.core.autotune import PROFILE_NAMES, load_perf_profile
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Start the API with the worker count from the autotuned performance profile."
+    )
+    parser.add_argument("--host", default=cfg.API_HOST)
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", cfg.API_PORT)))
+    parser.add_argument("--profile", choices=PROFILE_NAMES + ("none",), default=cfg.PERF_PROFILE)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Override the profile's worker count")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    settings = load_perf_profile(cfg.PERF_PROFILE_PATH, args.profile)
+    workers = args.workers or (settings["workers"] if settings else 1)
+
+    # Worker processes re-read the profile from config; make them use the same one.
+    os.environ["PERF_PROFILE"] = args.profile
+    os.chdir(ROOT)
+
+    print(f"Starting API with {workers} worker{'s' if workers != 1 else ''} ({args.profile} profile)")
+    uvicorn.run("src.fastapi_test:app", host=args.host, port=args.port, workers=workers)
+
+
+if __name__ == "__main__":
+    main()
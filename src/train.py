@@ -43,6 +43,7 @@ def main() -> None:
         hidden_units=cfg.HIDDEN_UNITS,
         dropout_rate=cfg.DROPOUT_RATE,
         device=device.type,
+        backbone=cfg.MODEL_NAME,
     )
 
     total_epochs = cfg.STAGE1_EPOCHS + cfg.STAGE2_EPOCHS if cfg.TWO_STAGE_TRAINING else cfg.NUM_EPOCHS
@@ -69,7 +70,7 @@ def main() -> None:
         stage1_epochs=cfg.STAGE1_EPOCHS,
     )
 
-    save_model(model, cfg.MODEL_SAVE_PATH)
+    save_model(model, cfg.MODEL_SAVE_PATH, record_latency=True)
     print(f"Training complete. Model saved to: {cfg.MODEL_SAVE_PATH}")
 
     if history["val_acc"]:
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import time
+from typing import Callable, Dict
+
+import numpy as np
+
+
+def measure_latency(
+    fn: Callable[[], object],
+    warmup: int = 3,
+    iterations: int = 20,
+    batch_size: int = 1,
+) -> Dict[str, float]:
+    """Time repeated calls of ``fn`` and summarise them in milliseconds."""
+    for _ in range(warmup):
+        fn()
+
+    timings = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000.0)
+
+    timings = np.asarray(timings)
+    mean_ms = float(timings.mean())
+    return {
+        "mean_ms": mean_ms,
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+        "images_per_sec": 1000.0 * batch_size / mean_ms if mean_ms > 0 else 0.0,
+    }
+
+
+def print_latency_table(results: Dict[str, Dict[str, float]], title: str = "LATENCY COMPARISON"):
+    print("=" * 70)
+    print(title)
+    print("=" * 70)
+    print(f"{'Variant':<24}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'img/s':>10}")
+    print("-" * 70)
+    for name, stats in results.items():
+        print(
+            f"{name:<24}{stats['mean_ms']:>9.2f}{stats['p50_ms']:>9.2f}"
+            f"{stats['p95_ms']:>9.2f}{stats['p99_ms']:>9.2f}{stats['images_per_sec']:>10.1f}"
+        )
+    print("=" * 70)
@@ -0,0 +1,41 @@
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Union
+
+
+@contextmanager
+def exclusive_lock(lock_path: Union[str, Path]) -> Iterator[None]:
+    """
+    Hold an exclusive lock on lock_path across processes on this host,
+    blocking until it is free: flock on POSIX, msvcrt.locking on Windows.
+    The lock file itself is left in place.
+    """
+    lock_path = Path(lock_path)
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "w") as lock_file:
+        if os.name == "nt":
+            import msvcrt
+
+            # LK_LOCK gives up after ten one-second retries; keep waiting
+            # like flock does, since the holder may be exporting a model
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)